@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 22:40
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: daemon.py
+# Tools: PyCharm
+
+"""
+---Long-running PM, every check on its own interval---
+
+Consoles, ssh transports and snmp sessions are built once and kept between ticks,
+a tick runs only the checks which are due, one pool job per device.
+"""
+import os
+import sys
+import time
+import functools
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_LOG_PATH = os.path.join(_ROOT_, 'log')
+os.mkdir(_LOG_PATH) if not os.path.exists(_LOG_PATH) else ''
+_LOG_FILE = os.path.join(_LOG_PATH, 'agent.log')
+
+sys.path.append(_ROOT_)
+from console import WorkerPool
+from agent.huaweistorage import HuaweiOceanStorConsole
+from agent.huaweistorage import UNKNOWN
+from agent.switch import SwitchSnmpConsole
+from agent.xiv import XivSnmpConsole
+
+# seconds between two runs of a check, checks not listed run every 'default_interval' of PmDaemon
+CHECK_INTERVALS = {'xiv_disk_status': 300,
+                   'xiv_machine_status': 300,
+                   'xiv_soft_utilization': 3600,
+                   'xiv_hard_utilization': 3600,
+                   'xiv_interface_status': 300,
+                   'firmware_version': 86400,
+                   'sys_stat': 300,
+                   'sensor_stat': 300,
+                   'fru_stat': 600,
+                   'cp_stat': 600,
+                   'port_stat_rw': 300,
+                   'snmp_event': 300,
+                   'alarm': 300,
+                   'system': 3600,
+                   'storage pool': 3600}
+
+xiv_checks = ('xiv_disk_status', 'xiv_machine_status', 'xiv_soft_utilization', 'xiv_hard_utilization',
+              'xiv_interface_status')
+switch_checks = ('firmware_version', 'sys_stat', 'sensor_stat', 'fru_stat', 'cp_stat', 'port_stat_rw')
+
+
+class Device(object):
+    def __init__(self, key, console, checks, prepare=None, metrics=None):
+        """
+        Args:
+            key: name of the device in report and log
+            console: kept for the life of the daemon
+            checks: {check name: function returning the printable state}
+            prepare: called once before the due checks of a tick
+            metrics: callable(check names) returning {metric name: number} read by those checks,
+                     'metrics' of the console by default
+        """
+        self.key = key
+        self.console = console
+        self.checks = checks
+        self.prepare = prepare
+        self.metrics = metrics if metrics is not None else lambda _names: dict(getattr(console, 'metrics', {}))
+        # {check name: monotonic time it is due}, every check is due at start
+        self.next_due = {_name: 0 for _name in checks}
+        # set by the tick starting a run, cleared when the thread of the run ends, even after a JobTimeout
+        self.running = False
+
+    def due(self, now):
+        return [_name for _name, _due in self.next_due.items() if _due <= now]
+
+    def run(self, names):
+        """
+        :return: [(check name, state)], a check failing does not stop the others
+        """
+        try:
+            if self.prepare is not None:
+                self.prepare()
+            _states = []
+            for _name in names:
+                try:
+                    _states.append((_name, self.checks[_name]()))
+                except Exception as _e:
+                    self.console.colorlog(f'check [{_name}] failed: {type(_e).__name__} {_e}', 'error')
+                    _states.append((_name, f'{UNKNOWN} ({type(_e).__name__})'))
+            return _states
+        finally:
+            self.running = False
+
+
+def xiv_devices(xiv_list):
+    _devices = []
+    for _xiv in xiv_list:
+        try:
+            _ip, _desc = _xiv
+        except (KeyError, ValueError):
+            continue
+        _consl = XivSnmpConsole(_ip, desc=_desc)
+
+        def _prepare(_consl=_consl):
+            # scalars are read again by the first due check
+            _consl.prefetched = {}
+            _consl.scalars = None
+
+        _devices.append(Device(_ip, _consl, {_name: getattr(_consl, _name) for _name in xiv_checks}, _prepare,
+                               _consl.pm_metrics))
+    return _devices
+
+
+def switch_devices(switch_list):
+    _devices = []
+    for switch_cfg in switch_list:
+        try:
+            _ipaddr, _user, _pass, _ssh_port, _snmp_args_list, _desc = switch_cfg
+        except ValueError:
+            continue
+        for _snmp_args in _snmp_args_list:
+            _vf_id = _snmp_args.split('VF:')[-1].split()[0] if 'VF:' in _snmp_args else None
+            _consl = SwitchSnmpConsole(_ipaddr, _snmp_args, vf_id=_vf_id, display=False, desc=_desc)
+
+            def _prepare(_consl=_consl):
+                _consl.prefetched = {}
+                _consl.error_msg = []
+                _consl.metrics = {}
+
+            _devices.append(Device(f'{_ipaddr} {_consl.vf_id}', _consl,
+                                   {_name: getattr(_consl, _name) for _name in switch_checks}, _prepare))
+    return _devices
+
+
+def hw_storage_devices(huawei_storages):
+    _devices = []
+    for _str_info in huawei_storages:
+        try:
+            _host, _user, _pass, _snmp_args, _desc = _str_info
+        except ValueError:
+            continue
+        _consl = HuaweiOceanStorConsole(host=_host, username=_user, password=_pass,
+                                        desc=_desc, snmp_args=_snmp_args, display=False)
+        # named as the states of 'pm_records', module keys & 'snmp_event'
+        _checks = {}
+        if _pass is not None and not _consl.obs:
+            _checks.update({_module_key: functools.partial(_consl.check_module, _module_key)
+                            for _module_key in _consl.pm_modules})
+        if _snmp_args is not None:
+            _checks['snmp_event'] = _consl.fetch_snmp_event
+
+        def _prepare(_consl=_consl, _ssh=bool(_pass is not None and not _consl.obs)):
+            _consl.alarm_lines = ''
+            _consl.snmp_consl.prefetched = {}
+            _consl.snmp_consl.events_line = ''
+            # login again only if the pooled transport died since the last tick
+            _transport = _consl.get_transport()
+            if _ssh and (_transport is None or not _transport.is_active()):
+                _consl.close()
+                _consl.connect_storage()
+
+        _devices.append(Device(_host, _consl, _checks, _prepare, _consl.pm_metrics))
+    return _devices
+
+
+class PmDaemon(object):
+    def __init__(self, devices, intervals=None, default_interval=300, workers=32, deadline=300, max_sleep=60,
+                 store=None, snapshot=None):
+        """
+        Args:
+            devices: [Device] of all vendors
+            intervals: {check name: seconds}, CHECK_INTERVALS by default
+            deadline: seconds the due checks of one device may take
+            max_sleep: longest wait between two ticks
+            store: console.ResultStore, states of every tick are written to it in one batch
+            snapshot: console.Snapshot, only checks whose state changed since their last run are printed
+        """
+        self.devices = devices
+        self.intervals = intervals if intervals is not None else CHECK_INTERVALS
+        self.default_interval = default_interval
+        self.pool = WorkerPool(workers=workers, deadline=deadline, logfile=_LOG_FILE)
+        self.max_sleep = max_sleep
+        self.store = store
+        self.snapshot = snapshot
+
+    def tick(self):
+        """
+        run the checks which are due, print one line per check
+        :return: number of checks run
+        """
+        _now = time.monotonic()
+        _due = [(_device, _device.due(_now)) for _device in self.devices]
+        _due = [(_device, _names) for _device, _names in _due if _names]
+        # a run given up by its deadline may still work on the shared console, its checks stay due
+        for _device, _names in _due:
+            if _device.running:
+                _device.console.colorlog(f'[{_device.key}] previous run not ended, {len(_names)} checks skipped',
+                                         'warn')
+        _due = [(_device, _names) for _device, _names in _due if not _device.running]
+        for _device, _names in _due:
+            _device.running = True
+            # scheduled from the start, a slow or failed check does not run again before its interval
+            _device.next_due.update({_name: _now + self.intervals.get(_name, self.default_interval)
+                                     for _name in _names})
+
+        _results = self.pool.run([(_device.key, _device.run, (_names,)) for _device, _names in _due])
+
+        _stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        for (_device, _names), (_states, _error) in zip(_due, _results):
+            if _error is not None:
+                _states = [(_name, f'{UNKNOWN} ({type(_error).__name__})') for _name in _names]
+            _printed = _states
+            if self.snapshot is not None:
+                # detail lines of a tick cover only its due checks, their digest is left alone
+                _changed = self.snapshot.changed(_device.key, dict(_states), details=None)
+                _printed = [(_name, _state) for _name, _state in _states if _name in _changed]
+            for _name, _state in _printed:
+                print(f'{_stamp} {_device.key:<24s} {_name:<24s} {_state}', flush=True)
+            if self.store is not None:
+                _metrics = _device.metrics(_names) if _error is None else {}
+                self.store.add_records(_device.key, dict(_states), _metrics)
+        self.store.commit() if self.store is not None else ''
+        self.snapshot.save() if self.snapshot is not None and _due else ''
+        return sum(len(_names) for _device, _names in _due)
+
+    def sleep_time(self):
+        # checks of a device still running are overdue, they are retried once its run ended
+        _next = min([_due for _device in self.devices if not _device.running
+                     for _due in _device.next_due.values()], default=None)
+        if _next is None:
+            return self.max_sleep
+        return min(max(_next - time.monotonic(), 0), self.max_sleep)
+
+    def close(self):
+        for _device in self.devices:
+            if isinstance(_device.console, HuaweiOceanStorConsole):
+                _device.console.close()
+        self.store.close() if self.store is not None else ''
+
+    def serve_forever(self):
+        try:
+            while True:
+                self.tick()
+                time.sleep(self.sleep_time())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
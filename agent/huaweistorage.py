@@ -16,7 +16,6 @@
 """
 import os
 import sys
-import threading
 import platform
 
 _HOME_ = os.path.abspath(os.path.dirname(__file__))
@@ -28,6 +27,9 @@ sys.path.append(_ROOT_)
 
 from console.sshconsole import SshConsole
 from console.snmpconsole import SnmpConsole
+from console.snmppoller import SnmpPoller
+from console.workerpool import WorkerPool
+from console.workerpool import print_progress
 
 if platform.system().lower() == 'linux':
     PASSED = '\033[0;37mPassed\033[0m'
@@ -54,6 +56,11 @@ class HwSnmpConsole(SnmpConsole):
 
         SnmpConsole.__init__(self, self.agent, self.args, display=display, logfile=_LOG_FILE_)
 
+    def snmp_plan(self):
+        return [self.plan_walk(self.event_oid, bulk=False),
+                self.plan_walk(self.event_date_oid),
+                self.plan_walk(self.event_oid)]
+
     def snmpwalk_event(self):
         _events = self.snmpwalk(self.event_oid)
         _e_date = [_line[4] for _line in self.snmpwalk_format(self.event_date_oid)]
@@ -99,7 +106,22 @@ class HwSnmpConsole(SnmpConsole):
 
 
 class HuaweiOceanStorConsole(SshConsole):
-    def __init__(self, host, username, password, display=True, timeout=10, desc=None, snmp_args=None, obs=False):
+    # commands of 'collect_info_all', executed concurrently on one login
+    show_commands = ('show alarm', 'show bbu general', 'show bbu life', 'show controller general',
+                     'show disk general', 'show disk_domain general', 'show enclosure', 'show expansion_module',
+                     'show fan', 'show host general', 'show interface_module', 'show power_supply',
+                     'show system general', 'show storage_pool general', 'show port fibre_module')
+    # module keys checked by 'pm', in order of the report
+    pm_modules = ('bbu', 'disks', 'disk_domain', 'enclosure', 'fan', 'interface', 'ps', 'storage pool', 'fc',
+                  'alarm', 'system', 'controller')
+    # module key of sys_info checked by 'pm': show method refreshing it
+    module_shows = {'bbu': 'show_bbu', 'disks': 'show_disks', 'disk_domain': 'show_disk_domain',
+                    'enclosure': 'show_enclosure', 'fan': 'show_fan', 'interface': 'show_if', 'ps': 'show_ps',
+                    'storage pool': 'show_storage_pool', 'fc': 'show_fc_port', 'alarm': 'show_alarm',
+                    'system': 'show_system', 'controller': 'show_controller'}
+
+    def __init__(self, host, username, password, display=True, timeout=10, desc=None, snmp_args=None, obs=False,
+                 max_parallel=4):
         self.host = host
         self.username = username
         self.password = password
@@ -107,6 +129,7 @@ class HuaweiOceanStorConsole(SshConsole):
         self.display = display
         self.desc = desc if desc is not None else 'Undefined'
         self.obs = obs
+        self.max_parallel = max_parallel
 
         self.snmp_consl = HwSnmpConsole(self.host, snmp_args, display=self.display)
         self.snmp_event = None
@@ -114,6 +137,10 @@ class HuaweiOceanStorConsole(SshConsole):
         self.alarm_lines = ''
 
         self.sys_info = {}
+        # {module key: state} of the last 'pm' or 'check_module'
+        self.module_states = {}
+        # {command: output list} fetched by 'run_many', used by the show methods
+        self.cli_outputs = {}
         SshConsole.__init__(self, self.host, display=self.display, logfile=_LOG_FILE_)
 
     def connect_storage(self):
@@ -176,16 +203,21 @@ class HuaweiOceanStorConsole(SshConsole):
                         continue
         return output_dict
 
+    def _show(self, command):
+        if command in self.cli_outputs:
+            return self.cli_outputs[command]
+        return self.getoutput(command)
+
     def show_alarm(self):
-        _alarm = self.getoutput('show alarm')
+        _alarm = self._show('show alarm')
         return self.format_hw_cli_output(_alarm, 'Sequence')
 
     def show_bbu(self):
-        _bbu_info = self.getoutput('show bbu general')
+        _bbu_info = self._show('show bbu general')
         return self.format_hw_cli_output(_bbu_info, 'ID')
 
     def show_bbu_life(self):
-        _bbu_life = self.getoutput('show bbu life')
+        _bbu_life = self._show('show bbu life')
         return self.format_hw_cli_output(_bbu_life, 'ID')
 
     def show_controller(self):
@@ -194,7 +226,7 @@ class HuaweiOceanStorConsole(SshConsole):
                  'Voltage(V)', 'Software Version', 'PCB Version', 'SES Version', 'BMC Version',
                  'Logic Version', 'BIOS Version', 'All Temperatures(Celsius)']
 
-        _ctrl_info_list = self.getoutput('show controller general')
+        _ctrl_info_list = self._show('show controller general')
         ctrl_info_dict = {_key: [] for _key in _keys}
         # ctrl_info_dict = {_key: '' for _key in _keys}
         for _line in _ctrl_info_list:
@@ -212,35 +244,35 @@ class HuaweiOceanStorConsole(SshConsole):
         return {'controller': ctrl_info_dict}
 
     def show_disks(self):
-        _disk_info = self.getoutput('show disk general')
+        _disk_info = self._show('show disk general')
         return self.format_hw_cli_output(_disk_info, 'ID')
 
     def show_disk_domain(self):
-        _disk_domain_info = self.getoutput('show disk_domain general')
+        _disk_domain_info = self._show('show disk_domain general')
         return self.format_hw_cli_output(_disk_domain_info, 'ID')
 
     def show_enclosure(self):
-        _enclosure_info = self.getoutput('show enclosure')
+        _enclosure_info = self._show('show enclosure')
         return self.format_hw_cli_output(_enclosure_info, 'ID')
 
     def show_exp_module(self):
-        _exp_info = self.getoutput('show expansion_module')
+        _exp_info = self._show('show expansion_module')
         return self.format_hw_cli_output(_exp_info, 'ID')
 
     def show_fan(self):
-        _fan_info = self.getoutput('show fan')
+        _fan_info = self._show('show fan')
         return self.format_hw_cli_output(_fan_info, 'ID')
 
     def show_host(self):
-        _host_info = self.getoutput('show host general')
+        _host_info = self._show('show host general')
         return self.format_hw_cli_output(_host_info, 'ID')
 
     def show_if(self):
-        _if_info = self.getoutput('show interface_module')
+        _if_info = self._show('show interface_module')
         return self.format_hw_cli_output(_if_info, 'ID')
 
     def show_ps(self):
-        _ps_info = self.getoutput('show power_supply')
+        _ps_info = self._show('show power_supply')
         return self.format_hw_cli_output(_ps_info, 'ID')
 
     def show_system(self):
@@ -250,7 +282,7 @@ class HuaweiOceanStorConsole(SshConsole):
                 'Time', 'Patch Version']
         # keys = ['System Name', 'Health Status', 'Running Status', 'Total Capacity', 'SN', 'Product Model']
         sys_info_dict = {_key: '' for _key in keys}
-        _sys_info_list = self.getoutput('show system general')
+        _sys_info_list = self._show('show system general')
         for _line in _sys_info_list:
             try:
                 _key, _value = _line.split(':')
@@ -265,11 +297,11 @@ class HuaweiOceanStorConsole(SshConsole):
         return {'system': sys_info_dict}
 
     def show_storage_pool(self):
-        _storage_pool_cap = self.getoutput('show storage_pool general')
+        _storage_pool_cap = self._show('show storage_pool general')
         return self.format_hw_cli_output(_storage_pool_cap, 'ID')
 
     def show_fc_port(self):
-        _fc_info = self.getoutput('show port fibre_module')
+        _fc_info = self._show('show port fibre_module')
         return self.format_hw_cli_output(_fc_info, 'PortID')
 
     def fetch_capacity(self):
@@ -318,6 +350,7 @@ class HuaweiOceanStorConsole(SshConsole):
         if self.obs:
             return self.sys_info
 
+        self.cli_outputs = self.run_many(self.show_commands, max_parallel=self.max_parallel)
         self.sys_info.update({'alarm': self.show_alarm()})
         self.sys_info.update({'bbu': self.show_bbu()})
         self.sys_info.update({'bbu_life': self.show_bbu_life()})
@@ -333,6 +366,7 @@ class HuaweiOceanStorConsole(SshConsole):
         self.sys_info.update({'system': self.show_system()})
         self.sys_info.update({'storage pool': self.show_storage_pool()})
         self.sys_info.update({'fc': self.show_fc_port()})
+        self.cli_outputs = {}
 
         return self.sys_info
 
@@ -340,51 +374,110 @@ class HuaweiOceanStorConsole(SshConsole):
         self.snmp_event = self.snmp_consl.snmpwalk_event()
         return self.snmp_event
 
-    def pm(self):
-        def _check_status_from_sys_info(_module_key):
-            _hel_key = 'Health Status'
-            _hel_stat = ['Normal', ['Normal', 'Normal']]
-            _run_key = 'Running Status'
-            _run_stat = ['Running', 'Online', 'Link Up', 'Normal', ['Online', 'Online']]
+    def pm_unfinished(self, error):
+        """
+        report of a storage whose collection failed or ran out of time
+        """
+        print('\n', '=' * 80, sep='')
+        print('-' * 32, f'{self.host:^16s}', '-' * 32, sep='')
+        prompt = 'Storage Description'
+        print(f'{prompt:<30s}{self.desc:.>50s}')
+        prompt = f'Collecting ({type(error).__name__})'
+        print(f'{prompt:<30s}{UNKNOWN:.>{NO_COLOR}s}')
 
-            try:
-                _module_info = self.sys_info[_module_key]
-
-                # todo delete or keep, it's a question.
-                if not _module_info and _module_key != 'alarm':
-                    return UNKNOWN
-
-                for _m in _module_info:
-                    if _module_key == 'alarm':
-                        _alarm_dict = [self.sys_info['alarm'][_l] for _l in self.sys_info['alarm']]
-                        for _alarm in _alarm_dict:
-                            self.alarm_lines += '{:<79s}|\n'.format(
-                                '|' + _alarm['Occurred On'] + ' ' + _alarm['Name'])
-                        if _module_info:
-                            return FAILED
-                        else:
-                            return PASSED
-
-                    _hel_value = _module_info[_m][_hel_key]
-                    if _module_key == 'host':  # host only has key 'Health Status'
-                        # once health status not equal to _heal_stat, return False.
-                        if _hel_value not in _hel_stat:
-                            _alarm_string = f'{_module_key} {_m} [{_hel_key} {_hel_value}]'
-                            self.alarm_lines += '{:<79s}|\n'.format('|' + _alarm_string)
-                            return FAILED
-
-                    _run_value = _module_info[_m][_run_key]
-                    if _hel_value not in _hel_stat or _run_value not in _run_stat:
-                        _alarm_string = f'{_module_key} {_m} [{_hel_key} {_hel_value}] [{_run_key} {_run_value}]'
+    def module_status(self, module_key):
+        """
+        PASSED or FAILED of one module in sys_info, lines of failed parts are added to alarm_lines
+        """
+        _hel_key = 'Health Status'
+        _hel_stat = ['Normal', ['Normal', 'Normal']]
+        _run_key = 'Running Status'
+        _run_stat = ['Running', 'Online', 'Link Up', 'Normal', ['Online', 'Online']]
+
+        try:
+            _module_info = self.sys_info[module_key]
+
+            # todo delete or keep, it's a question.
+            if not _module_info and module_key != 'alarm':
+                return UNKNOWN
+
+            for _m in _module_info:
+                if module_key == 'alarm':
+                    _alarm_dict = [self.sys_info['alarm'][_l] for _l in self.sys_info['alarm']]
+                    for _alarm in _alarm_dict:
+                        self.alarm_lines += '{:<79s}|\n'.format(
+                            '|' + _alarm['Occurred On'] + ' ' + _alarm['Name'])
+                    if _module_info:
+                        return FAILED
+                    else:
+                        return PASSED
+
+                _hel_value = _module_info[_m][_hel_key]
+                if module_key == 'host':  # host only has key 'Health Status'
+                    # once health status not equal to _heal_stat, return False.
+                    if _hel_value not in _hel_stat:
+                        _alarm_string = f'{module_key} {_m} [{_hel_key} {_hel_value}]'
                         self.alarm_lines += '{:<79s}|\n'.format('|' + _alarm_string)
                         return FAILED
-                return PASSED
-            except KeyError:
-                return FAILED
 
+                _run_value = _module_info[_m][_run_key]
+                if _hel_value not in _hel_stat or _run_value not in _run_stat:
+                    _alarm_string = f'{module_key} {_m} [{_hel_key} {_hel_value}] [{_run_key} {_run_value}]'
+                    self.alarm_lines += '{:<79s}|\n'.format('|' + _alarm_string)
+                    return FAILED
+            return PASSED
+        except KeyError:
+            return FAILED
+
+    def check_module(self, module_key):
+        """
+        refresh one module of sys_info with its show command, return its status
+        """
+        self.sys_info[module_key] = getattr(self, self.module_shows[module_key])()
+        self.module_states[module_key] = self.module_status(module_key)
+        return self.module_states[module_key]
+
+    def evaluate_modules(self):
+        """
+        module states of pm() without printing, lines of failed parts collected in alarm_lines
+        """
+        self.alarm_lines = ''
+        self.module_states = {_key: self.module_status(_key) for _key in self.pm_modules}
+        return self.module_states
+
+    def pm_records(self):
+        """
+        states shown by pm() & metrics of capacity and controllers, for the result store
+        """
+        if self.sys_info and not self.module_states:
+            self.evaluate_modules()
+        _states = dict(self.module_states, snmp_event=self.snmp_event)
+        return _states, self.pm_metrics()
+
+    def pm_metrics(self, modules=None):
+        """
+        capacity of storage pools & temperature of controllers in sys_info, of the modules among 'modules' if given
+        """
+        _metrics = {}
+        if self.sys_info and (modules is None or 'storage pool' in modules):
+            _metrics['capacity total_tib'], _metrics['capacity free_tib'] = self.fetch_capacity()
+        if modules is None or 'controller' in modules:
+            _controller = self.sys_info.get('controller', {}).get('controller', {})
+            for _name, _temp in zip(_controller.get('Controller', []), _controller.get('Temperature(Celsius)', [])):
+                _metrics[f'controller {_name} temperature'] = _temp
+        return _metrics
+
+    def pm_details(self):
+        """
+        alarm & event lines printed by pm(), compared with the previous run by the snapshot
+        """
+        return self.alarm_lines.splitlines() + self.snmp_consl.events_line.splitlines()
+
+    def pm(self):
         def _print_module_status(_module_key):
             _prompt = f'Checking Stat of {_module_key}'
-            print(f'{_prompt:<30s}{_check_status_from_sys_info(_module_key):.>{NO_COLOR}s}')
+            self.module_states[_module_key] = self.module_status(_module_key)
+            print(f'{_prompt:<30s}{self.module_states[_module_key]:.>{NO_COLOR}s}')
 
         def _print_events():
             if len(self.alarm_lines.strip().strip('\n')) != 0:
@@ -429,10 +522,7 @@ class HuaweiOceanStorConsole(SshConsole):
         print(f'{prompt:<30s}{bbu_life:.>50s}')
 
         # Check module status which has key 'Health Status' & 'Running Status'
-        _module_keys = ['bbu', 'disks', 'disk_domain', 'enclosure', 'fan',
-                        'interface', 'ps', 'storage pool', 'fc', 'alarm',
-                        'system', 'controller']
-        for _key in _module_keys:
+        for _key in self.pm_modules:
             _print_module_status(_key)
 
         # if len(self.alarm_lines.strip().strip('\n')) != 0:
@@ -448,57 +538,72 @@ class HuaweiOceanStorConsole(SshConsole):
         _print_snmp_events()
 
 
-def pm_all_hw_storage(huawei_storages, display=False, multi_thread=False):
-    if multi_thread:
-        _object_list = []
-        _snmp_obj_list = []
-
-        def _pm_all_target(_host, _username, _password, _snmp_args, _desc):
-            hw_consl = HuaweiOceanStorConsole(host=_host,
-                                              username=_username,
-                                              password=_password,
-                                              desc=_desc,
-                                              display=display,
-                                              snmp_args=_snmp_args)
-            if _password is not None:
-                hw_consl.connect_storage()
-                hw_consl.collect_info_all()
-
-            if _snmp_args is not None:
-                hw_consl.fetch_snmp_event()
-
-            _object_list.append(hw_consl)
-
-            # if _snmp_args:
-            #     hw_snmp_consl = HwSnmpConsole(_host, ','.join(_snmp_args), display=display)
-            #     _snmp_obj_list.append(hw_snmp_consl)
-
-        threads = [threading.Thread(target=_pm_all_target, args=_str) for _str in huawei_storages]
-        [t.start() for t in threads]
-        [t.join() for t in threads]
-
-        # [_hw_snmp_consl.pm() for _hw_snmp_consl in _snmp_obj_list]
-        [_hw_consl.pm() for _hw_consl in _object_list]
-
-    else:
-        for _str_info in huawei_storages:
-            try:
-                _host, _user, _pass, _snmp_args, _desc = _str_info
-
-                hw_console = HuaweiOceanStorConsole(host=_host, username=_user, password=_pass,
-                                                    desc=_desc, snmp_args=_snmp_args, display=display)
-
-                if _pass is not None:
-                    hw_console.connect_storage()
-                    hw_console.collect_info_all()
-
-                if _snmp_args is not None:
-                    hw_console.fetch_snmp_event()
-
-                hw_console.pm()
-
-            except ValueError:
-                pass
+def plan_hw_storage(huawei_storages, display=False, store=None, snapshot=None):
+    """
+    storages split into collection and rendering, run by pm_all_hw_storage or with other vendors by one scheduler,
+    states & metrics of rendered storages are added to store (console.ResultStore),
+    with snapshot (console.Snapshot) only checks changed since the previous run are rendered
+    :return: (snmp consoles to poll, [(key, function, args)] jobs, render(results of jobs))
+    """
+    hw_consoles = []
+    for _str_info in huawei_storages:
+        try:
+            _host, _user, _pass, _snmp_args, _desc = _str_info
+        except ValueError:
+            continue
+        hw_console = HuaweiOceanStorConsole(host=_host, username=_user, password=_pass,
+                                            desc=_desc, snmp_args=_snmp_args, display=display)
+        hw_consoles.append((hw_console, _pass, _snmp_args))
+
+    def _pm_all_target(_hw_consl, _password, _snmp_args):
+        if _password is not None:
+            _hw_consl.connect_storage()
+            _hw_consl.collect_info_all()
+
+        if _snmp_args is not None:
+            _hw_consl.fetch_snmp_event()
+
+    def _render(_results):
+        # reports in configured order once all storages are collected
+        for (_hw_consl, _pass, _snmp_args), (_value, _error) in zip(hw_consoles, _results):
+            if _error is not None:
+                _hw_consl.pm_unfinished(_error)
+                continue
+            if snapshot is not None:
+                _states, _metrics = _hw_consl.pm_records()
+                snapshot.render(_hw_consl.host, _states, _hw_consl.pm_details())
+            else:
+                _hw_consl.pm()
+                _states, _metrics = _hw_consl.pm_records()
+            store.add_records(_hw_consl.host, _states, _metrics) if store else ''
+
+    _snmp_consoles = [_hw_consl.snmp_consl for _hw_consl, _pass, _snmp_args in hw_consoles if _snmp_args is not None]
+    _jobs = [(_args[0].host, _pm_all_target, _args) for _args in hw_consoles]
+    return _snmp_consoles, _jobs, _render
+
+
+def pm_all_hw_storage(huawei_storages, display=False, multi_thread=True, max_in_flight=64,
+                      workers=8, deadline=600, progress=True, store=None, snapshot=None):
+    """
+    Args:
+        multi_thread: False collects storages one after another
+        workers: storages collected at once, each holds one ssh login
+        deadline: seconds one storage may take, its report shows the time out afterwards
+        progress: print a line to stderr as every storage finishes
+        store: console.ResultStore, states & metrics of the run are written to it in one batch
+        snapshot: console.Snapshot, only checks changed since the previous run are printed
+    """
+    _snmp_consoles, _jobs, _render = plan_hw_storage(huawei_storages, display=display, store=store,
+                                                     snapshot=snapshot)
+
+    # events of all storages are polled at once before the slow ssh part
+    SnmpPoller(max_in_flight=max_in_flight, logfile=_LOG_FILE_).poll(_snmp_consoles)
+
+    _pool = WorkerPool(workers=workers if multi_thread else 1, deadline=deadline,
+                       progress=print_progress if progress else None, logfile=_LOG_FILE_)
+    _render(_pool.run(_jobs))
+    store.commit() if store else ''
+    snapshot.save() if snapshot else ''
 
 
 if __name__ == '__main__':
@@ -18,7 +18,6 @@ import os
 import sys
 import math
 import subprocess
-import threading
 import platform
 
 _HOME_ = os.path.abspath(os.path.dirname(__file__))
@@ -44,8 +43,12 @@ TX_HIGH = 790
 sys.path.insert(0, _ROOT_)
 
 from console import SnmpConsole
+from console import SnmpPoller
 from console import SshConsole
+from console import ShellSession
 from console import SwitchLogDecoder
+from console import WorkerPool
+from console.workerpool import print_progress
 
 if platform.system().lower() == 'linux':
     PASSED = '\033[0;37mPassed\033[0m'
@@ -90,6 +93,13 @@ class SwitchSshConsole(SshConsole):
         self.error_msg = []
 
         self.fir_ver_val = self.sys_stat_val = self.sensor_stat_val = self.sfp_stat_val = None
+        # {VF id: (system state, port & sfp state)} of every VF context collected by 'fetch_pm_values'
+        self.vf_stat_vals = {}
+        # {metric name: number} read by the checks, for the result store
+        self.metrics = {}
+
+        # interactive shell keeping the VF context, opened by 'setcontext'
+        self.shell = None
 
         SshConsole.__init__(self, self.manage_ipaddr, logfile=self.logfile, display=display)
 
@@ -122,16 +132,48 @@ class SwitchSshConsole(SshConsole):
         return False
 
     def conn_default_vf(self):
-        return self.ssh_connect(hostname=self.manage_ipaddr, username=self.username, password=self.password)
+        return self.ssh_connect(hostname=self.manage_ipaddr, port=self.port,
+                                username=self.username, password=self.password)
+
+    def open_shell(self):
+        if self.shell is None or not self.shell.is_open:
+            self.shell = ShellSession(self, user=self.username)
+            self.shell.open()
+        return self.shell.is_open
+
+    def close(self):
+        if self.shell is not None:
+            self.shell.close()
+            self.shell = None
+        SshConsole.close(self)
+
+    def getoutput(self, command, timeout=None) -> list:
+        """
+        commands go to the shell once it is opened, so they run in the VF context set there
+        """
+        if self.shell is not None and self.shell.is_open:
+            return self.shell.run(command, timeout=timeout)
+        return SshConsole.getoutput(self, command, timeout=timeout)
+
+    def iter_output(self, command, timeout=None):
+        if self.shell is not None and self.shell.is_open:
+            return self.shell.iter_run(command, timeout=timeout)
+        return SshConsole.iter_output(self, command, timeout=timeout)
+
+    def run_batch(self, commands, timeout=None) -> list:
+        if self.shell is not None and self.shell.is_open:
+            return self.shell.run_batch(commands, timeout=timeout)
+        return SshConsole.run_batch(self, commands, timeout=timeout)
 
     def get_fid(self):
         return self.getoutput('switchshow | grep "LS Attributes"')
 
     def show_basic_cfg_and_sensors(self, log=False, vf_id=None):
         data = []
-        for _command in ['fanshow', 'psshow', 'slotshow', 'tempshow', 'sensorshow',
-                         'ipaddrshow', 'firmwareshow', 'fabricshow', 'memshow', 'hashow']:
-            _output = self.getoutput(_command)
+        _commands = ['fanshow', 'psshow', 'slotshow', 'tempshow', 'sensorshow',
+                     'ipaddrshow', 'firmwareshow', 'fabricshow', 'memshow', 'hashow']
+        # all commands in one exec session, split back by exit code sentinels
+        for _command, (_return, _output) in zip(_commands, self.run_batch(_commands)):
 
             if self.virtual_fabric:
                 _prompt = f'SWITCH:{self.vf_id}:{self.username}> {_command}'
@@ -182,18 +224,25 @@ class SwitchSshConsole(SshConsole):
         return _fids
 
     def setcontext(self, vf_id):
-        vf_id = vf_id.strip('FID')
-        _output = self.getoutput(f'setcontext {vf_id}')
         """
-        command 'setcontext' can not be executed via remote non-tty terminal
+        command 'setcontext' can not be executed via remote non-tty terminal,
+        it is typed into the shell session and the context is read from the prompt afterwards.
         """
+        vf_id = vf_id.strip('FID')
+        if not self.open_shell():
+            return False
+
+        _output = self.shell.run(f'setcontext {vf_id}')
 
         _context_error = 'FID not associated with a switch.'
         _context_not_exist = 'lscfg_util: requires VF to be enabled.'
+        if _output:
+            self.colorlog(f'setcontext {vf_id}: {" ".join(_output)}', 'warn')
 
-        if vf_id == '0' or not _output:
+        if self.shell.context == f'FID{vf_id}':
+            self.virtual_fabric = True
             return True
-        return False
+        return vf_id == '0' and self.shell.context is None
 
     def list_port_indexes(self):
         _output = self.getoutput('switchshow')
@@ -209,13 +258,14 @@ class SwitchSshConsole(SshConsole):
 
             if _index.isnumeric():
                 self.colorlog('switchshow port index line detected', 'debug')
-                self.colorlog(f'line: [{_line}]', 'debug')
+                self.colorlog('line: [%s]', 'debug', _line)
                 port_indexes.append(_index)
         return port_indexes
 
-    def show_vf_port_detail(self):
-        _output = self.getoutput('sfpshow -all')
-        self.decoder.sfpshow_all_decode(_output, self.vf_id)
+    def show_vf_port_detail(self, vf_id=None):
+        vf_id = self.vf_id if vf_id is None else vf_id
+        # several MB on directors, decoded while it is transferred
+        self.decoder.sfpshow_all_decode(self.iter_output('sfpshow -all'), vf_id)
 
         # for _port_index in self.list_port_indexes():
         #     _command = f'portshow -i {_port_index}'
@@ -223,8 +273,23 @@ class SwitchSshConsole(SshConsole):
         #     self.decoder.portshow_decode(_output, self.vf_id)
         # switchstatusshow
 
-        _output = self.getoutput('switchshow')
-        self.decoder.switchshow_decode(_output, self.vf_id)
+        self.decoder.switchshow_decode(self.iter_output('switchshow'), vf_id)
+
+    def show_all_vf_port_detail(self):
+        """
+        port details of every VF context of the chassis over the one login
+        :return: VF contexts collected
+        """
+        _collected = []
+        for _fid in self.getcontext():
+            # a switch without VF answers 'lscfg --show' with an error message
+            if not _fid.isnumeric():
+                continue
+            _fid = f'FID{_fid}'
+            if self.setcontext(_fid):
+                self.show_vf_port_detail(_fid)
+                _collected.append(_fid)
+        return _collected
 
     def show_vf_cfg_detail(self):
         _output = []
@@ -245,8 +310,7 @@ class SwitchSshConsole(SshConsole):
 
         for _fid in _fids:
             self.setcontext(vf_id=_fid) if _fid is not None else ''
-            # _data.append(self.show_vf_detail())
-            _data.extend(self.show_vf_detail())
+            _data.extend(self.show_vf_cfg_detail())
 
         self.write_datafile(_data)
 
@@ -257,9 +321,10 @@ class SwitchSshConsole(SshConsole):
             _ver = UNKNOWN
         return _ver
 
-    def sys_stat(self):
+    def sys_stat(self, vf_id=None):
+        vf_id = self.vf_id if vf_id is None else vf_id
         try:
-            _stat = self.switch_detail[self.vf_id]['switch']['switchState']
+            _stat = self.switch_detail[vf_id]['switch']['switchState']
 
             if _stat == 'Online':
                 return PASSED
@@ -291,9 +356,12 @@ class SwitchSshConsole(SshConsole):
 
         return PASSED
 
-    def port_sfp_stat(self):
+    def port_sfp_stat(self, vf_id=None):
+        vf_id = self.vf_id if vf_id is None else vf_id
+        # ports of other VF contexts are named with their VF id
+        _prefix = '' if vf_id == self.vf_id else f'{vf_id} '
         try:
-            sfp_detail = self.switch_detail[self.vf_id]['port']
+            sfp_detail = self.switch_detail[vf_id]['port']
         except KeyError:
             return FAILED
 
@@ -320,6 +388,9 @@ class SwitchSshConsole(SshConsole):
             except KeyError:
                 continue
 
+            self.metrics.update({f'{_prefix}port {_name} rx_uw': _rx_power, f'{_prefix}port {_name} tx_uw': _tx_power,
+                                 f'{_prefix}port {_name} temperature': _temp})
+
             if TEMP_LOW < _temp < TEMP_HIGH \
                     and CURR_LOW < _curr < CURR_HIGH \
                     and VOLT_LOW < _vol < VOLT_HIGH \
@@ -338,7 +409,7 @@ class SwitchSshConsole(SshConsole):
             _tx_power = f'\033[31m{_tx_power:>7.1f}tuW\033[0m' if _tx_power <= TX_LOW or _tx_power >= TX_HIGH else f'{_tx_power:>7.1f}tuW'
 
             _return = FAILED
-            self.error_msg.append(f'Port{_port:<4s}{_name:<8s}{_state}'
+            self.error_msg.append(f'{_prefix}Port{_port:<4s}{_name:<8s}{_state}'
                                   f'{_temp}'
                                   f'{_curr}'
                                   f'{_vol}'
@@ -352,16 +423,41 @@ class SwitchSshConsole(SshConsole):
         """
         :return: Nothing
 
-        no print, for backend executing in Threading
+        no print, for backend executing in Threading.
+        without a configured VF id every VF context of a director is collected over this one login,
+        a switch without VF only has its default context.
         """
         self.conn_default_vf()
         self.show_basic_cfg_and_sensors()
-        self.show_vf_port_detail()
-
+        _fids = self.show_all_vf_port_detail() if self.vf_id == 'FID0' else []
+        if not _fids:
+            if self.vf_id != 'FID0':
+                self.setcontext(self.vf_id)
+            self.show_vf_port_detail()
+            _fids = [self.vf_id]
+
+        self.metrics = {}
+        # firmware & sensors are chassis-wide, read in the default context
         self.fir_ver_val = self.version()
-        self.sys_stat_val = self.sys_stat()
         self.sensor_stat_val = self.sensor_stat()
-        self.sfp_stat_val = self.port_sfp_stat()
+        self.vf_stat_vals = {_fid: (self.sys_stat(_fid), self.port_sfp_stat(_fid)) for _fid in _fids}
+        self.sys_stat_val = FAILED if any(_sys == FAILED for _sys, _sfp in self.vf_stat_vals.values()) else PASSED
+        self.sfp_stat_val = FAILED if any(_sfp == FAILED for _sys, _sfp in self.vf_stat_vals.values()) else PASSED
+
+    def pm_records(self):
+        """
+        states shown by pm() & metrics read by the checks, for the result store
+        """
+        _states = {'version': self.fir_ver_val, 'sensor_stat': self.sensor_stat_val}
+        for _fid, (_sys_stat, _sfp_stat) in self.vf_stat_vals.items():
+            _states.update({f'sys_stat {_fid}': _sys_stat, f'port_sfp_stat {_fid}': _sfp_stat})
+        return _states, self.metrics
+
+    def pm_details(self):
+        """
+        error lines printed by pm(), compared with the previous run by the snapshot
+        """
+        return [' '.join(_line) if isinstance(_line, tuple) else _line for _line in self.error_msg]
 
     def pm(self):
         print('\n', '=' * 80, sep='')
@@ -376,22 +472,19 @@ class SwitchSshConsole(SshConsole):
         fir_ver = self.fir_ver_val
         print(f'{prompt:<30s}{fir_ver:.>50s}')
 
-        prompt = 'Switch System State'
-        # sys_stat = self.sys_stat()
-        sys_stat = self.sys_stat_val
-        print(f'{prompt:<30s}{sys_stat:.>{NO_COLOR}}')
-
         # sensor state
         prompt = 'Switch Sensor State'
         # sensor_stat = self.sensor_stat()
         sensor_stat = self.sensor_stat_val
         print(f'{prompt:<30s}{sensor_stat:.>{NO_COLOR}s}')
 
-        # sfp state
-        prompt = 'Switch Port&SFP State'
-        # sfp_stat = self.port_sfp_stat()
-        sfp_stat = self.sfp_stat_val
-        print(f'{prompt:<30s}{sfp_stat:.>{NO_COLOR}s}')
+        # system and sfp state of every VF context collected
+        for _fid, (sys_stat, sfp_stat) in self.vf_stat_vals.items():
+            prompt = f'Switch System State {_fid}'
+            print(f'{prompt:<30s}{sys_stat:.>{NO_COLOR}}')
+
+            prompt = f'Switch Port&SFP State {_fid}'
+            print(f'{prompt:<30s}{sfp_stat:.>{NO_COLOR}s}')
 
         # display error messages to the monitor
         print('-' * 80)
@@ -406,6 +499,12 @@ class SwitchSshConsole(SshConsole):
 
 
 class SwitchSnmpConsole(SnmpConsole):
+    # firmware, sensors, FRUs and CPs are the same in every VF context, only port tables differ
+    chassis_oids = ('1.3.6.1.4.1.1588.2.1.1.1.1.6',
+                    '1.3.6.1.4.1.1588.2.1.1.1.1.22.1',
+                    '1.3.6.1.4.1.1588.2.1.2.1.5.1',
+                    '1.3.6.1.4.1.1588.2.1.2.1.7.1')
+
     def __init__(self,
                  manage_ipaddr,
                  *snmp_args,
@@ -432,6 +531,8 @@ class SwitchSnmpConsole(SnmpConsole):
         self.cp_stat_val = None
         # port state
         self.port_stat_val = None
+        # {metric name: number} read by the checks, for the result store
+        self.metrics = {}
 
         self.error_msg = []
 
@@ -449,9 +550,9 @@ class SwitchSnmpConsole(SnmpConsole):
         try:
             return index_string_dict[index]
         except KeyError:
-            self.colorlog(f'SNMP [{error_key}] decode failed, index not defined!', 'warn')
+            self.colorlog('SNMP [%s] decode failed, index not defined!', 'warn', error_key)
             # self.colorlog(f'index dict [{index_string_dict}]', 'warn')
-            self.colorlog(f'index value [{index}]', 'warn')
+            self.colorlog('index value [%s]', 'warn', index)
             # return index
             return None
 
@@ -508,15 +609,12 @@ class SwitchSnmpConsole(SnmpConsole):
 
     def sensor_stat(self):
         _base_oid = '1.3.6.1.4.1.1588.2.1.1.1.1.22.1'
-        _index_list = self.snmpwalk_values(f'{_base_oid}.1')
-        _type_list = self.snmpwalk_values(f'{_base_oid}.2')
-        _stat_list = self.snmpwalk_values(f'{_base_oid}.3')
-        _value_list = self.snmpwalk_values(f'{_base_oid}.4')
-        _info_list = self.snmpwalk_values(f'{_base_oid}.5')
+        # 1: index, 2: type, 3: status, 4: value, 5: info
+        _rows = self.walk_table(_base_oid, ['1', '2', '3', '4', '5'])
 
         _return_code = 0
 
-        if len(_index_list) == 0 or list(set(_index_list)) == ['-'] or _index_list == ['']:
+        if not _rows:
             return UNKNOWN
 
         _type_code = {'1': 'unknown', '2': 'other', '3': 'battery', '4': 'fan',
@@ -525,12 +623,13 @@ class SwitchSnmpConsole(SnmpConsole):
 
         _stat_code = {'1': 'unknown', '2': 'faulty', '3': 'below-min', '4': 'nominal', '5': 'above-max', '6': 'absent'}
 
-        for _i in range(len(_index_list)):
-            _line = f'{_index_list[_i]} ' \
-                    f'{self.decode_index(_type_code, _type_list[_i], "Sensor Type")} ' \
-                    f'{self.decode_index(_stat_code, _stat_list[_i], "Sensor Stat")} ' \
-                    f'{_value_list[_i]} ' \
-                    f'{_info_list[_i]}'
+        for _row in _rows.values():
+            self.metrics[f'sensor {_row.get("1", "-")}'] = _row.get('4')
+            _line = f'{_row.get("1", "-")} ' \
+                    f'{self.decode_index(_type_code, _row.get("2"), "Sensor Type")} ' \
+                    f'{self.decode_index(_stat_code, _row.get("3"), "Sensor Stat")} ' \
+                    f'{_row.get("4", "-")} ' \
+                    f'{_row.get("5", "-")}'
             if 'nominal' not in _line and 'absent' not in _line:  # some sensor recognrised 'unknown' or 'battery' is absent
                 self.error_msg.append(_line)
                 _return_code += 1  # todo prevent write error line such as '- - - - -'
@@ -656,14 +755,14 @@ class SwitchSnmpConsole(SnmpConsole):
         _port_stat = {}
 
         _base_oid = '1.3.6.1.4.1.1588.2.1.1.1.6.2.1'
-        _base_list = self.snmpwalk_values(f'{_base_oid}.1')  # for checking if snmpwalk successfully
-        # _index_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.1')}
-        _name_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.36')}
-        _type_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.2')}  # The type of ASIC for the switch port
-        _phy_stat_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.3')}  # The physical state of the port
-        _op_stat_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.4')}
-        _adm_stat_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.5')}
-        _link_stat_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_base_oid}.6')}
+        # 1: index, 36: name, 2: type of ASIC, 3: physical state, 4: operational state, 5: admin state, 6: link state
+        _port_rows = self.walk_table(_base_oid, ['1', '36', '2', '3', '4', '5', '6'])
+        _name_list = {_i: _row['36'] for _i, _row in _port_rows.items() if '36' in _row}
+        _type_list = {_i: _row['2'] for _i, _row in _port_rows.items() if '2' in _row}
+        _phy_stat_list = {_i: _row['3'] for _i, _row in _port_rows.items() if '3' in _row}
+        _op_stat_list = {_i: _row['4'] for _i, _row in _port_rows.items() if '4' in _row}
+        _adm_stat_list = {_i: _row['5'] for _i, _row in _port_rows.items() if '5' in _row}
+        _link_stat_list = {_i: _row['6'] for _i, _row in _port_rows.items() if '6' in _row}
 
         _type_code = {'1': 'stitch', '2': 'flannel', '3': 'loom', '4': 'bloom',
                       '5': 'rdbloom', '6': 'wormhole', '7': 'other', '8': 'unknown'}
@@ -686,12 +785,14 @@ class SwitchSnmpConsole(SnmpConsole):
 
         _sfp_oid = '1.3.6.1.4.1.1588.2.1.1.1.28.1.1'
         # SNMPv2-SMI::enterprises.1588.2.1.1.1.28.1.1.1.16.0.80.235.26.208.116.3.0.0.0.0.0.0.0.0.61 = STRING: "65"
-        _temp_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_sfp_oid}.1')}
-        _vol_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_sfp_oid}.2')}
-        _current_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_sfp_oid}.3')}
-        _rx_pwr_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_sfp_oid}.4')}
-        _tx_pwr_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_sfp_oid}.5')}
-        _pwr_hrs_list = {_line[0]: _line[1] for _line in self.snmpwalk_index_value(f'{_sfp_oid}.6')}
+        # last sub-identifier of sfp index is the port index
+        _sfp_rows = {_i.split('.')[-1]: _row for _i, _row in self.walk_table(_sfp_oid, ['1', '2', '3', '4', '5', '6']).items()}
+        _temp_list = {_i: _row['1'] for _i, _row in _sfp_rows.items() if '1' in _row}
+        _vol_list = {_i: _row['2'] for _i, _row in _sfp_rows.items() if '2' in _row}
+        _current_list = {_i: _row['3'] for _i, _row in _sfp_rows.items() if '3' in _row}
+        _rx_pwr_list = {_i: _row['4'] for _i, _row in _sfp_rows.items() if '4' in _row}
+        _tx_pwr_list = {_i: _row['5'] for _i, _row in _sfp_rows.items() if '5' in _row}
+        _pwr_hrs_list = {_i: _row['6'] for _i, _row in _sfp_rows.items() if '6' in _row}
 
         def _trans_dBm_uW(_dbPower) -> float:
             try:
@@ -701,7 +802,7 @@ class SwitchSnmpConsole(SnmpConsole):
             _uWatts = float('{:.0f}'.format(math.pow(10, _dbPower / 10) * 1000))  # Trans dBm to uWatts
             return _uWatts
 
-        if len(_base_list) == 0 or list(set(_base_list)) == ['-'] or _base_list == ['']:
+        if not _port_rows:
             return UNKNOWN
 
         # for _i in range(len(_name_list)):
@@ -751,6 +852,9 @@ class SwitchSnmpConsole(SnmpConsole):
                 self.colorlog(f'maybe the port [{_value}] has no transceiver', 'warn')
                 continue
 
+            self.metrics.update({f'port {_name} rx_uw': _rx_uw, f'port {_name} tx_uw': _tx_uw,
+                                 f'port {_name} temperature': _temp_list[_i]})
+
             if _link_stat_list[_i] == '2':  # port is disabled by Administrator, ignore state check
                 self.colorlog(f'port [{_value}] is disabled by admin, ignore checking.', 'info')
                 continue
@@ -780,14 +884,9 @@ class SwitchSnmpConsole(SnmpConsole):
         _return_code = 0
 
         _base_oid = '1.3.6.1.4.1.1588.2.1.2.1.5.1'
-        _class_list = self.snmpwalk_values(f'{_base_oid}.1')
-        _stat_list = self.snmpwalk_values(f'{_base_oid}.2')
-        _obj_num_list = self.snmpwalk_values(f'{_base_oid}.3')
-        _supplier_id_list = self.snmpwalk_values(f'{_base_oid}.4')
-        _supplier_pn_list = self.snmpwalk_values(f'{_base_oid}.5')
-        _supplier_sn_list = self.snmpwalk_values(f'{_base_oid}.6')
-        _supplier_revcode_list = self.snmpwalk_values(f'{_base_oid}.7')
-        _pwr_con_list = self.snmpwalk_values(f'{_base_oid}.8')
+        # 1: class, 2: status, 3: object number, 4: supplier id, 5: supplier part number,
+        # 6: supplier serial number, 7: supplier revision code, 8: power consumption
+        _rows = self.walk_table(_base_oid, ['1', '2', '3', '4', '5', '6', '7', '8'])
 
         _class_code = {'1': 'other', '2': 'unknown', '3': 'chassis', '4': 'CP',
                        '5': 'other-CP', '6': 'switchblade', '7': 'wwn',
@@ -795,18 +894,18 @@ class SwitchSnmpConsole(SnmpConsole):
 
         _stat_code = {'1': 'other', '2': 'unknown', '3': 'on', '4': 'off', '5': 'faulty'}
 
-        if len(_class_list) == 0 or list(set(_class_list)) == ['-'] or _class_list == ['']:
+        if not _rows:
             return UNKNOWN
 
-        for _i in range(len(_class_list)):
-            _line = f'{self.decode_index(_class_code, _class_list[_i], "FRU Class")} ' \
-                    f'{self.decode_index(_stat_code, _stat_list[_i], "FRU Stat")} ' \
-                    f'{_obj_num_list[_i]} ' \
-                    f'{_supplier_id_list[_i]} ' \
-                    f'{_supplier_pn_list[_i]} ' \
-                    f'{_supplier_sn_list[_i]} ' \
-                    f'{_supplier_revcode_list[_i]} ' \
-                    f'{_pwr_con_list[_i]}'
+        for _row in _rows.values():
+            _line = f'{self.decode_index(_class_code, _row.get("1"), "FRU Class")} ' \
+                    f'{self.decode_index(_stat_code, _row.get("2"), "FRU Stat")} ' \
+                    f'{_row.get("3", "-")} ' \
+                    f'{_row.get("4", "-")} ' \
+                    f'{_row.get("5", "-")} ' \
+                    f'{_row.get("6", "-")} ' \
+                    f'{_row.get("7", "-")} ' \
+                    f'{_row.get("8", "-")}'
             if 'faulty' in _line:
                 self.error_msg.append(_line)
                 _return_code += 1
@@ -816,33 +915,43 @@ class SwitchSnmpConsole(SnmpConsole):
         _return_code = 0
 
         _base_oid = '1.3.6.1.4.1.1588.2.1.2.1.7.1'
-        _stat_list = self.snmpwalk_values(f'{_base_oid}.1')
-        _ip_list = self.snmpwalk_values(f'{_base_oid}.2')
-        _mask_list = self.snmpwalk_values(f'{_base_oid}.3')
-        _gw_list = self.snmpwalk_values(f'{_base_oid}.4')
-        _last_event_list = self.snmpwalk_values(f'{_base_oid}.5')
+        # 1: status, 2: ip address, 3: netmask, 4: gateway, 5: last event
+        _rows = self.walk_table(_base_oid, ['1', '2', '3', '4', '5'])
 
         _stat_code = {'1': 'other', '2': 'unknown', '3': 'active', '4': 'standby', '5': 'failed'}
         _event_code = {'1': 'other', '2': 'unknown', '3': 'haSync', '4': 'haOutSync', '5': 'cpFaulty',
                        '6': 'cpHealthy', '7': 'cpActive', '8': 'configChange', '9': 'failOverStart',
                        '10': 'failOverDone', '11': 'firmwareCommit', '12': 'firmwareUpgrade'}
 
-        if len(_stat_list) == 0 or list(set(_stat_list)) == ['-'] or _stat_list == ['']:
+        if not _rows:
             return UNKNOWN
 
-        for _i in range(len(_stat_list)):
-            _line = f'{self.decode_index(_stat_code, _stat_list[_i], "CP Stat")} ' \
-                    f'{_ip_list[_i]} ' \
-                    f'{_mask_list[_i]} ' \
-                    f'{_gw_list[_i]} ' \
-                    f'{self.decode_index(_event_code, _last_event_list[_i], "CP Last Event")} '
+        for _row in _rows.values():
+            _line = f'{self.decode_index(_stat_code, _row.get("1"), "CP Stat")} ' \
+                    f'{_row.get("2", "-")} ' \
+                    f'{_row.get("3", "-")} ' \
+                    f'{_row.get("4", "-")} ' \
+                    f'{self.decode_index(_event_code, _row.get("5"), "CP Last Event")} '
 
             if 'failed' in _line:
                 self.error_msg.append(_line)
                 _return_code += 1
         return PASSED if _return_code == 0 else FAILED
 
+    def snmp_plan(self):
+        """
+        requests sent by fetch_pm_values() and pm_1_by_1()
+        """
+        return [self.plan_walk('1.3.6.1.4.1.1588.2.1.1.1.1.6'),
+                self.plan_walk('1.3.6.1.4.1.1588.2.1.1.1.1.7'),
+                self.plan_walk_table('1.3.6.1.4.1.1588.2.1.1.1.1.22.1', ['1', '2', '3', '4', '5']),
+                self.plan_walk_table('1.3.6.1.4.1.1588.2.1.2.1.5.1', ['1', '2', '3', '4', '5', '6', '7', '8']),
+                self.plan_walk_table('1.3.6.1.4.1.1588.2.1.2.1.7.1', ['1', '2', '3', '4', '5']),
+                self.plan_walk_table('1.3.6.1.4.1.1588.2.1.1.1.6.2.1', ['1', '36', '2', '3', '4', '5', '6']),
+                self.plan_walk_table('1.3.6.1.4.1.1588.2.1.1.1.28.1.1', ['1', '2', '3', '4', '5', '6'])]
+
     def fetch_pm_values(self):
+        self.metrics = {}
         # firmware version
         self.fir_ver_val = self.firmware_version()
         # system state
@@ -857,6 +966,20 @@ class SwitchSnmpConsole(SnmpConsole):
         # self.port_stat_val = self.port_stat()
         self.port_stat_val = self.port_stat_rw()
 
+    def pm_records(self):
+        """
+        states shown by pm() & metrics read by the checks, for the result store
+        """
+        return {'firmware_version': self.fir_ver_val, 'sys_stat': self.sys_stat_val,
+                'sensor_stat': self.sensor_stat_val, 'fru_stat': self.fru_stat_val,
+                'cp_stat': self.cp_stat_val, 'port_stat_rw': self.port_stat_val}, self.metrics
+
+    def pm_details(self):
+        """
+        error lines printed by pm(), compared with the previous run by the snapshot
+        """
+        return list(self.error_msg)
+
     def pm(self):
         print('\n', '=' * 80, sep='')
         # print('-' * 32, f'{self.manage_ipaddr:^16s}', '-' * 32, sep='')
@@ -962,19 +1085,34 @@ class SwitchSnmpConsole(SnmpConsole):
             print('-' * 80)
 
 
-def pm_all_switch(switch_list, display=False):
-    # todo add parameter for decided if pm with multiple threading
-    no_thread = 5
+def pm_unfinished(console, error):
+    """
+    report of a switch or VF context whose collection failed or ran out of time
+    """
+    print('\n', '=' * 80, sep='')
+    print('-' * 30, f'{console.manage_ipaddr:^14s}{console.vf_id:^6s}', '-' * 30, sep='')
+    prompt = f'Collecting ({type(error).__name__})'
+    print(f'{prompt:<30s}{UNKNOWN:.>{NO_COLOR}s}')
 
-    # snmp_consoles = []
 
-    def _snmp_pm(snmp_class: SwitchSnmpConsole):
-        snmp_class.fetch_pm_values()
+def console_key(console):
+    """
+    name of a console in progress, result store & snapshot, the ssh console of a switch covers all its VF contexts
+    """
+    if isinstance(console, SwitchSshConsole):
+        return f'{console.manage_ipaddr} ssh'
+    return f'{console.manage_ipaddr} {console.vf_id}'
 
-    # ssh_consoles = []
 
-    def _ssh_pm(ssh_class: SwitchSshConsole):
-        ssh_class.fetch_pm_values()
+def plan_switch(switch_list, display=False, ssh=False, store=None, snapshot=None):
+    """
+    switches & VF contexts split into collection and rendering, run by pm_all_switch or with other vendors
+    by one scheduler, states & metrics of rendered consoles are added to store (console.ResultStore),
+    with snapshot (console.Snapshot) only checks changed since the previous run are rendered
+    :return: (snmp consoles to poll, [(key, function, args)] jobs, render(results of jobs))
+    """
+    # [(console, snmp or ssh)] in configured order
+    consoles = []
 
     for switch_cfg in switch_list:
         try:
@@ -983,39 +1121,56 @@ def pm_all_switch(switch_list, display=False):
 
             for _snmp_args in _snmp_args_list:
                 _vf_id = _snmp_args.split('VF:')[-1].split()[0] if 'VF:' in _snmp_args else None
-                _snmp_consl = SwitchSnmpConsole(_ipaddr, _snmp_args, vf_id=_vf_id, display=display, desc=_desc)
-
-                # for multiple threading pm via snmp
-                # snmp_consoles.append(_snmp_consl)
-
-                # pm via snmp one by one
-                _snmp_consl.pm_1_by_1()
+                consoles.append(SwitchSnmpConsole(_ipaddr, _snmp_args, vf_id=_vf_id, display=display, desc=_desc))
 
-            # pm san switch via ssh uncommitted
-            # _ssh_consl = SwitchSshConsole(_ipaddr, _user, _pass, _ssh_port, display=display)
-            # ssh_consoles.append(_ssh_consl)
-            # _ssh_consl.pm()
+            # one login per switch, all its VF contexts are collected in one shell
+            if ssh and _pass is not None:
+                consoles.append(SwitchSshConsole(_ipaddr, _user, _pass, _ssh_port, display=display))
 
         except ValueError:
             pass
 
-    # threading for pm via snmp
-    # snmp_threads = [threading.Thread(target=_snmp_pm, args=(_snmp_consl,)) for _snmp_consl in snmp_consoles]
-
-    # threading for pm via ssh
-    # ssh_threads = [threading.Thread(target=_ssh_pm, args=(_ssh_consl,)) for _ssh_consl in ssh_consoles]
-
-    # threading for pm via snmp
-    # [t.start() for t in snmp_threads]
-    # [t.join() for t in snmp_threads]
-
-    # threading for pm via ssh
-    # [t.start() for t in ssh_threads]
-    # [t.join() for t in ssh_threads]
-
-    # print results
-    # [consl.pm() for consl in snmp_consoles]
-    # [consl.pm() for consl in ssh_consoles]
+    def _render(_results):
+        # rendering after collection, in configured order
+        for _consl, (_value, _error) in zip(consoles, _results):
+            if _error is not None:
+                pm_unfinished(_consl, _error)
+                continue
+            _key = console_key(_consl)
+            _states, _metrics = _consl.pm_records()
+            if snapshot is not None:
+                snapshot.render(_key, _states, _consl.pm_details())
+            else:
+                _consl.pm()
+            store.add_records(_key, _states, _metrics) if store else ''
+
+    _snmp_consoles = [_consl for _consl in consoles if isinstance(_consl, SwitchSnmpConsole)]
+    _jobs = [(console_key(_consl), _consl.fetch_pm_values, ()) for _consl in consoles]
+    return _snmp_consoles, _jobs, _render
+
+
+def pm_all_switch(switch_list, display=False, max_in_flight=64, workers=16, deadline=300, progress=True, ssh=False,
+                  store=None, snapshot=None):
+    """
+    Args:
+        workers: switches & VF contexts collected at once
+        deadline: seconds one console may take, its report shows the time out afterwards
+        progress: print a line to stderr as every console finishes
+        ssh: also collect every switch via ssh, one login for all its VF contexts
+        store: console.ResultStore, states & metrics of the run are written to it in one batch
+        snapshot: console.Snapshot, only checks changed since the previous run are printed
+    """
+    _snmp_consoles, _jobs, _render = plan_switch(switch_list, display=display, ssh=ssh, store=store,
+                                                 snapshot=snapshot)
+
+    # every switch and VF context is polled at once, the checks then read prefetched results
+    SnmpPoller(max_in_flight=max_in_flight, logfile=_LOG_FILE).poll(_snmp_consoles)
+
+    _pool = WorkerPool(workers=workers, deadline=deadline,
+                       progress=print_progress if progress else None, logfile=_LOG_FILE)
+    _render(_pool.run(_jobs))
+    store.commit() if store else ''
+    snapshot.save() if snapshot else ''
 
 
 if __name__ == '__main__':
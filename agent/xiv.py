@@ -28,18 +28,24 @@ _LOG_FILE = os.path.join(_LOG_PATH, 'agent.log')
 
 sys.path.append(_ROOT_)
 from console.snmpconsole import SnmpConsole
+from console.snmppoller import SnmpPoller
 
 if platform.system().lower() == 'linux':
     PASSED = '\033[0;37mPassed\033[0m'
     FAILED = '\033[0;31mFailed\033[0m'
+    UNKNOWN = '\033[0;33mN/A\033[0m'
     NO_COLOR = 61
 else:
     PASSED = 'Passed'
     FAILED = 'FAILED'
+    UNKNOWN = 'N/A'
     NO_COLOR = 50
 
 
 class XivSnmpConsole(SnmpConsole):
+    scalar_oids = ['xivFailedDisks.0', 'xivMachineStatus.0', 'xivUtilizationSoft.0', 'xivUtilizationHard.0']
+    interface_oid = 'xivIfStatus'
+
     def __init__(self, manage_ipaddr, MIBs=None, version=None, community=None, logfile=None, display=False, desc=None):
         self.manage_ipaddr = manage_ipaddr
         self.MIBs = MIBs if MIBs is not None else 'XIV-MIB'
@@ -52,31 +58,43 @@ class XivSnmpConsole(SnmpConsole):
         self.PASSED = '\033[0;37mPasswd\033[0m'
         self.FAILED = '\033[0;31mFailed\033[0m'
 
+        # scalar values of 'xivFailedDisks', 'xivMachineStatus', 'xivUtilizationSoft', 'xivUtilizationHard'
+        self.scalars = None
+
         SnmpConsole.__init__(self, self.manage_ipaddr, self.xiv_snmp_args, logfile=self.logfile, display=display)
 
+    def fetch_scalars(self):
+        """
+        read all scalars checked by pm with one GET request
+        """
+        _oids = self.scalar_oids
+        self.scalars = {_oid.split('.')[0]: self.format_value(_vb) for _oid, _vb in self.get_many(_oids).items()}
+        return self.scalars
+
+    def snmp_plan(self):
+        return [self.plan_get_many(self.scalar_oids), self.plan_walk(self.interface_oid)]
+
+    def scalar(self, name):
+        if self.scalars is None:
+            self.fetch_scalars()
+        return self.scalars.get(name)
+
     def xiv_disk_status(self):
-        _oid = 'xivFailedDisks'
-        _return = self.snmpwalk(_oid).split('INTEGER:')[-1].strip()
-        return PASSED if _return == '0' else FAILED
+        return PASSED if self.scalar('xivFailedDisks') == '0' else FAILED
 
     def xiv_machine_status(self):
-        _oid = 'xivMachineStatus'
-        _return = self.snmpwalk(_oid).split('STRING:')[-1].strip()
-        return PASSED if _return == '"Full Redundancy"' else FAILED
+        return PASSED if self.scalar('xivMachineStatus') == 'Full Redundancy' else FAILED
 
     def xiv_soft_utilization(self):
-        _oid = 'xivUtilizationSoft'
-        _return = self.snmpwalk(_oid).split('Gauge32:')[-1].strip()
-        return f'{_return}%'
+        _return = self.scalar('xivUtilizationSoft')
+        return f'{_return}%' if _return else 'N/A'
 
     def xiv_hard_utilization(self):
-        _oid = 'xivUtilizationHard'
-        _return = self.snmpwalk(_oid).split('Gauge32:')[-1].strip()
-        return f'{_return}%'
+        _return = self.scalar('xivUtilizationHard')
+        return f'{_return}%' if _return else 'N/A'
 
     def xiv_interface_status(self):
-        _oid = 'xivIfStatus'
-        _return = self.snmpwalk_format(_oid)
+        _return = self.snmpwalk_format(self.interface_oid)
         _failed_ifs = ''
         for _mib, _desc, _index, _type, _value in _return:
             if _value != 'OK' and _value != 'Ready':
@@ -87,7 +105,48 @@ class XivSnmpConsole(SnmpConsole):
         # xivIfIOPS
         return PASSED if _failed_ifs == '' else f'{FAILED} [{_failed_ifs}]'
 
-    def xiv_pm(self):
+    def pm_records(self):
+        """
+        states shown by xiv_pm() & utilization in percent, for the result store
+        """
+        _states = {_name: getattr(self, _name)() for _name in ('xiv_disk_status', 'xiv_machine_status',
+                                                               'xiv_interface_status')}
+        return _states, self.pm_metrics()
+
+    def pm_metrics(self, checks=None):
+        """
+        utilization in percent, of the utilization checks among 'checks' if given
+        """
+        _metrics = {}
+        if checks is None or 'xiv_soft_utilization' in checks:
+            _metrics['utilization soft'] = self.scalar('xivUtilizationSoft')
+        if checks is None or 'xiv_hard_utilization' in checks:
+            _metrics['utilization hard'] = self.scalar('xivUtilizationHard')
+        return _metrics
+
+    def pm_details(self):
+        """
+        failed interfaces are part of the state of 'xiv_interface_status', nothing more printed by xiv_pm()
+        """
+        return []
+
+    def pm_unfinished(self, error):
+        """
+        report of a XIV whose collection failed or ran out of time
+        """
+        print('\n', '=' * 80, sep='')
+        print('-' * 32, f'{self.manage_ipaddr:^16s}', '-' * 32, sep='')
+        prompt = 'XIV Machine Description'
+        print(f'{prompt:<30s}{self.desc:.>50s}')
+        prompt = f'Collecting ({type(error).__name__})'
+        print(f'{prompt:<30s}{UNKNOWN:.>{NO_COLOR}s}')
+
+    def xiv_pm(self, states=None):
+        """
+        :param states: states of 'pm_records' already read, scalars come from the cache of 'scalar'
+        """
+        states = self.pm_records()[0] if states is None else states
+
         print('\n', '=' * 80, sep='')
         print('-' * 32, f'{self.manage_ipaddr:^16s}', '-' * 32, sep='')
 
@@ -96,11 +155,11 @@ class XivSnmpConsole(SnmpConsole):
         print(f'{prompt:<30s}{desc:.>50s}')
 
         prompt = 'XIV Disk Status'
-        disk_stat = self.xiv_disk_status()
+        disk_stat = states['xiv_disk_status']
         print(f'{prompt:<30s}{disk_stat:.>{NO_COLOR}s}')
 
         prompt = 'XIV Machine Status'
-        machine_stat = self.xiv_machine_status()
+        machine_stat = states['xiv_machine_status']
         print(f'{prompt:<30s}{machine_stat:.>{NO_COLOR}s}')
 
         prompt = 'XIV Soft Utilization'
@@ -112,19 +171,49 @@ class XivSnmpConsole(SnmpConsole):
         print(f'{prompt:<30s}{hard_uti:.>50s}')
 
         prompt = 'XIV Interface Status'
-        if_stat = self.xiv_interface_status()
+        if_stat = states['xiv_interface_status']
         print(f'{prompt:<30s}{if_stat:.>{NO_COLOR}s}')
 
 
-def pm_xiv_all(xiv_list):
+def plan_xiv(xiv_list, store=None, snapshot=None):
+    """
+    XIVs split into collection and rendering, run by pm_xiv_all or with other vendors by one scheduler,
+    states & metrics of rendered XIVs are added to store (console.ResultStore),
+    with snapshot (console.Snapshot) only checks changed since the previous run are rendered
+    :return: (snmp consoles to poll, [(key, function, args)] jobs, render(results of jobs))
+    """
+    xiv_consoles = []
     for _xiv in xiv_list:
         try:
             _ip, _desc = _xiv  # if more attr needed, append here
-            xiv_consl = XivSnmpConsole(_ip, desc=_desc)
-            xiv_consl.xiv_pm()
-        except KeyError:
+            xiv_consoles.append(XivSnmpConsole(_ip, desc=_desc))
+        except (KeyError, ValueError):
             pass
 
+    def _render(_results):
+        for xiv_consl, (_value, _error) in zip(xiv_consoles, _results):
+            if _error is not None:
+                xiv_consl.pm_unfinished(_error)
+                continue
+            _states, _metrics = xiv_consl.pm_records()
+            if snapshot is not None:
+                snapshot.render(xiv_consl.manage_ipaddr, _states, xiv_consl.pm_details())
+            else:
+                xiv_consl.xiv_pm(_states)
+            store.add_records(xiv_consl.manage_ipaddr, _states, _metrics) if store else ''
+
+    return xiv_consoles, [(xiv_consl.manage_ipaddr, xiv_consl.fetch_scalars, ()) for xiv_consl in xiv_consoles], _render
+
+
+def pm_xiv_all(xiv_list, max_in_flight=64, store=None, snapshot=None):
+    xiv_consoles, _jobs, _render = plan_xiv(xiv_list, store=store, snapshot=snapshot)
+
+    # all XIVs are polled at once, the checks then read prefetched results
+    SnmpPoller(max_in_flight=max_in_flight, logfile=_LOG_FILE).poll(xiv_consoles)
+    _render([(None, None)] * len(xiv_consoles))
+    store.commit() if store else ''
+    snapshot.save() if snapshot else ''
+
 
 if __name__ == '__main__':
     XIV = ['192.168.1.1', '192.168.1.2']
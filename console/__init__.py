@@ -21,8 +21,18 @@ sys.path.append(_ROOT_)
 from console.busybox import ColorLogger
 from console.busybox import read_value
 from console.busybox import log_cleaner
+from console.busybox import get_logger
+from console.busybox import log_enabled
+from console.busybox import set_log_level
+from console.sshpool import SshPool
+from console.sshpool import ssh_pool
 from console.sshconsole import SshConsole
+from console.shellsession import ShellSession
 from console.snmpconsole import SnmpConsole
+from console.snmppoller import SnmpPoller
+from console.workerpool import WorkerPool
+from console.resultstore import ResultStore
+from console.snapshot import Snapshot
 from console.decoder import SwitchLogDecoder
 from console.configreader import ConfigReader
 from console.opensshconsole import OpenSshConsole
@@ -31,8 +41,18 @@ __all__ = [
     'ColorLogger',
     'read_value',
     'log_cleaner',
+    'get_logger',
+    'log_enabled',
+    'set_log_level',
+    'SshPool',
+    'ssh_pool',
     'SshConsole',
+    'ShellSession',
     'SnmpConsole',
+    'SnmpPoller',
+    'WorkerPool',
+    'ResultStore',
+    'Snapshot',
     'SwitchLogDecoder',
     'ConfigReader',
     'OpenSshConsole'
@@ -16,7 +16,29 @@
 """
 import os
 import logging
+import logging.handlers
 import sys
+import queue
+import atexit
+import threading
+
+_LOG_LEVELS_ = {'debug': logging.DEBUG, 'info': logging.INFO, 'warn': logging.WARN,
+                'error': logging.ERROR, 'critical': logging.CRITICAL}
+
+# levels written by colorlog, a suppressed level costs callers one lookup, set by 'set_log_level'
+log_enabled = {_level: True for _level in _LOG_LEVELS_}
+
+
+def set_log_level(level):
+    """
+    :param level: minimum level written by every colorlog in this process, debug, info, warn, error or critical
+    """
+    try:
+        _minimum = _LOG_LEVELS_[level]
+    except KeyError:
+        raise TypeError('Wrong log level, must be debug, info, warn, error or critical.')
+    # update in place, modules imported the dict itself
+    log_enabled.update({_level: _levelno >= _minimum for _level, _levelno in _LOG_LEVELS_.items()})
 
 
 class ColorLogFormatter(logging.Formatter):
@@ -39,27 +61,158 @@ class ColorLogFormatter(logging.Formatter):
         return self.format(record)
 
 
+# one formatter per level, one handler per log file and one logger per (name, file, display) in this process
+_FORMATTERS_ = {}
+_HANDLERS_ = {}
+_LOGGERS_ = {}
+_REGISTRY_LOCK_ = threading.Lock()
+
+# records wait here for the listener thread, which formats and writes them
+_LOG_QUEUE_SIZE_ = 10000
+_LOG_QUEUE_ = queue.Queue(maxsize=_LOG_QUEUE_SIZE_)
+_LISTENER_ = None
+
+
+def get_formatter(level):
+    try:
+        return _FORMATTERS_[level]
+    except KeyError:
+        return _FORMATTERS_.setdefault(level, ColorLogFormatter(level))
+
+
+class _LevelFormatter(logging.Formatter):
+    """
+    format on listener thread with the ColorLogFormatter of the level colorlog() was called with
+    """
+    def format(self, record):
+        return get_formatter(getattr(record, 'color_level', 'info')).format(record)
+
+
+class _RouteHandler(logging.Handler):
+    """
+    listener side, hand every record to the handlers of log file and screen its logger writes to
+    """
+    def handle(self, record):
+        for _key in record.log_targets:
+            _handler = _HANDLERS_.get(_key)
+            if _handler is not None:
+                _handler.handle(record)
+        return True
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    pollers only enqueue, records are dropped and counted when queue is full
+    """
+    def __init__(self, log_queue):
+        logging.handlers.QueueHandler.__init__(self, log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _LogListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # blocking, the sentinel must not be dropped on a full queue
+        self.queue.put(self._sentinel)
+
+
+_QUEUE_HANDLER_ = _BoundedQueueHandler(_LOG_QUEUE_)
+
+
+def _start_listener():
+    global _LISTENER_
+    with _REGISTRY_LOCK_:
+        if _LISTENER_ is None:
+            _LISTENER_ = _LogListener(_LOG_QUEUE_, _RouteHandler())
+            _LISTENER_.start()
+            atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    write out records still queued, the listener starts again with next record logged
+    """
+    global _LISTENER_
+    with _REGISTRY_LOCK_:
+        _listener, _LISTENER_ = _LISTENER_, None
+    if _listener is not None:
+        _listener.stop()
+
+    _dropped, _QUEUE_HANDLER_.dropped = _QUEUE_HANDLER_.dropped, 0
+    if _dropped:
+        _record = logging.makeLogRecord({'name': 'LOG queue', 'levelno': logging.WARN, 'levelname': 'WARNING',
+                                         'msg': f'{_dropped} log records dropped, queue full', 'color_level': 'warn'})
+        for _key, _handler in list(_HANDLERS_.items()):
+            if _key is not None:
+                _handler.handle(_record)
+    for _handler in list(_HANDLERS_.values()):
+        _handler.flush()
+
+
+def dropped_records():
+    return _QUEUE_HANDLER_.dropped
+
+
+def _get_handler(filename=None, max_size=50):
+    """
+    :param filename: log file, rotated when it grows over max_size MiB, stdout if None
+    :return: key of handler, handlers are used by the listener thread only
+    """
+    with _REGISTRY_LOCK_:
+        _key = os.path.abspath(filename) if filename is not None else None
+        if _key not in _HANDLERS_:
+            if _key is None:
+                _handler = logging.StreamHandler(sys.stdout)
+            else:
+                _handler = logging.handlers.RotatingFileHandler(_key, maxBytes=max_size * 1024 * 1024, backupCount=1)
+            _handler.setFormatter(_LevelFormatter())
+            _HANDLERS_[_key] = _handler
+        return _key
+
+
 class ColorLogger(logging.Logger):
-    def __init__(self, name, filename, display=True):
+    def __init__(self, name, filename, display=True, max_size=50):
         logging.Logger.__init__(self, name=name, level=logging.DEBUG)
         self.name = name
         self.display = display
-        if self.display:
-            screen = logging.StreamHandler(sys.stdout)
-            self.addHandler(screen)
-        logFile = logging.FileHandler(filename)
-        self.addHandler(logFile)
-
-    def colorlog(self, msg, level):
-        formatter = ColorLogFormatter(level)
-        loglevel = {'debug': logging.DEBUG, 'info': logging.INFO, 'warn': logging.WARN,
-                    'error': logging.ERROR, 'critical': logging.CRITICAL}
+        self.log_targets = ((_get_handler(),) if self.display else ()) + (_get_handler(filename, max_size),)
+        self.addHandler(_QUEUE_HANDLER_)
+
+    def colorlog(self, msg, level, *args):
+        """
+        :param msg: message, '%' format string merged with args, or callable returning the message,
+                    both are evaluated only if level is enabled
+        """
+        if not log_enabled.get(level, True):
+            return
+        if _LISTENER_ is None:
+            _start_listener()
+        msg = msg() if callable(msg) else msg
         try:
-            self.info(formatter.formatter(self.name, msg, loglevel[level]))
+            self.log(_LOG_LEVELS_[level], msg, *args, extra={'color_level': level, 'log_targets': self.log_targets})
         except KeyError:
             raise TypeError('Wrong log level!')
 
 
+def get_logger(name, filename, display=True, max_size=50):
+    """
+    ColorLogger created once and reused, instead of a new logger and file handler for every message
+    """
+    _key = (name, os.path.abspath(filename), display)
+    try:
+        return _LOGGERS_[_key]
+    except KeyError:
+        pass
+    _logger = ColorLogger(name, filename, display=display, max_size=max_size)
+    with _REGISTRY_LOCK_:
+        return _LOGGERS_.setdefault(_key, _logger)
+
+
 def read_value(key, configfile,
                  val_is_int=False,
                  val_is_bool=False,
@@ -113,6 +266,9 @@ def log_cleaner(filename: str, max_size: int):
         return open(filename, 'w').close()
 
 
+set_log_level(os.environ.get('PMC_LOG_LEVEL', 'debug'))
+
+
 if __name__ == '__main__':
     pass
 
@@ -15,11 +15,12 @@
 """
 from yaml import safe_load
 import os
-import subprocess
 try:
     import busybox
+    import prober
 except ModuleNotFoundError:
     from . import busybox
+    from . import prober
 
 _HOME_ = os.path.abspath(os.path.dirname(__file__))
 _ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
@@ -34,9 +35,17 @@ _xiv_config_name_ = 'xiv.yaml'
 _switch_config_name_ = 'switch.yaml'
 _hw_str_config_name_ = 'huaweistorage.yaml'
 
+# same defaults as XivSnmpConsole, xiv.yaml has no snmp args
+_XIV_SNMP_ARGS_ = '-v2c -c XIV'
+
 
 class ConfigReader(object):
-    def __init__(self, production=False, display=False):
+    def __init__(self, production=False, display=False, fast=True, probe_timeout=1.0):
+        """
+        Args:
+            fast: take the first configured address of every device without probing
+            probe_timeout: seconds of waiting for all addresses of all devices, when fast is False
+        """
         self.config_dir = _CONFIG_DIR_TEST_ if production is not True else _CONFIG_DIR_PRO_
 
         self.xiv_config = os.path.join(self.config_dir, _xiv_config_name_)
@@ -50,42 +59,62 @@ class ConfigReader(object):
 
         self.hw_str_config_keys = ['id', 'description', 'ipaddr', 'username', 'password', 'obs']
 
-    def _colorlog(self, msg=None, level=None):
-        msg = '' if msg is None else msg
+        self.fast = fast
+        self.prober = prober.ReachabilityProber(timeout=probe_timeout, logfile=self._log_file, display=display)
+
+    def _colorlog(self, msg=None, level=None, *args):
         level = 'debug' if level is None else level
+        if not busybox.log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
         name = self.class_name + ' {:<14s}'.format(self.logger_prefix)
-        colorlogger = busybox.ColorLogger(name, self._log_file, display=self.display)
-        busybox.log_cleaner(self._log_file, 50)
-        colorlogger.colorlog(msg, level)
+        colorlogger = busybox.get_logger(name, self._log_file, display=self.display, max_size=50)
+        colorlogger.colorlog(msg, level, *args)
 
-    def _is_ip_reachable(self, ipaddr_list: list, port=22, udp=False, fast=False):
+    def _is_ip_reachable(self, ipaddr_list: list, port=22, udp=False, fast=None, snmp_args=None):
         """
         :param ipaddr_list: one or more ip address[es]
         :param port: port to be tested if open or closed, 22 by default
         :param udp: set 'True' to test a UDP port like snmp port '161'
-        :return: ip address passed the test or None if all addresses failed.
+        :param snmp_args: snmp args of device, the UDP probe is a request agent answers
+        :return: first ip address passed the test or None if all addresses failed.
         """
-        if fast:
-            return ipaddr_list[0]
-
+        fast = self.fast if fast is None else fast
         if ipaddr_list is None or ipaddr_list == ['']:
             self._colorlog('read IP address list from configuration failed', 'critical')
             return None
 
-        for _ip in ipaddr_list:
-            if udp:
-                self._colorlog(f'udp port test enable for address [{_ip}]', 'info')
-                _test_command = f'nc -v -z -w1 -u {_ip} {port}'
-            else:
-                _test_command = f'nc -v -z -w1 {_ip} {port}'
-
-            _return = subprocess.getstatusoutput(_test_command)[0]
-            if _return == 0:
-                self._colorlog(f'IP address [{_ip}] port [{port}] is open', 'info')
-                return _ip
-            else:
-                self._colorlog(f'IP address [{_ip}] port [{port}] is closed', 'warn')
-                return None
+        if fast:
+            return ipaddr_list[0]
+
+        if udp:
+            self._colorlog(f'udp port test enable for addresses {ipaddr_list}', 'info')
+        return self.prober.probe({0: (ipaddr_list, port, udp, snmp_args)})[0]
+
+    def _reachable_addresses(self, lines, snmp_args=None):
+        """
+        probe every address of every device at once, SNMP port if device has snmp args, else SSH port
+        :param snmp_args: default for lines without 'snmp_args'
+        :return: [reachable ip address or None], in order of lines
+        """
+        _devices = {}
+        for _i, _line in enumerate(lines):
+            try:
+                _ipaddrs = _line['ipaddrs']
+            except (KeyError, TypeError):
+                continue
+            _snmp_args = _line.get('snmp_args', snmp_args)
+            _port, _udp = (161, True) if _snmp_args is not None else (22, False)
+            if self.fast or _ipaddrs is None or _ipaddrs == ['']:
+                _devices[_i] = self._is_ip_reachable(_ipaddrs, port=_port, udp=_udp)
+                continue
+            _devices[_i] = (_ipaddrs, _port, _udp, _snmp_args)
+
+        _probes = {_i: _device for _i, _device in _devices.items() if isinstance(_device, tuple)}
+        if _probes:
+            self._colorlog(f'probe addresses of {len(_probes)} devices', 'info')
+            _devices.update(self.prober.probe(_probes))
+        return [_devices.get(_i) for _i in range(len(lines))]
 
     def read_hw_str(self, hw_str_config=None):
         _config = self.hw_str_config if hw_str_config is None else hw_str_config
@@ -95,12 +124,13 @@ class ConfigReader(object):
         with open(_config, 'r') as f:
             _data = safe_load(f)
             self._colorlog(f'Load yaml config file [{_config}]', 'info')
+            _reachable = self._reachable_addresses(_data)
 
-            for _line in _data:
+            for _i, _line in enumerate(_data):
                 try:
                     _id, _ipaddrs = _line['id'], _line['ipaddrs']
                     self._colorlog(f'read addresses {_ipaddrs}', 'debug')
-                    _ipaddr = self._is_ip_reachable(_ipaddrs, fast=True)
+                    _ipaddr = _reachable[_i]
                     self._colorlog(f'return reachable address [{_ipaddr}]', 'debug')
 
                 except KeyError:
@@ -125,7 +155,6 @@ class ConfigReader(object):
 
                 try:
                     _snmp_args = _line['snmp_args']
-                    _ipaddr = self._is_ip_reachable(_ipaddrs, port=161, udp=True, fast=True)
                 except KeyError:
                     self._colorlog(f'read snmp args failed from line [{_line}]', 'debug')
                     _snmp_args = None
@@ -141,10 +170,11 @@ class ConfigReader(object):
 
         with open(_config, 'r') as f:
             _data = safe_load(f)
-            for _line in _data:
+            _reachable = self._reachable_addresses(_data, snmp_args=_XIV_SNMP_ARGS_)
+            for _i, _line in enumerate(_data):
                 try:
                     _id, _ipaddrs = _line['id'], _line['ipaddrs']
-                    _ipaddr = self._is_ip_reachable(_ipaddrs, port=161, udp=True, fast=True)
+                    _ipaddr = _reachable[_i]
                 except KeyError:
                     continue
 
@@ -177,10 +207,11 @@ class ConfigReader(object):
 
         with open(_config, 'r') as f:
             _data = safe_load(f)
-            for _line in _data:
+            _reachable = self._reachable_addresses(_data)
+            for _i, _line in enumerate(_data):
                 try:
                     _id, _ipaddrs = _line['id'], _line['ipaddrs']
-                    _ipaddr = self._is_ip_reachable(_ipaddrs, fast=True)
+                    _ipaddr = _reachable[_i]
                     # _ipaddr = _ipaddrs[0]
                 except KeyError:
                     continue
@@ -199,9 +230,8 @@ class ConfigReader(object):
 
                 try:
                     _snmp_args = _line['snmp_args']
-                    _ipaddr = self._is_ip_reachable(_ipaddrs, port=161, udp=True, fast=True)
                 except KeyError:
-                    self._colorlog(f'detected snmp args, but port 161 not opened.')
+                    self._colorlog(f'no snmp args for address [{_ipaddrs}]')
                     _snmp_args = None
 
                 try:
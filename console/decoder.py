@@ -13,10 +13,13 @@
 
 """
 ---Decode San Switch log to Dict---
+
+decode methods take any iterable of lines, a list or the stream of SshConsole.iter_output
 """
 import os
 import sys
 import math
+from typing import Iterable
 
 _HOME_ = os.path.abspath(os.path.dirname(__file__))
 _ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
@@ -25,8 +28,8 @@ _LOG_PATH_ = os.path.join(_ROOT_, 'log')
 _LOGFILE_ = os.path.join(_LOG_PATH_, 'console.log')
 
 sys.path.append(_ROOT_)
-from console import ColorLogger
-from console import log_cleaner
+from console import get_logger
+from console import log_enabled
 
 
 class SwitchLogDecoder(object):
@@ -71,14 +74,15 @@ class SwitchLogDecoder(object):
         self.FIDs = []
         self.user = user
 
-    def colorlog(self, msg=None, level=None):
-        msg = '' if msg is None else msg
+    def colorlog(self, msg=None, level=None, *args):
         level = 'debug' if level is None else level
+        if not log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
         # name = self.class_name + ' {:<15s}'.format(self.logger_suffix)
         name = f'{self.logger_prefix:<18s}'
-        colorlogger = ColorLogger(name, self.logfile, display=self.display)
-        log_cleaner(self.logfile, 100)
-        colorlogger.colorlog(msg, level)
+        colorlogger = get_logger(name, self.logfile, display=self.display, max_size=100)
+        colorlogger.colorlog(msg, level, *args)
 
     def is_line_data_or_prompt(self, line):
         line = line.strip()
@@ -94,7 +98,7 @@ class SwitchLogDecoder(object):
         if self.user not in line:
             return 'data'
 
-        self.colorlog(f'prompt line detected [{line}]', 'debug')
+        self.colorlog('prompt line detected [%s]', 'debug', line)
         return 'prompt'
 
     def detect_command(self, prompt_line):
@@ -103,7 +107,7 @@ class SwitchLogDecoder(object):
         try:
             vf_id = prompt_line.split(':')[1] if self.virtual_fabric is True else 'FID0'
             command = prompt_line.split(':')[1+self.weight].split(self.prompt)[1].strip()
-            self.colorlog(f'vf id: [{vf_id}] command: [{command}] detected.', 'debug')
+            self.colorlog('vf id: [%s] command: [%s] detected.', 'debug', vf_id, command)
         except IndexError as _e:
             self.colorlog(_e, 'error')
         except ValueError as _e:
@@ -144,7 +148,7 @@ class SwitchLogDecoder(object):
 
         return _output
 
-    def switchshow_decode(self, switchshow_output: list, vf_id: str):
+    def switchshow_decode(self, switchshow_output: Iterable[str], vf_id: str):
         vf_id = f'FID{vf_id}' if vf_id.isnumeric() else vf_id
         try:
             self.detail[vf_id]
@@ -234,7 +238,7 @@ class SwitchLogDecoder(object):
         self.detail[vf_id]['switch'].update(switchshow_detail)
         return switchshow_detail
 
-    def portshow_decode(self, portshow_output: list, vf_id: str):
+    def portshow_decode(self, portshow_output: Iterable[str], vf_id: str):
         vf_id = f'FID{vf_id}' if vf_id.isnumeric() else vf_id
         try:
             self.detail[vf_id]
@@ -245,6 +249,9 @@ class SwitchLogDecoder(object):
         except KeyError:
             self.detail[vf_id].update({'port': {}})
 
+        # read more than once below
+        portshow_output = list(portshow_output)
+
         # portshow_attr = ['portIndex', 'portHealth', 'WWNs', 'Loss_of_sync']
         # portshow_detail = {_attr: '' for _attr in portshow_attr}
         portshow_detail = {}
@@ -316,7 +323,7 @@ class SwitchLogDecoder(object):
         #     pass
         return portshow_detail
 
-    def sfpshow_decode(self, sfpshow_output: list, vf_id: str, full_command: str):
+    def sfpshow_decode(self, sfpshow_output: Iterable[str], vf_id: str, full_command: str):
         vf_id = f'FID{vf_id}' if vf_id.isnumeric() else vf_id
         try:
             self.detail[vf_id]
@@ -353,7 +360,7 @@ class SwitchLogDecoder(object):
 
         return sfpshow_detail
 
-    def sfpshow_all_decode(self, sfpshow_all_output: list, vf_id: str):
+    def sfpshow_all_decode(self, sfpshow_all_output: Iterable[str], vf_id: str):
         vf_id = f'FID{vf_id}' if vf_id.isnumeric() else vf_id
         try:
             self.detail[vf_id]
@@ -507,6 +514,8 @@ class SwitchLogDecoder(object):
         except KeyError:
             self.detail[vf_id].update({'switch': {}})
 
+        # last line is looked up below
+        ipaddrshow_output = list(ipaddrshow_output)
         _current_key = _last_key = None
         _ip = _netmask = _gw = _hostname = ''
         for _line in ipaddrshow_output:
@@ -550,6 +559,8 @@ class SwitchLogDecoder(object):
         except KeyError:
             self.detail[vf_id].update({'switch': {}})
 
+        # next line of a match is looked up by index
+        firmwareshow_output = list(firmwareshow_output)
         for _line in firmwareshow_output:
             if _line.startswith('FOS'):
                 """
@@ -692,6 +703,7 @@ class SwitchLogDecoder(object):
         except KeyError:
             self.detail[vf_id].update({'cfg': {}})
 
+        cfgshow_output = list(cfgshow_output)
         _output_line = '|'.join(cfgshow_output)
 
         _cfg_list = _output_line.split('cfg:')
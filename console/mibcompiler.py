@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 14:20
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: mibcompiler.py
+# Tools: PyCharm
+
+"""
+---Compile MIB modules to numeric OIDs and keep them in an on-disk cache---
+
+A module is parsed only when it is not cached yet or its file mtime changed,
+name resolution afterwards never reads MIB text.
+"""
+import os
+import re
+import sys
+import json
+import threading
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_DATA_PATH_ = os.path.join(_ROOT_, 'data')
+_CACHE_FILE_ = os.path.join(_DATA_PATH_, 'mib_cache.json')
+
+# same search path as net-snmp, MIBDIRS in environment comes first
+_MIB_DIRS_ = [os.path.join(_ROOT_, 'mibs'),
+              os.path.join(os.path.expanduser('~'), '.snmp', 'mibs'),
+              '/usr/share/snmp/mibs',
+              '/usr/share/snmp/mibs/iana',
+              '/usr/share/snmp/mibs/ietf',
+              '/usr/local/share/snmp/mibs',
+              '/usr/share/mibs/iana',
+              '/usr/share/mibs/ietf',
+              '/usr/share/mibs/netsnmp']
+
+# OIDs defined by SMI modules themselves with macros, no need to parse them
+_SMI_ROOTS_ = {'ccitt': '0', 'zeroDotZero': '0.0', 'iso': '1', 'joint-iso-ccitt': '2',
+               'org': '1.3', 'dod': '1.3.6', 'internet': '1.3.6.1', 'directory': '1.3.6.1.1',
+               'mgmt': '1.3.6.1.2', 'mib-2': '1.3.6.1.2.1', 'transmission': '1.3.6.1.2.1.10',
+               'experimental': '1.3.6.1.3', 'private': '1.3.6.1.4', 'enterprises': '1.3.6.1.4.1',
+               'security': '1.3.6.1.5', 'snmpV2': '1.3.6.1.6', 'snmpDomains': '1.3.6.1.6.1',
+               'snmpProxys': '1.3.6.1.6.2', 'snmpModules': '1.3.6.1.6.3'}
+_SMI_MODULES_ = ['SNMPv2-SMI', 'RFC1155-SMI', 'RFC-1212', 'RFC-1215', 'SNMPv2-TC', 'SNMPv2-CONF']
+
+_MACROS_ = ['OBJECT-TYPE', 'OBJECT-IDENTITY', 'MODULE-IDENTITY', 'NOTIFICATION-TYPE', 'OBJECT-GROUP',
+            'NOTIFICATION-GROUP', 'MODULE-COMPLIANCE', 'AGENT-CAPABILITIES']
+
+# strings, comments ('--' to '--' or end of line), '::=', punctuation and words
+_TOKEN_ = re.compile(r'"[^"]*"|--.*?(?:--|$)|::=|[{}(),;]|[^\s{}(),;"]+', re.M)
+_MODULE_HEAD_ = re.compile(r'^\s*([A-Za-z][\w-]*)\s+DEFINITIONS\s*(?:IMPLICIT\s+TAGS\s*)?::=\s*BEGIN', re.M)
+_COMPONENT_ = re.compile(r'^([a-z][\w-]*)?(?:\((\d+)\))?$')
+
+
+class MibError(Exception):
+    pass
+
+
+def tokenize(text):
+    return [_token for _token in _TOKEN_.findall(text) if not _token.startswith('--')]
+
+
+def parse_module(text):
+    """
+    :return: (module name, {imported name: module}, {name: [parent, arc, ...]})
+    """
+    _tokens = tokenize(text)
+    try:
+        _module = _tokens[_tokens.index('DEFINITIONS') - 1]
+    except ValueError:
+        raise MibError('no module definition found')
+
+    _imports = {}
+    _definitions = {}
+
+    _i = 0
+    if 'IMPORTS' in _tokens:
+        _i = _tokens.index('IMPORTS') + 1
+        _names = []
+        while _i < len(_tokens) and _tokens[_i] != ';':
+            if _tokens[_i] == 'FROM':
+                _i += 1
+                _imports.update({_name: _tokens[_i] for _name in _names})
+                _names = []
+            elif _tokens[_i] != ',':
+                _names.append(_tokens[_i])
+            _i += 1
+
+    _current = None
+    while _i < len(_tokens):
+        _token = _tokens[_i]
+        _prev = _tokens[_i - 1] if _i > 0 else ''
+
+        if _token in _MACROS_ and _prev[:1].islower():
+            _current = _prev
+        elif _token == 'OBJECT' and _tokens[_i + 1:_i + 3] == ['IDENTIFIER', '::='] and _prev[:1].islower():
+            _current = _prev
+        elif _token == '::=' and _current is not None and _tokens[_i + 1:_i + 2] == ['{']:
+            _end = _tokens.index('}', _i)
+            _definitions[_current] = _parse_oid_value(_tokens[_i + 2:_end])
+            _current = None
+            _i = _end
+        _i += 1
+    return _module, _imports, _definitions
+
+
+def _parse_oid_value(tokens):
+    """
+    { enterprises 2021 } / { iso(1) org(3) 6 } / { 1 3 6 1 } -> [parent or None, arc, ...]
+    """
+    _components = []
+    _text = ' '.join(tokens).replace(' (', '(').replace('( ', '(').replace(' )', ')')
+    for _word in _text.split():
+        if _word.isdigit():
+            _components.append(int(_word))
+            continue
+        _match = _COMPONENT_.match(_word)
+        if _match is None:
+            continue
+        _name, _number = _match.groups()
+        if _number is not None:
+            _components.append(int(_number))
+        elif not _components:
+            _components.append(_name)
+
+    if not _components or isinstance(_components[0], int):
+        _components.insert(0, None)
+    return _components
+
+
+class MibCompiler(object):
+    def __init__(self, mib_dirs=None, cache_file=None):
+        _env_dirs = [_dir for _dir in os.environ.get('MIBDIRS', '').split(':') if _dir]
+        self.mib_dirs = mib_dirs if mib_dirs is not None else _env_dirs + _MIB_DIRS_
+        self.cache_file = cache_file if cache_file is not None else _CACHE_FILE_
+        self.lock = threading.RLock()
+
+        # {module: {'file': path, 'mtime': mtime, 'imports': [module], 'oids': {name: oid}}}
+        self.modules = {}
+        self._file_index = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                self.modules = json.load(f).get('modules', {})
+        except (FileNotFoundError, ValueError):
+            self.modules = {}
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        _tmp = f'{self.cache_file}.{os.getpid()}'
+        with open(_tmp, 'w') as f:
+            json.dump({'modules': self.modules}, f)
+        os.replace(_tmp, self.cache_file)
+
+    def is_fresh(self, module, _seen=None):
+        """
+        module is cached and neither its file nor files of imported modules changed
+        """
+        if module in _SMI_MODULES_:
+            return True
+        _seen = set() if _seen is None else _seen
+        if module in _seen:
+            return True
+        _seen.add(module)
+
+        try:
+            _cached = self.modules[module]
+            if os.path.getmtime(_cached['file']) != _cached['mtime']:
+                return False
+        except (KeyError, OSError):
+            return False
+        return all(self.is_fresh(_import, _seen) for _import in _cached['imports'])
+
+    def find_module_file(self, module):
+        if self._file_index is None:
+            self._file_index = {}
+            for _dir in self.mib_dirs:
+                try:
+                    _names = sorted(os.listdir(_dir))
+                except OSError:
+                    continue
+                for _name in _names:
+                    _path = os.path.join(_dir, _name)
+                    try:
+                        with open(_path, 'r', errors='ignore') as f:
+                            _head = f.read(4096)
+                    except (IsADirectoryError, OSError):
+                        continue
+                    for _module in _MODULE_HEAD_.findall(_head):
+                        self._file_index.setdefault(_module, _path)
+        return self._file_index.get(module)
+
+    def compile(self, module, save=True, _compiling=None):
+        """
+        :return: {name: numeric OID} of module, parsed only if cache is stale
+        """
+        with self.lock:
+            if module in _SMI_MODULES_:
+                return dict(_SMI_ROOTS_)
+            if self.is_fresh(module):
+                return self.modules[module]['oids']
+
+            _compiling = set() if _compiling is None else _compiling
+            _compiling.add(module)
+
+            _file = self.find_module_file(module)
+            if _file is None:
+                raise MibError(f'MIB module [{module}] not found in {self.mib_dirs}')
+            with open(_file, 'r', errors='ignore') as f:
+                _name, _imports, _definitions = parse_module(f.read())
+
+            # only modules compiled are recorded, a missing one must not invalidate the cache every time
+            _compiled_imports = []
+            _imported_oids = {}
+            for _import in sorted(set(_imports.values())):
+                if _import in _compiling:
+                    continue
+                try:
+                    _oids = self.compile(_import, save=False, _compiling=_compiling)
+                except MibError:
+                    continue
+                _compiled_imports.append(_import)
+                _imported_oids.update({_n: _oids[_n] for _n, _m in _imports.items() if _m == _import and _n in _oids})
+
+            _oids = {}
+
+            def _resolve(_symbol, _stack=()):
+                if _symbol in _oids:
+                    return _oids[_symbol]
+                if _symbol in _imported_oids:
+                    return _imported_oids[_symbol]
+                if _symbol in _SMI_ROOTS_ and _symbol not in _definitions:
+                    return _SMI_ROOTS_[_symbol]
+                if _symbol not in _definitions or _symbol in _stack:
+                    return None
+
+                _parent, *_arcs = _definitions[_symbol]
+                _base = _resolve(_parent, _stack + (_symbol,)) if _parent is not None else ''
+                if _base is None:
+                    return None
+                _oids[_symbol] = '.'.join([_base] + [str(_arc) for _arc in _arcs] if _base else map(str, _arcs))
+                return _oids[_symbol]
+
+            for _symbol in _definitions:
+                _resolve(_symbol)
+
+            self.modules[module] = {'file': _file, 'mtime': os.path.getmtime(_file),
+                                    'imports': _compiled_imports, 'oids': _oids}
+            if save:
+                self.save()
+            return _oids
+
+    def resolve(self, name, modules=None):
+        """
+        :param name: 'xivIfStatus' or 'XIV-MIB::xivIfStatus'
+        :param modules: modules to look up, like net-snmp '-m', all cached modules if None
+        :return: (numeric OID, module) or None
+        """
+        if '::' in name:
+            _module, name = name.split('::', 1)
+            modules = [_module]
+        modules = list(self.modules) if not modules else modules
+
+        for _module in modules:
+            try:
+                _oids = self.compile(_module)
+            except (MibError, OSError):
+                continue
+            if name in _oids:
+                return _oids[name], _module
+        return None
+
+
+if __name__ == '__main__':
+    compiler = MibCompiler()
+    for _mib in sys.argv[1:]:
+        print(f'{_mib}: {len(compiler.compile(_mib))} OIDs compiled to [{compiler.cache_file}]')
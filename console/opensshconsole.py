@@ -22,6 +22,10 @@ import tarfile
 import random
 import socket
 import sys
+import time
+import uuid
+import tempfile
+import selectors
 import subprocess
 
 
@@ -32,12 +36,35 @@ _LOG_FILE_ = os.path.join(_LOG_PATH_, 'console.log')
 os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
 
 sys.path.insert(0, _ROOT_)
-from console import ColorLogger
-from console import log_cleaner
+from console import get_logger
+from console import log_enabled
+from console import prober
+
+
+def control_dir():
+    """
+    private directory of ControlMaster sockets, shared by all consoles of this user
+    """
+    _base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    _dir = os.path.join(_base, f'pmc-ssh-{os.getuid()}')
+    os.makedirs(_dir, mode=0o700, exist_ok=True)
+    _stat = os.lstat(_dir)
+    if _stat.st_uid != os.getuid() or _stat.st_mode & 0o077 or not os.path.isdir(_dir) or os.path.islink(_dir):
+        raise PermissionError(f'control directory [{_dir}] is not private')
+    return _dir
 
 
 class OpenSshConsole(object):
-    def __init__(self, hostname, display=True, logfile=None):
+    def __init__(self, hostname, display=True, logfile=None, timeout=30, multiplex=False, control_persist=600,
+                 batch_mode=True):
+        """
+        Args:
+            timeout: default seconds a command may run, the terminal is closed when exceeded
+            multiplex: share one ControlMaster connection per host, every command runs as a 'ssh -S' client
+            control_persist: seconds the master stays after its last client
+            batch_mode: ssh 'BatchMode=yes', only key or agent login, password & keyboard-interactive login fail
+                        instead of prompting. set False to type a password on the terminal as before
+        """
         self.logger_prefix = 'SSH'
         self.logger_suffix = hostname
         self.display = display
@@ -45,126 +72,300 @@ class OpenSshConsole(object):
         self.hostname = hostname
         self.terminal = None
         self.connected = False
+        self.timeout = timeout
+
+        self.multiplex = multiplex
+        self.control_persist = control_persist
+        self.batch_mode = batch_mode
+        self.username = 'root'
+        self.port = 22
+        self.connect_timeout = 10
+
+        # end of every command output, unique so it is never taken for output
+        self.sentinel = f'__EOT_{uuid.uuid4().hex}__'
+        self._buffer = b''
+        self._command = None
+        self._deadline = None
+        self._output = []
+        self._return_code = None
+        self._done = True
 
         self.logfile = logfile if logfile is not None else _LOG_FILE_
         self.home = os.environ['HOME']
 
-    def colorlog(self, msg=None, level=None):
-        msg = '' if msg is None else msg
+    def colorlog(self, msg=None, level=None, *args):
         level = 'debug' if level is None else level
+        if not log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
         # name = self.class_name + ' {:<15s}'.format(self.logger_suffix)
         name = f'{self.logger_prefix:<4s} {self.logger_suffix:<14s}'
-        colorlogger = ColorLogger(name, self.logfile, display=self.display)
-        log_cleaner(self.logfile, 100)
-        colorlogger.colorlog(msg, level)
+        colorlogger = get_logger(name, self.logfile, display=self.display, max_size=100)
+        colorlogger.colorlog(msg, level, *args)
 
     def is_port_open(self, hostname=None, port=None):
         hostname = hostname if hostname is not None else self.hostname
         port = port if port is not None else 22
 
-        _output = subprocess.getstatusoutput(f'nc -v -z -w1 {hostname} {port}')
-        _return = _output[0]
-        for _line in _output[1].split('\n'):
-            self.colorlog(_line, 'debug')
-        return True if _return == 0 else False
-        # return True if _output.endswith('(ssh) open') else False
+        return prober.is_port_open(hostname, port, logfile=self.logfile, display=self.display)
 
     def ssh_connect(self, hostname=None, port=22, username=None, timeout=10):
 
         self.colorlog(f'Attempting connect to server {hostname} with port {port}.', 'debug')
 
-        hostname = hostname if hostname is not None else self.hostname
-        username = username if username is not None else 'root'
+        self.hostname = hostname if hostname is not None else self.hostname
+        self.username = username if username is not None else 'root'
+        self.port = port
+        self.connect_timeout = timeout
+
+        if self.multiplex:
+            return self._connect_master()
 
-        ssh_cmd = f'ssh {username}@{hostname} -T -o ConnectTimeout={timeout}'
         try:
-            self.terminal = subprocess.Popen(ssh_cmd,
+            self.terminal = subprocess.Popen(self._ssh_args('-T'),
                                              stdin=subprocess.PIPE,
                                              stdout=subprocess.PIPE,
                                              stderr=subprocess.STDOUT,
-                                             shell=True)
-
-            self.terminal.stdin.write(b'echo EOT\n')
-            self.terminal.stdin.flush()
+                                             bufsize=0)
+        except OSError as _e:
+            self.colorlog(_e, 'critical')
+            return self.connected
+        os.set_blocking(self.terminal.stdout.fileno(), False)
+        self._buffer = b''
 
-            while True:
-                line = self.terminal.stdout.readline().decode().strip('\n')
+        # login banner comes before the output of the first command
+        _return_code, _output = self.exec_command('true', timeout=timeout + 5)
+        for _line in _output:
+            self.colorlog(_line, 'debug')
 
-                if line == 'EOT':
-                    break
+        self.connected = _return_code == 0
+        if self.connected:
+            self.colorlog('Connection established!', 'debug')
+        else:
+            self.close()
+        return self.connected
 
-                if self.display:
-                    self.colorlog(line, 'debug')
+    def _ssh_args(self, *options):
+        # BatchMode, a password prompt of an unattended run would wait on the tty forever
+        _args = ['ssh', '-p', str(self.port), '-o', f'ConnectTimeout={self.connect_timeout}',
+                 '-o', f'BatchMode={"yes" if self.batch_mode else "no"}']
+        if self.multiplex:
+            # %C, hash of host, port and user keeps the socket path short
+            _args += ['-o', f'ControlPath={os.path.join(control_dir(), "%C")}']
+        return _args + list(options) + [f'{self.username}@{self.hostname}']
 
-            self.colorlog('Connection established!', 'debug')
-            self.connected = True
+    def _control(self, operation):
+        """
+        :return: return code of 'ssh -O operation', checking or stopping the master
+        """
+        try:
+            return subprocess.run(self._ssh_args('-O', operation), stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  timeout=self.connect_timeout).returncode
+        except (OSError, subprocess.TimeoutExpired) as _e:
+            self.colorlog(_e, 'warn')
+        return -1
 
-        except BrokenPipeError as _e:
+    def _connect_master(self):
+        """
+        start the ControlMaster of host unless another console has started it already,
+        key exchange and authentication happen only here.
+        """
+        try:
+            if self._control('check') != 0:
+                self.colorlog(f'Start ControlMaster, persist [{self.control_persist}s].', 'debug')
+                # -f, backgrounds after authentication, lifetime left to ControlPersist
+                subprocess.run(self._ssh_args('-M', '-N', '-f', '-o', f'ControlPersist={self.control_persist}'),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               timeout=self.connect_timeout + 5)
+        except (OSError, subprocess.TimeoutExpired) as _e:
             self.colorlog(_e, 'critical')
 
+        self.connected = self._control('check') == 0
+        if self.connected:
+            self.colorlog('Connection established via ControlMaster!', 'debug')
+        else:
+            self.colorlog(f'ControlMaster of [{self.hostname}] not running.', 'critical')
         return self.connected
 
-    def exec_command(self, command, timeout=None):
-        command = f'{command}\n'.encode()
-        end_of_term = 'echo EOT $?\n'.encode()
+    def stop_master(self):
+        if self.multiplex:
+            self._control('exit')
+        self.close()
 
-        _return_code = 0
-        _output = []
+    def fileno(self):
+        """
+        terminal output, registered with selectors to wait on many consoles at once
+        """
+        return self.terminal.stdout.fileno()
 
-        try:
-            self.terminal.stdin.write(command)
-            self.terminal.stdin.write(end_of_term)
-            self.terminal.stdin.flush()
+    def _kill_terminal(self):
+        if self.terminal is not None and self.terminal.poll() is None:
+            self.terminal.kill()
+            self.terminal.wait()
 
-            while True:
-                line = self.terminal.stdout.readline().decode().strip('\n')
+    def close(self):
+        """
+        the ControlMaster is not stopped, it leaves after 'control_persist'
+        """
+        self._kill_terminal()
+        self.connected = False
 
-                if line.startswith('EOT'):
-                    _return_code = line.split()[-1]
-                    break
+    def _start_client(self, command):
+        """
+        one 'ssh -S' client per command, cheap as it goes through the master
+        """
+        try:
+            self.terminal = subprocess.Popen(self._ssh_args('-o', 'ControlMaster=no') + [command],
+                                             stdin=subprocess.DEVNULL,
+                                             stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT,
+                                             bufsize=0)
+        except OSError as _e:
+            self.colorlog(_e, 'critical')
+            self._done = True
+            return
+        os.set_blocking(self.terminal.stdout.fileno(), False)
+        self._buffer = b''
+
+    def send_command(self, command, timeout=None):
+        """
+        write command to the terminal without waiting, 'read_available' collects its output
+        """
+        self._command = command
+        self._deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        self._output = []
+        self._return_code = None
+        self._done = False
 
-                _output.append(line)
+        if self.multiplex:
+            self._start_client(command)
+            return
 
-                if self.display:
-                    self.colorlog(line, 'debug')
+        if self.terminal is None or self.terminal.poll() is not None:
+            self.colorlog(f'[{self.hostname}] terminal not running.', 'critical')
+            self._done = True
+            return
 
-        except BrokenPipeError as _e:
+        try:
+            self.terminal.stdin.write(f'{command}\necho {self.sentinel} $?\n'.encode())
+            self.terminal.stdin.flush()
+        except (BrokenPipeError, ValueError) as _e:
             self.colorlog(_e, 'critical')
+            self.close()
+            self._done = True
+
+    def read_available(self):
+        """
+        consume what the terminal has written so far
+        :return: True once the command finished or the terminal is gone
+        """
+        while not self._done:
+            try:
+                _data = os.read(self.fileno(), 65536)
+            except BlockingIOError:
+                break
+            except (OSError, AttributeError) as _e:
+                self.colorlog(_e, 'critical')
+                _data = b''
+
+            if not _data and self.multiplex:
+                # client exits with the command, its exit status is the return code
+                if self._buffer:
+                    self._output.append(self._buffer.decode(errors='replace'))
+                    self._buffer = b''
+                self._return_code = self.terminal.wait()
+                self._done = True
+                break
+
+            if not _data:
+                self.colorlog(f'[{self.hostname}] terminal closed while running [{self._command}].', 'critical')
+                self.close()
+                self._done = True
+                break
+
+            *_lines, self._buffer = (self._buffer + _data).split(b'\n')
+            for _line in _lines:
+                _line = _line.decode(errors='replace')
+                _pos = _line.find(self.sentinel)
+                if _pos < 0:
+                    self._output.append(_line)
+                    if self.display:
+                        self.colorlog(_line, 'debug')
+                    continue
+
+                # output without trailing newline shares the line with the sentinel
+                if _pos > 0:
+                    self._output.append(_line[:_pos])
+                try:
+                    self._return_code = int(_line[_pos + len(self.sentinel):])
+                except ValueError:
+                    pass
+                self._done = True
+        return self._done
+
+    def cancel(self):
+        """
+        stop the command which missed its deadline, the terminal is closed
+        since its late output could not be told from the output of the next command,
+        with multiplex only the client of the command is killed.
+        """
+        if not self._done:
+            self.colorlog(f'Command [{self._command}] not finished in time, cancelled.', 'critical')
+            self._kill_terminal() if self.multiplex else self.close()
+            self._done = True
 
-        return _return_code, _output
+    @property
+    def deadline(self):
+        return self._deadline
+
+    @property
+    def result(self):
+        """
+        (return code, output list) of the last command sent
+        """
+        return self._return_code, self._output
+
+    def exec_command(self, command, timeout=None):
+        self.send_command(command, timeout=timeout)
+
+        with selectors.DefaultSelector() as _selector:
+            if not self._done:
+                _selector.register(self, selectors.EVENT_READ)
+            while not self.read_available():
+                _remain = self._deadline - time.monotonic()
+                if _remain <= 0:
+                    self.cancel()
+                    break
+                _selector.select(_remain)
+
+        return self.result
 
     def getoutput(self, command, timeout=None) -> list:
         """
         return output list after executed.
         """
         _output = []
-        _return_code = 0
         self.colorlog(f'Send command [{command}] to remote host.', 'debug')
 
         if not self.connected:
             self.colorlog(f'[{self.hostname}] not connected.', 'critical')
 
         else:
-            try:
-                _return_code, _output = self.exec_command(command, timeout=timeout)
-            except ValueError:
-                pass
+            _return_code, _output = self.exec_command(command, timeout=timeout)
 
         return _output
 
     def getstatusoutput(self, command, timeout=None):
         _output = []
-        _return_code = 0
+        _return_code = None
         self.colorlog(f'Send command [{command}] to remote host.', 'debug')
 
         if not self.connected:
             self.colorlog(f'[{self.hostname}] not connected.', 'critical')
 
         else:
-            try:
-                _return_code, _output = self.exec_command(command, timeout=timeout)
-            except ValueError:
-                pass
+            _return_code, _output = self.exec_command(command, timeout=timeout)
 
         _output.insert(0, _return_code)
         return _output
@@ -202,6 +403,39 @@ class OpenSshConsole(object):
         return True if _return_code == 0 else False
 
 
+def run_sessions(commands, timeout=None):
+    """
+    run one command on each of many consoles, all waited on from this thread
+    :param commands: [(OpenSshConsole, command)], one command per console
+    :return: [(return code, output list)] in order of commands, return code None if not finished
+    """
+    _selector = selectors.DefaultSelector()
+    _waiting = set()
+    try:
+        for _console, _command in commands:
+            _console.send_command(_command, timeout=timeout)
+            if not _console.read_available():
+                _selector.register(_console, selectors.EVENT_READ)
+                _waiting.add(_console)
+
+        while _waiting:
+            _remain = min(_console.deadline for _console in _waiting) - time.monotonic()
+            for _key, _mask in _selector.select(max(_remain, 0)):
+                if _key.fileobj.read_available():
+                    _selector.unregister(_key.fileobj)
+                    _waiting.discard(_key.fileobj)
+
+            _now = time.monotonic()
+            for _console in [_console for _console in _waiting if _console.deadline <= _now]:
+                _selector.unregister(_console)
+                _waiting.discard(_console)
+                _console.cancel()
+    finally:
+        _selector.close()
+
+    return [_console.result for _console, _command in commands]
+
+
 if __name__ == '__main__':
     ssh = OpenSshConsole('192.168.1.1')
     ssh.ssh_connect(username='user1')
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 18:02
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: prober.py
+# Tools: PyCharm
+
+"""
+---Probe addresses of many devices in parallel without forking 'nc'---
+
+TCP ports are tested with non-blocking connects, SNMP ports with a request built
+from the device snmp args, every address of every device shares one timeout window.
+"""
+import os
+import time
+import errno
+import random
+import socket
+import selectors
+try:
+    import busybox
+    import snmpengine
+except ModuleNotFoundError:
+    from . import busybox
+    from . import snmpengine
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_LOG_PATH_ = os.path.join(_ROOT_, 'log')
+_LOGFILE_ = os.path.join(_LOG_PATH_, 'console.log')
+os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
+
+# sysUpTime.0, answered by every agent
+_PROBE_OID_ = '1.3.6.1.2.1.1.3.0'
+_DEFAULT_SNMP_ARGS_ = '-v2c -c public'
+
+OPEN = 'open'
+CLOSED = 'closed'
+PENDING = 'pending'
+
+
+def snmp_probe_packet(snmp_args=None):
+    """
+    GET of the version & community in snmp_args, the engine discovery for v3 which needs no credentials.
+    encoded without a session, no transport is opened & cached for a probed address
+    """
+    _args = snmpengine.parse_snmp_args(snmp_args or _DEFAULT_SNMP_ARGS_)
+    _version = str(_args.get('version', '2c')).lower().lstrip('v')
+    if _version == '3':
+        return snmpengine.encode_discovery(random.getrandbits(31), random.getrandbits(31))
+    _pdu = snmpengine.encode_pdu(snmpengine.GET_REQUEST, random.getrandbits(31), [_PROBE_OID_])
+    try:
+        return snmpengine.encode_message(_version, _args.get('community', 'public'), _pdu)
+    except snmpengine.SnmpError:
+        # unknown version, the session would refuse it too, v2c still tells whether agent answers
+        return snmpengine.encode_message('2c', _args.get('community', 'public'), _pdu)
+
+
+class ReachabilityProber(object):
+    def __init__(self, timeout=1.0, logfile=None, display=False):
+        self.timeout = timeout
+        self._log_file = _LOGFILE_ if logfile is None else logfile
+        self.display = display
+
+    def colorlog(self, msg=None, level=None, *args):
+        level = 'debug' if level is None else level
+        if not busybox.log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
+        name = f'{"PROB":<4s} {"reachability":<14s}'
+        colorlogger = busybox.get_logger(name, self._log_file, display=self.display, max_size=50)
+        colorlogger.colorlog(msg, level, *args)
+
+    def _open_tcp(self, selector, address, port, target):
+        _family, _type, _proto, _name, _sockaddr = socket.getaddrinfo(address, port, type=socket.SOCK_STREAM)[0]
+        _sock = socket.socket(_family, _type, _proto)
+        _sock.setblocking(False)
+        _return = _sock.connect_ex(_sockaddr)
+        if _return not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            _sock.close()
+            return CLOSED
+        selector.register(_sock, selectors.EVENT_WRITE, target)
+        return PENDING
+
+    def _open_udp(self, selector, address, port, snmp_args, target):
+        _packet = snmp_probe_packet(snmp_args)
+        _family, _type, _proto, _name, _sockaddr = socket.getaddrinfo(address, port, type=socket.SOCK_DGRAM)[0]
+        _sock = socket.socket(_family, _type, _proto)
+        _sock.setblocking(False)
+        _sock.connect(_sockaddr)
+        _sock.send(_packet)
+        selector.register(_sock, selectors.EVENT_READ, target)
+        return PENDING
+
+    @staticmethod
+    def _event_state(sock, udp):
+        if udp:
+            try:
+                sock.recv(65535)
+                return OPEN
+            except (ConnectionRefusedError, ConnectionResetError):
+                return CLOSED
+            except BlockingIOError:
+                return PENDING
+        return OPEN if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0 else CLOSED
+
+    @staticmethod
+    def _choose(states):
+        """
+        first address in configured order which is open, None while an earlier one is still pending
+        """
+        for _address, _state in states.items():
+            if _state == OPEN:
+                return _address
+            if _state == PENDING:
+                return None
+        return None
+
+    def probe(self, devices):
+        """
+        :param devices: {key: (addresses, port, udp, snmp_args)}
+        :return: {key: first reachable address in configured order or None}
+        """
+        _states = {_key: {} for _key in devices}
+        _selector = selectors.DefaultSelector()
+        try:
+            for _key, (_addresses, _port, _udp, _snmp_args) in devices.items():
+                for _address in _addresses or []:
+                    if not _address or _address in _states[_key]:
+                        continue
+                    _target = (_key, _address, _udp)
+                    try:
+                        if _udp:
+                            _states[_key][_address] = self._open_udp(_selector, _address, _port, _snmp_args, _target)
+                        else:
+                            _states[_key][_address] = self._open_tcp(_selector, _address, _port, _target)
+                    except (OSError, snmpengine.SnmpError) as _e:
+                        self.colorlog(f'probe address [{_address}] port [{_port}] failed: {_e}', 'warn')
+                        _states[_key][_address] = CLOSED
+
+            _deadline = time.monotonic() + self.timeout
+            _undecided = {_key for _key in devices if PENDING in _states[_key].values()
+                          and self._choose(_states[_key]) is None}
+            while _undecided:
+                _remain = _deadline - time.monotonic()
+                if _remain <= 0:
+                    break
+                for _selected, _mask in _selector.select(_remain):
+                    _key, _address, _udp = _selected.data
+                    _state = self._event_state(_selected.fileobj, _udp)
+                    if _state == PENDING:
+                        continue
+                    _states[_key][_address] = _state
+                    _selector.unregister(_selected.fileobj)
+                    _selected.fileobj.close()
+                    if self._choose(_states[_key]) is not None or PENDING not in _states[_key].values():
+                        _undecided.discard(_key)
+        finally:
+            for _selected in list(_selector.get_map().values()):
+                _selected.fileobj.close()
+            _selector.close()
+
+        _result = {}
+        for _key, (_addresses, _port, _udp, _snmp_args) in devices.items():
+            # at the deadline pending addresses count as closed
+            _opened = [_address for _address, _state in _states[_key].items() if _state == OPEN]
+            _result[_key] = _opened[0] if _opened else None
+            for _address, _state in _states[_key].items():
+                _state = CLOSED if _state == PENDING else _state
+                self.colorlog(f'IP address [{_address}] {"udp " if _udp else ""}port [{_port}] is {_state}',
+                              'info' if _state == OPEN else 'warn')
+        return _result
+
+
+def is_port_open(address, port, udp=False, timeout=1.0, snmp_args=None, logfile=None, display=False):
+    _prober = ReachabilityProber(timeout=timeout, logfile=logfile, display=display)
+    return _prober.probe({address: ([address], port, udp, snmp_args)})[address] is not None
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 23:30
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: resultstore.py
+# Tools: PyCharm
+
+"""
+---Check states & numeric metrics of every run in an embedded SQLite (WAL) database---
+
+Device, check and metric names are stored once in table 'names', rows of a run
+are buffered and written in one transaction by commit(), history is queried by
+device, name and time range without touching any device.
+"""
+import os
+import re
+import time
+import sqlite3
+try:
+    import busybox
+except ModuleNotFoundError:
+    from . import busybox
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_LOG_PATH_ = os.path.join(_ROOT_, 'log')
+_LOGFILE_ = os.path.join(_LOG_PATH_, 'console.log')
+_DATA_PATH_ = os.path.join(_ROOT_, 'data')
+_DB_FILE_ = os.path.join(_DATA_PATH_, 'pm_results.db')
+os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
+
+# colors of PASSED, FAILED & UNKNOWN are not stored
+_ANSI_ = re.compile(r'\033\[[0-9;]*m')
+
+_SCHEMA_ = '''
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS results (
+    device_id INTEGER NOT NULL,
+    check_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (device_id, check_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metrics (
+    device_id INTEGER NOT NULL,
+    metric_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (device_id, metric_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_ts ON results (ts);
+CREATE INDEX IF NOT EXISTS metrics_ts ON metrics (ts);
+'''
+
+
+def plain_status(state):
+    return _ANSI_.sub('', str(state)).strip()
+
+
+class ResultStore(object):
+    def __init__(self, path=None, logfile=None, display=False):
+        """
+        Args:
+            path: database file, 'data/pm_results.db' by default
+        """
+        self.path = _DB_FILE_ if path is None else path
+        self._log_file = _LOGFILE_ if logfile is None else logfile
+        self.display = display
+
+        self.conn = None
+        # {name: id} of table 'names'
+        self._ids = {}
+        # rows buffered until commit()
+        self._results = []
+        self._metrics = []
+
+    def colorlog(self, msg=None, level=None, *args):
+        level = 'debug' if level is None else level
+        if not busybox.log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
+        name = f'{"STOR":<4s} {"results":<14s}'
+        colorlogger = busybox.get_logger(name, self._log_file, display=self.display, max_size=50)
+        colorlogger.colorlog(msg, level, *args)
+
+    def connect(self):
+        if self.conn is None:
+            _dir = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(_dir, exist_ok=True)
+            self.conn = sqlite3.connect(self.path)
+            # readers of history never block the writer of a run
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(_SCHEMA_)
+            self._ids = {_name: _id for _id, _name in self.conn.execute('SELECT id, name FROM names')}
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+        self.conn = None
+
+    def _name_id(self, name):
+        _id = self._ids.get(name)
+        if _id is None:
+            self.conn.execute('INSERT OR IGNORE INTO names (name) VALUES (?)', (name,))
+            _id = self.conn.execute('SELECT id FROM names WHERE name = ?', (name,)).fetchone()[0]
+            self._ids[name] = _id
+        return _id
+
+    def add_result(self, device, check, status, ts=None):
+        self._results.append((device, check, int(time.time() if ts is None else ts), plain_status(status)))
+
+    def add_metric(self, device, metric, value, ts=None):
+        try:
+            _value = float(value)
+        except (TypeError, ValueError):
+            return
+        self._metrics.append((device, metric, int(time.time() if ts is None else ts), _value))
+
+    def add_records(self, device, states, metrics, ts=None):
+        """
+        :param states: {check name: state} of one device, None for checks not run
+        :param metrics: {metric name: number} of one device
+        """
+        _ts = int(time.time() if ts is None else ts)
+        for _check, _state in states.items():
+            if _state is None:
+                continue
+            self.add_result(device, _check, _state, _ts)
+        for _metric, _value in metrics.items():
+            self.add_metric(device, _metric, _value, _ts)
+
+    def commit(self):
+        """
+        write the buffered rows of a run in one transaction
+        :return: number of rows written
+        """
+        if not self._results and not self._metrics:
+            return 0
+        self.connect()
+        _results, self._results = self._results, []
+        _metrics, self._metrics = self._metrics, []
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO results (device_id, check_id, ts, status) VALUES (?, ?, ?, ?)',
+                    [(self._name_id(_d), self._name_id(_c), _ts, _s) for _d, _c, _ts, _s in _results])
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO metrics (device_id, metric_id, ts, value) VALUES (?, ?, ?, ?)',
+                    [(self._name_id(_d), self._name_id(_m), _ts, _v) for _d, _m, _ts, _v in _metrics])
+        except sqlite3.Error as _e:
+            # ids of names rolled back with the transaction
+            self._ids = {}
+            self.colorlog(f'write {len(_results)} results & {len(_metrics)} metrics failed: {_e}', 'error')
+            return 0
+        self.colorlog(f'{len(_results)} results & {len(_metrics)} metrics written to [{self.path}]', 'debug')
+        return len(_results) + len(_metrics)
+
+    def _query(self, table, name_column, value_column, device, name, since, until):
+        self.connect()
+        _where = []
+        _args = []
+        if device is not None:
+            _where.append('d.name = ?')
+            _args.append(device)
+        if name is not None:
+            _where.append('n.name = ?')
+            _args.append(name)
+        if since is not None:
+            _where.append('t.ts >= ?')
+            _args.append(int(since))
+        if until is not None:
+            _where.append('t.ts < ?')
+            _args.append(int(until))
+        _sql = f'SELECT d.name, n.name, t.ts, t.{value_column} FROM {table} t ' \
+               f'JOIN names d ON d.id = t.device_id JOIN names n ON n.id = t.{name_column}'
+        _sql += f' WHERE {" AND ".join(_where)}' if _where else ''
+        return self.conn.execute(_sql + ' ORDER BY t.ts, d.name, n.name', _args).fetchall()
+
+    def results(self, device=None, check=None, since=None, until=None):
+        """
+        :return: [(device, check, ts, status)] in time order, since <= ts < until
+        """
+        return self._query('results', 'check_id', 'status', device, check, since, until)
+
+    def metrics(self, device=None, metric=None, since=None, until=None):
+        """
+        :return: [(device, metric, ts, value)] in time order, since <= ts < until
+        """
+        return self._query('metrics', 'metric_id', 'value', device, metric, since, until)
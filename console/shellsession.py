@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 20:10
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: shellsession.py
+# Tools: PyCharm
+
+"""
+---Interactive PTY shell kept open on the transport of a SshConsole---
+
+Commands are typed into one login shell and their output is read up to the next
+prompt, so state of the shell like Brocade VF context ('setcontext') survives
+between commands.
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import codecs
+import socket
+import paramiko
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.join(_HOME_, '..')
+
+sys.path.insert(0, _ROOT_)
+from console.sshconsole import SshConsole
+
+
+def prompt_pattern(user='admin'):
+    """
+    prompt shapes of 'SwitchLogDecoder.is_line_data_or_prompt':
+        SNS2224:admin>
+        SNS3096-BC01:FID128:admin>
+    """
+    return re.compile(rf'^([\w.\-]+)(?::(FID\d+))?:{re.escape(user)}> ?$')
+
+
+class ShellSession(object):
+    def __init__(self, console, user='admin', timeout=30, width=4096):
+        """
+        Args:
+            console: connected SshConsole, the shell is a channel on its transport
+            user: login user, part of the prompt
+            timeout: seconds to wait for the prompt after a command
+            width: terminal columns, wide enough that command echo is never wrapped
+        """
+        self.console = console
+        self.user = user
+        self.timeout = timeout
+        self.width = width
+
+        self.channel = None
+        self.prompt = None
+        # 'FID128' while the prompt shows a VF context, else None
+        self.context = None
+        self._prompt_re = prompt_pattern(user)
+
+    def colorlog(self, msg=None, level=None, *args):
+        self.console.colorlog(msg, level, *args)
+
+    @property
+    def is_open(self):
+        return self.channel is not None and not self.channel.closed
+
+    def open(self):
+        try:
+            self.channel = self.console.get_transport().open_session()
+            self.channel.get_pty(term='vt100', width=self.width)
+            self.channel.invoke_shell()
+            list(self._iter_until_prompt(self.timeout))
+            self.colorlog(f'Shell opened, prompt [{self.prompt}].', 'debug')
+            return True
+        except (AttributeError, EOFError, OSError, paramiko.ssh_exception.SSHException) as _e:
+            self.colorlog(f'Open shell failed: {_e}', 'critical')
+        self.close()
+        return False
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+        self.channel = None
+
+    def _iter_until_prompt(self, timeout):
+        """
+        yield lines received before the prompt, raise socket.timeout or EOFError
+        """
+        _decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        # prompt never contains newline, only the unfinished last line is matched
+        _rest = ''
+        _deadline = time.monotonic() + timeout
+        while True:
+            _match = self._prompt_re.match(_rest)
+            if _match is not None:
+                break
+            _remain = _deadline - time.monotonic()
+            if _remain <= 0:
+                raise socket.timeout(f'no prompt within {timeout}s, last line [{_rest}]')
+            self.channel.settimeout(_remain)
+            _data = self.channel.recv(32768)
+            if not _data:
+                raise EOFError('shell closed by remote host')
+            *_lines, _rest = (_rest + _decoder.decode(_data).replace('\r', '')).split('\n')
+            yield from _lines
+
+        self.prompt = _rest.strip()
+        self.context = _match.group(2)
+
+    def iter_run(self, command, timeout=None):
+        """
+        yield output lines of command typed into the shell as they arrive
+        """
+        if not self.is_open and not self.open():
+            return
+
+        self.colorlog(f'Send command [{command}] to shell.', 'debug')
+        _echo = True
+        _finished = False
+        try:
+            self.channel.sendall(f'{command}\n'.encode())
+            for _line in self._iter_until_prompt(timeout if timeout is not None else self.timeout):
+                # terminal echo of the command
+                if _echo:
+                    _echo = False
+                    if _line.strip() == command.strip():
+                        continue
+                yield _line
+            _finished = True
+        except (EOFError, OSError, paramiko.ssh_exception.SSHException) as _e:
+            self.colorlog(f'Command [{command}] failed: {_e}', 'error')
+        finally:
+            # output not read up to the prompt would be taken for the next command
+            if not _finished:
+                self.colorlog(f'Shell closed before prompt of [{command}], context [{self.context}] is lost.', 'warn')
+                self.close()
+
+    def run(self, command, timeout=None) -> list:
+        """
+        return output list of command typed into the shell, as getoutput does
+        """
+        return list(self.iter_run(command, timeout=timeout))
+
+    def run_batch(self, commands, timeout=None) -> list:
+        """
+        commands on one line separated by exit code sentinels, like SshConsole.run_batch
+        :return: [(exit code, output list)] in order of commands
+        """
+        commands = list(commands)
+        _head, _tail = '__PMC_', f'{uuid.uuid4().hex}__'
+        # sentinel quoted in two parts, so the echo of the line itself does not contain it
+        _line = '; '.join(f'{_command}; echo "{_head}""{_tail} {_i} $?"' for _i, _command in enumerate(commands))
+        return SshConsole.split_batch_output(self.run(_line, timeout=timeout), _head + _tail, len(commands))
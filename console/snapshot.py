@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/19/26 00:20
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: snapshot.py
+# Tools: PyCharm
+
+"""
+---Digest of every check of every device, compared with the previous run---
+
+Only checks whose state changed since the snapshot are reported, the snapshot
+is a small json file of {device: {check: digest}} saved after every run.
+"""
+import os
+import json
+import hashlib
+import threading
+try:
+    from resultstore import plain_status
+except ModuleNotFoundError:
+    from .resultstore import plain_status
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_DATA_PATH_ = os.path.join(_ROOT_, 'data')
+_SNAPSHOT_FILE_ = os.path.join(_DATA_PATH_, 'pm_snapshot.json')
+# the daemon compares single checks of a tick, kept apart from the full runs of 'pm_snapshot.json'
+DAEMON_SNAPSHOT_FILE = os.path.join(_DATA_PATH_, 'pm_daemon_snapshot.json')
+
+# check name of the detail lines (failed ports, alarms, events) of a device
+DETAILS = 'details'
+
+
+def digest(value):
+    """
+    colors are not part of the state, the same text in another color is no change
+    """
+    if isinstance(value, (list, tuple)):
+        value = '\n'.join(plain_status(_line) for _line in value)
+    return hashlib.sha1(plain_status(value).encode()).hexdigest()[:16]
+
+
+class Snapshot(object):
+    def __init__(self, snapshot_file=None):
+        self.snapshot_file = snapshot_file if snapshot_file is not None else _SNAPSHOT_FILE_
+        self.lock = threading.Lock()
+
+        # {device: {check: digest}}
+        self.digests = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                self.digests = json.load(f).get('digests', {})
+        except (FileNotFoundError, ValueError):
+            self.digests = {}
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_file)), exist_ok=True)
+        _tmp = f'{self.snapshot_file}.{os.getpid()}'
+        with self.lock, open(_tmp, 'w') as f:
+            json.dump({'digests': self.digests}, f)
+        os.replace(_tmp, self.snapshot_file)
+
+    def changed(self, device, states, details=()):
+        """
+        keep the new digests of device and return what differs from the snapshot
+        :param states: {check name: state}, None for checks not run
+        :param details: lines explaining failed states, compared as one check 'details', None keeps the digest
+        :return: {check name: state} changed or new since the snapshot, details included if changed
+        """
+        _states = {_check: _state for _check, _state in states.items() if _state is not None}
+        if details is not None:
+            _states[DETAILS] = list(details)
+        with self.lock:
+            _previous = self.digests.setdefault(device, {})
+            _known = DETAILS in _previous
+            _changed = {}
+            for _check, _state in _states.items():
+                _digest = digest(_state)
+                if _previous.get(_check) != _digest:
+                    _changed[_check] = _state
+                    _previous[_check] = _digest
+        # no detail lines in the first run is no news
+        if _changed.get(DETAILS) == [] and not _known:
+            _changed.pop(DETAILS)
+        return _changed
+
+    def render(self, device, states, details=()):
+        """
+        print the checks of device changed since the snapshot, nothing if none changed
+        :return: {check name: state} printed
+        """
+        _changed = self.changed(device, states, details)
+        if not _changed:
+            return _changed
+
+        print('\n', '=' * 80, sep='')
+        print('-' * 30, f'{device:^20s}', '-' * 30, sep='')
+        for _check, _state in _changed.items():
+            if _check == DETAILS:
+                _state = 'cleared' if not _state else f'{len(_state)} lines'
+            print(f'{_check:<30s}{plain_status(_state):.>50s}')
+        if _changed.get(DETAILS):
+            print('-' * 80)
+            for _line in _changed[DETAILS]:
+                print(plain_status(_line))
+            print('-' * 80)
+        return _changed
@@ -14,22 +14,29 @@
 ---Short description of this Python module---
 
 """
-import subprocess
 import os
+import time
+import threading
 try:
     import busybox
+    import snmpengine
+    import mibcompiler
+    import snmprows
+    import prober
 except ModuleNotFoundError:
     from . import busybox
+    from . import snmpengine
+    from . import mibcompiler
+    from . import snmprows
+    from . import prober
 
+# numeric prefixes net-snmp prints without any MIB loaded
+_OID_LABELS_ = [('1.3.6.1.4.1', 'SNMPv2-SMI::enterprises'),
+                ('1.3.6.1.2.1', 'SNMPv2-SMI::mib-2'),
+                ('1.3.6.1.6.3', 'SNMPv2-SMI::snmpModules'),
+                ('1', 'iso')]
 
-# windows platform has no command 'which'
-# _SNMPWALK_ = subprocess.getoutput('which snmpwalk')
-# _SNMPGET_ = subprocess.getoutput('which snmpget')
-# _SNMPTABLE_ = subprocess.getoutput('which snmptable')
-
-_SNMPWALK_ = 'snmpwalk'
-_SNMPGET_ = 'snmpget'
-_SNMPTABLE_ = 'snmptable'
+_EXCEPTION_TEXT_ = snmprows.EXCEPTION_TEXT
 
 _HOME_ = os.path.abspath(os.path.dirname(__file__))
 _ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
@@ -37,11 +44,51 @@ _LOG_PATH_ = os.path.join(_ROOT_, 'log')
 _LOGFILE_ = os.path.join(_LOG_PATH_, 'console.log')
 os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
 
+# compiled MIB names loaded once per process, MIB text is parsed only when the cache is stale
+_MIB_COMPILER_ = mibcompiler.MibCompiler()
+
+
+class SnmpResultCache(object):
+    """
+    results of requests keyed by (agent, port, method, args), expired after ttl seconds
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.results = {}
+
+    def get(self, key):
+        with self.lock:
+            try:
+                _stored, _result = self.results[key]
+            except KeyError:
+                return None
+            if time.monotonic() - _stored > self.ttl:
+                del self.results[key]
+                return None
+            return _result
+
+    def put(self, key, result):
+        with self.lock:
+            self.results[key] = (time.monotonic(), result)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
 
 class SnmpConsole(object):
+    # symbolic name -> (numeric OID, MIB module), shared by all consoles of this process
+    resolved_oids = {}
+
+    # subtrees answered the same in every context of an agent, like chassis sensors of a switch with VFs,
+    # their results are shared through chassis_cache by all consoles of the agent
+    chassis_oids = ()
+    chassis_cache = SnmpResultCache()
+
     def __init__(self, agent, *args,
                  logfile=None, display=True,
-                 retries=2, timeout=3, port=161):
+                 retries=2, timeout=3, port=161, max_repetitions=25):
         self.args = ' '.join(args)
         # self.args = args
         self.agent = agent
@@ -58,24 +105,286 @@ class SnmpConsole(object):
         self.args = f'-r {self.retries} -t {self.timeout} {self.args}'
         self.colorlog(f'detected snmp args [{self.args}]', 'debug')
 
-    def colorlog(self, msg=None, level=None):
-        msg = '' if msg is None else msg
+        self.session_args = snmpengine.parse_snmp_args(self.args)
+        # '-Cr<NUM>' in snmp args wins over the keyword
+        self.session_args.setdefault('max_repetitions', max_repetitions)
+        self.mibs = self.session_args.get('mibs', '')
+        self.session = None
+        # {(method, args): [VarBind] or SnmpError}, filled by snmppoller.SnmpPoller before checks run
+        self.prefetched = {}
+
+    def colorlog(self, msg=None, level=None, *args):
         level = 'debug' if level is None else level
+        if not busybox.log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
         name = f'{self.logger_prefix:<4s} {self.logger_suffix:<14s}'
-        colorlogger = busybox.ColorLogger(name, self._log_file, display=self.display)
-        busybox.log_cleaner(self._log_file, 50)
-        colorlogger.colorlog(msg, level)
+        colorlogger = busybox.get_logger(name, self._log_file, display=self.display, max_size=50)
+        colorlogger.colorlog(msg, level, *args)
 
     def is_port_open(self):
-        _output = subprocess.getstatusoutput(f'nc -v -z -w1 -u {self.agent} {self.port}')
-        _return = _output[0]
-        for _line in _output[1].split('\n'):
-            self.colorlog(_line, 'debug')
-        return True if _return == 0 else False
+        """
+        agent answers a request built from snmp args within timeout
+        """
+        return prober.is_port_open(self.agent, self.port, udp=True, timeout=self.timeout, snmp_args=self.args,
+                                   logfile=self._log_file, display=self.display)
+
+    def connect(self):
+        """
+        create the engine session on first use, the UDP socket is shared with other consoles of the agent.
+        """
+        if self.session is None:
+            try:
+                self.session = snmpengine.SnmpSession(self.agent, port=self.port, **self.session_args)
+            except (snmpengine.SnmpError, OSError) as _e:
+                self.colorlog(f'create snmp session for [{self.agent}] failed: {_e}', 'error')
+        return self.session
+
+    def resolve_oid(self, oid):
+        """
+        :param oid: numeric OID or symbolic name like 'xivIfStatus', instance suffix is allowed 'xivFailedDisks.0'
+        :return: numeric OID without leading '.', None if name can not be resolved
+        """
+        oid = oid.strip()
+        if snmpengine.is_numeric_oid(oid):
+            return oid.strip('.')
+
+        _name, _, _suffix = oid.partition('.')
+        if _suffix and snmpengine.is_numeric_oid(_suffix):
+            _numeric = self.resolve_oid(_name)
+            return f'{_numeric}.{_suffix}' if _numeric is not None else None
+
+        try:
+            return self.resolved_oids[oid][0]
+        except KeyError:
+            pass
+
+        _modules = [_mib.lstrip('+') for _mib in self.mibs.split(':') if _mib.lstrip('+') not in ('', 'ALL')]
+        with _MIB_COMPILER_.lock:
+            _resolved = _MIB_COMPILER_.resolve(oid, _modules)
+        if _resolved is None:
+            self.colorlog(f'resolve OID [{oid}] with MIBs [{self.mibs}] failed', 'error')
+            return None
+
+        self.resolved_oids[oid] = _resolved
+        self.colorlog(f'resolve OID [{oid}] to [{_resolved[0]}]', 'debug')
+        return _resolved[0]
+
+    def format_oid(self, oid):
+        """
+        label OID like net-snmp does, 'XIV-MIB::xivIfStatus.1004' or 'SNMPv2-SMI::enterprises.1588.2...'
+        """
+        _best = None
+        for _name, (_numeric, _module) in self.resolved_oids.items():
+            if snmpengine.oid_startswith(oid, _numeric) and (_best is None or len(_numeric) > len(_best[0])):
+                _best = (_numeric, f'{_module}::{_name.split("::")[-1]}')
+
+        for _prefix, _label in ([_best] if _best is not None else []) + _OID_LABELS_:
+            if snmpengine.oid_startswith(oid, _prefix):
+                return _label + oid[len(_prefix):]
+        return oid
+
+    def format_value(self, varbind) -> str:
+        """
+        value as 'snmpwalk_format' returns, without type and quotes, '' for NULL and exceptions
+        :param varbind: VarBind(oid, type, value) or snmprows.Row(index, type, value)
+        """
+        _oid, _type, _value = varbind
+        if _type in _EXCEPTION_TEXT_ or _type == 'NULL':
+            return ''
+        if _type in ('Hex-STRING', 'Opaque'):
+            return ' '.join(f'{_byte:02X}' for _byte in _value)
+        if _type == 'OID':
+            return self.format_oid(_value)
+        if _type == 'Timeticks':
+            _seconds, _hundredths = divmod(_value, 100)
+            _minutes, _seconds = divmod(_seconds, 60)
+            _hours, _minutes = divmod(_minutes, 60)
+            _days, _hours = divmod(_hours, 24)
+            _days = f'{_days} day{"s" if _days != 1 else ""}, ' if _days else ''
+            return f'({_value}) {_days}{_hours}:{_minutes:02d}:{_seconds:02d}.{_hundredths:02d}'
+        return str(_value)
+
+    def format_varbind(self, varbind) -> str:
+        _oid, _type, _value = varbind
+        if _type in _EXCEPTION_TEXT_:
+            _text = _EXCEPTION_TEXT_[_type]
+        elif _type == 'STRING':
+            _value = _value.replace('"', '\\"')
+            _text = f'STRING: "{_value}"'
+        elif _type == 'NULL':
+            _text = 'NULL'
+        else:
+            _text = f'{_type}: {self.format_value(varbind)}'
+        return f'{self.format_oid(_oid)} = {_text}'
+
+    @staticmethod
+    def _plan_key(method, *args):
+        return method, tuple(tuple(_arg) if isinstance(_arg, list) else _arg for _arg in args)
+
+    def chassis_key(self, key):
+        """
+        :param key: (method, args) of a request
+        :return: key of chassis_cache if every OID of the request is under chassis_oids, else None
+        """
+        _method, _args = key
+        _oids = [_oid for _arg in _args for _oid in (_arg if isinstance(_arg, tuple) else (_arg,))]
+        if not self.chassis_oids or not _oids:
+            return None
+        for _oid in _oids:
+            if not any(snmpengine.oid_startswith(_oid, _chassis) for _chassis in self.chassis_oids):
+                return None
+        return (self.agent, self.port) + key
+
+    def _session_call(self, method, *args):
+        """
+        call session method, answered from prefetched results if the poller fetched it already,
+        or from chassis_cache if another context of the agent fetched it recently
+        """
+        _key = self._plan_key(method, *args)
+        if _key in self.prefetched:
+            _result = self.prefetched[_key]
+            if isinstance(_result, Exception):
+                raise _result
+            return _result
+
+        _shared = self.chassis_key(_key)
+        if _shared is not None:
+            _result = self.chassis_cache.get(_shared)
+            if _result is not None:
+                self.colorlog('%s %s of %s answered from chassis cache', 'debug', method, list(_key[1]), self.agent)
+                return _result
+
+        _result = getattr(self.session, method)(*args)
+        if _shared is not None:
+            self.chassis_cache.put(_shared, _result)
+        return _result
+
+    def plan_get_many(self, oids):
+        """
+        plan items describe requests of get_many(), walk(), bulkwalk() and walk_table() for snmppoller,
+        :return: (method, args) or None if OID can not be resolved
+        """
+        _numerics = [self.resolve_oid(_oid) for _oid in oids]
+        return None if None in _numerics else self._plan_key('get', _numerics)
+
+    def plan_walk(self, oid, bulk=True):
+        _numeric = self.resolve_oid(oid)
+        return None if _numeric is None else self._plan_key('bulkwalk' if bulk else 'walk', _numeric)
+
+    def plan_walk_table(self, base_oid, columns):
+        _base = self.resolve_oid(base_oid)
+        return None if _base is None else self._plan_key('bulkwalk_columns', [f'{_base}.{_c}' for _c in columns])
+
+    def snmp_plan(self) -> list:
+        """
+        requests the checks of this console will send, overridden by agents polled with snmppoller
+        """
+        return []
+
+    def _request(self, method, oid):
+        """
+        :return: (return code, [VarBind] or error text), return code is 0 if succeeded.
+        """
+        _numeric = self.resolve_oid(oid)
+        if _numeric is None:
+            return 2, f'{oid}: Unknown Object Identifier'
+
+        if self.connect() is None:
+            return 1, f'Timeout: No Response from {self.agent}'
+
+        try:
+            if method == 'get':
+                return 0, self._session_call('get', [_numeric])
+            return 0, self._session_call(method, _numeric)
+        except snmpengine.SnmpTimeout:
+            self.colorlog(f'{method} [{oid}] from {self.agent} timeout', 'warn')
+            return 1, f'Timeout: No Response from {self.agent}'
+        except (snmpengine.SnmpError, OSError) as _e:
+            self.colorlog(f'{method} [{oid}] from {self.agent} failed: {_e}', 'error')
+            return 2, str(_e)
+
+    def _render(self, result) -> str:
+        _return, _varbinds = result
+        if _return != 0:
+            return _varbinds
+        return '\n'.join(self.format_varbind(_vb) for _vb in _varbinds)
+
+    def get(self, oid) -> list:
+        """
+        :return: [VarBind(oid, type, value)], empty list if failed
+        """
+        _return, _varbinds = self._request('get', oid)
+        return _varbinds if _return == 0 else []
+
+    def get_many(self, oids) -> dict:
+        """
+        fetch scalars with one GET request
+        :param oids: list of OIDs or names with instance, like ['xivFailedDisks.0', 'xivMachineStatus.0']
+        :return: {oid as requested: VarBind}, {} if failed
+        """
+        oids = list(oids)
+        self.colorlog(f'snmpget {oids} from {self.agent} with args: [{self.args}]')
+        _numerics = [self.resolve_oid(_oid) for _oid in oids]
+        if None in _numerics or self.connect() is None:
+            return {}
+
+        try:
+            _varbinds = self._session_call('get', _numerics)
+        except snmpengine.SnmpTimeout:
+            self.colorlog(f'snmpget {oids} from {self.agent} timeout', 'warn')
+            return {}
+        except (snmpengine.SnmpError, OSError) as _e:
+            self.colorlog(f'snmpget {oids} from {self.agent} failed: {_e}', 'error')
+            return {}
+        return dict(zip(oids, _varbinds))
+
+    def walk(self, oid) -> list:
+        """
+        :return: [VarBind(oid, type, value)] under the subtree, empty list if failed
+        """
+        _return, _varbinds = self._request('walk', oid)
+        return _varbinds if _return == 0 else []
+
+    def bulkwalk(self, oid) -> list:
+        """
+        walk with GETBULK, falls back to GETNEXT for v1 agents.
+        :return: [VarBind(oid, type, value)] under the subtree, empty list if failed
+        """
+        _return, _varbinds = self._request('bulkwalk', oid)
+        return _varbinds if _return == 0 else []
+
+    def walk_table(self, base_oid, columns) -> dict:
+        """
+        fetch several columns of one table together, every GETBULK request carries all unfinished columns.
+        :param base_oid: OID of the table entry, like '1.3.6.1.4.1.1588.2.1.1.1.6.2.1'
+        :param columns: sub-identifiers of columns under base_oid, like ['36', '3', '4']
+        :return: {index: {column: value}}, values are strings as 'snmpwalk_format' returns, {} if failed
+        """
+        self.colorlog(f'walk table [{base_oid}] columns {list(columns)} from {self.agent} with args: [{self.args}]')
+        _base = self.resolve_oid(base_oid)
+        if _base is None or self.connect() is None:
+            return {}
+
+        _columns = {f'{_base}.{_column}': str(_column) for _column in columns}
+        try:
+            _result = self._session_call('bulkwalk_columns', list(_columns))
+        except snmpengine.SnmpTimeout:
+            self.colorlog(f'walk table [{base_oid}] from {self.agent} timeout', 'warn')
+            return {}
+        except (snmpengine.SnmpError, OSError) as _e:
+            self.colorlog(f'walk table [{base_oid}] from {self.agent} failed: {_e}', 'error')
+            return {}
+
+        _rows = {}
+        for _column_oid, _varbinds in _result.items():
+            for _row in snmprows.rows(_varbinds, _column_oid):
+                _rows.setdefault(snmprows.index_text(_row.index), {})[_columns[_column_oid]] = self.format_value(_row)
+        return _rows
 
     def snmpget(self, oid) -> str:
         self.colorlog(f'snmpget [{oid}] from {self.agent} with args: [{self.args}]')
-        return subprocess.getoutput(f'{_SNMPGET_} {self.args} {self.agent} {oid}')
+        return self._render(self._request('get', oid))
 
     def snmpwalk(self, oid) -> str:
         """
@@ -83,54 +392,77 @@ class SnmpConsole(object):
         :return: strings separated with '\n'
         """
         self.colorlog(f'snmpwalk [{oid}] from {self.agent} with args: [{self.args}]')
-        return subprocess.getoutput(f'{_SNMPWALK_} {self.args} {self.agent} {oid}')
+        return self._render(self._request('walk', oid))
+
+    def snmpbulkwalk(self, oid) -> str:
+        self.colorlog(f'snmpbulkwalk [{oid}] from {self.agent} with args: [{self.args}]')
+        return self._render(self._request('bulkwalk', oid))
 
     def snmpwalkstatus(self, oid) -> tuple:
         self.colorlog(f'snmpwalk [{oid}] from {self.agent} with args: [{self.args}]')
-        return subprocess.getstatusoutput(f'{_SNMPWALK_} {self.args} {self.agent} {oid}')
+        _result = self._request('walk', oid)
+        return _result[0], self._render(_result)
 
     def snmptable(self, oid_table_entry) -> str:
+        """
+        columns are named with their sub-identifier under the entry OID, as 'snmptable -Ci' without MIB.
+        """
         self.colorlog(f'snmptable [{oid_table_entry}] from {self.agent} with args [{self.args}]')
-        return subprocess.getoutput(f'{_SNMPTABLE_} {self.args} {self.agent} {oid_table_entry}')
+        _return, _varbinds = self._request('walk', oid_table_entry)
+        if _return != 0:
+            return _varbinds
 
-    def snmpwalk_format(self, oid_table):
-        _data_list = self.snmpwalk(oid_table).split('\n')
-        _data_tuple_list = []
-        for _line in _data_list:
-            __list1 = _line.split('::')
-            __list2 = _line.split('=')
+        _entry = self.resolve_oid(oid_table_entry)
+        _columns = []
+        _rows = {}
+        for _vb in _varbinds:
+            if _vb.type in _EXCEPTION_TEXT_:
+                continue
+            _column, _, _index = _vb.oid[len(_entry) + 1:].partition('.')
+            _columns.append(_column) if _column not in _columns else ''
+            _value = self.format_varbind(_vb).split(': ', 1)[-1].strip('"')
+            _rows.setdefault(_index, {}).update({_column: _value})
 
-            __mib = __list1[0].strip()
-            try:
-                __desc = __list1[1].split('.')[0].strip()
-            except IndexError as _e:
-                self.colorlog(_e, 'warn')
-                self.colorlog(f'[{_line}] has no description.', 'warn')
-                __desc = '-'
+        if not _rows:
+            return f'{self.format_oid(_entry)}: No entries'
 
-            # some OID has no index.
-            try:
-                # __index = __list2[0].split('.')[1].strip()
-                __index = __list2[0].split('.')[-1].strip()
-            except IndexError as _e:
-                self.colorlog(_e, 'warn')
-                self.colorlog(f'[{_line}] has no index.', 'warn')
-                __index = '-'
+        _lines = [f'SNMP table: {self.format_oid(_entry)}', '', ' '.join(['index'] + _columns)]
+        for _index, _row in _rows.items():
+            _lines.append(' '.join([_index] + [_row.get(_column, '?') for _column in _columns]))
+        return '\n'.join(_lines)
 
-            try:
-                __type = __list2[1].split(':')[0].strip().strip('"')
-                # __value = __list2[1].split(':')[1].strip()
-
-                # bug: value string -> STRING: "2022-04-24 20:34:23" ':' will be disappear
-                # __value = ''.join(__list2[1].split(':')[1:]).strip().strip('"').strip()
-                __value = ''.join(__list2[1].split(': ')[1:]).strip().strip('"').strip()
-            except IndexError as _e:
-                self.colorlog(_e, 'warn')
-                self.colorlog(f'[{_line}] has no type or value.', 'warn')
-                __type = '-'
-                __value = '-'
-
-            _data_tuple_list.append((__mib, __desc, __index, __type, __value))
+    def walk_rows(self, oid, bulk=True) -> list:
+        """
+        :return: [Row(index, type, value)], index is the tuple of arcs under oid, empty list if failed
+        """
+        _return, _varbinds = self._request('bulkwalk' if bulk else 'walk', oid)
+        if _return != 0:
+            return []
+        return snmprows.rows(_varbinds, self.resolve_oid(oid))
+
+    def snmpwalk_format(self, oid_table):
+        """
+        :return: [(mib, description, index, type, value)], like ('XIV-MIB', 'xivIfStatus', '1004', 'STRING', 'OK'),
+                 a single row (error text, '-', '-', '-', '-') if walk failed
+        """
+        self.colorlog(f'snmpbulkwalk [{oid_table}] from {self.agent} with args: [{self.args}]')
+        _return, _varbinds = self._request('bulkwalk', oid_table)
+        if _return != 0:
+            return [(_varbinds, '-', '-', '-', '-')]
+
+        # every column is labeled once, not every line
+        _base = self.resolve_oid(oid_table)
+        _labels = {}
+        _data_tuple_list = []
+        for _row in snmprows.rows(_varbinds, _base):
+            # the last arc is the index, the arcs before name the column
+            _parent, _, _index = snmprows.index_text(snmpengine.oid_tuple(_base) + _row.index).rpartition('.')
+            if _parent not in _labels:
+                _mib, _, _name = self.format_oid(_parent).partition('::')
+                _labels[_parent] = (_mib, _name.partition('.')[0] or '-')
+
+            _type = _EXCEPTION_TEXT_.get(_row.type, _row.type)
+            _data_tuple_list.append((*_labels[_parent], _index or '-', _type, self.format_value(_row)))
         return _data_tuple_list
 
 
@@ -0,0 +1,936 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 09:12
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: snmpengine.py
+# Tools: PyCharm
+
+"""
+---Pure Python SNMP v1/v2c/v3 engine used by SnmpConsole---
+
+One UDP socket is kept per agent and shared by every session talking to it,
+responses come back as VarBind tuples instead of net-snmp text.
+"""
+import os
+import socket
+import shlex
+import struct
+import threading
+import time
+import hashlib
+import hmac
+import random
+import collections
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ModuleNotFoundError:
+    Cipher = algorithms = modes = None
+try:
+    # TripleDES moved to 'decrepit' in cryptography 43, the old name is deprecated
+    from cryptography.hazmat.decrepit.ciphers.algorithms import TripleDES
+except ModuleNotFoundError:
+    TripleDES = algorithms.TripleDES if algorithms is not None else None
+
+# BER universal and application tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+IP_ADDRESS = 0x40
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIMETICKS = 0x43
+OPAQUE = 0x44
+COUNTER64 = 0x46
+NO_SUCH_OBJECT = 0x80
+NO_SUCH_INSTANCE = 0x81
+END_OF_MIB_VIEW = 0x82
+
+# PDU tags
+GET_REQUEST = 0xa0
+GET_NEXT_REQUEST = 0xa1
+GET_RESPONSE = 0xa2
+GET_BULK_REQUEST = 0xa5
+REPORT = 0xa8
+
+_TYPE_NAMES_ = {INTEGER: 'INTEGER', OCTET_STRING: 'STRING', NULL: 'NULL', OBJECT_IDENTIFIER: 'OID',
+                IP_ADDRESS: 'IpAddress', COUNTER32: 'Counter32', GAUGE32: 'Gauge32', TIMETICKS: 'Timeticks',
+                OPAQUE: 'Opaque', COUNTER64: 'Counter64', NO_SUCH_OBJECT: 'noSuchObject',
+                NO_SUCH_INSTANCE: 'noSuchInstance', END_OF_MIB_VIEW: 'endOfMibView'}
+
+EXCEPTION_TYPES = ('noSuchObject', 'noSuchInstance', 'endOfMibView')
+
+_ERROR_STATUS_ = {1: 'tooBig', 2: 'noSuchName', 3: 'badValue', 4: 'readOnly', 5: 'genErr',
+                  6: 'noAccess', 7: 'wrongType', 8: 'wrongLength', 9: 'wrongEncoding', 10: 'wrongValue',
+                  11: 'noCreation', 12: 'inconsistentValue', 13: 'resourceUnavailable', 14: 'commitFailed',
+                  15: 'undoFailed', 16: 'authorizationError', 17: 'notWritable', 18: 'inconsistentName'}
+
+_VERSIONS_ = {'1': 0, '2c': 1, '3': 3}
+# net-snmp '-l' & 'defSecurityLevel' values, case insensitive
+_LEVELS_ = {'noauthnopriv': 'noAuthNoPriv', 'noauth': 'noAuthNoPriv', '1': 'noAuthNoPriv',
+            'authnopriv': 'authNoPriv', 'auth': 'authNoPriv', '2': 'authNoPriv',
+            'authpriv': 'authPriv', 'priv': 'authPriv', '3': 'authPriv'}
+
+# usmStats counters returned in REPORT PDUs
+_USM_STATS_ = '1.3.6.1.6.3.15.1.1'
+_USM_REPORTS_ = {f'{_USM_STATS_}.1.0': 'unsupportedSecLevels',
+                 f'{_USM_STATS_}.2.0': 'notInTimeWindows',
+                 f'{_USM_STATS_}.3.0': 'unknownUserNames',
+                 f'{_USM_STATS_}.4.0': 'unknownEngineIDs',
+                 f'{_USM_STATS_}.5.0': 'wrongDigests',
+                 f'{_USM_STATS_}.6.0': 'decryptionErrors'}
+
+_MSG_FLAG_AUTH = 0x01
+_MSG_FLAG_PRIV = 0x02
+_MSG_FLAG_REPORTABLE = 0x04
+_MAX_MSG_SIZE = 65507
+
+VarBind = collections.namedtuple('VarBind', ['oid', 'type', 'value'])
+
+
+class SnmpError(Exception):
+    pass
+
+
+class SnmpTimeout(SnmpError):
+    pass
+
+
+"""
+BER encoding
+"""
+
+
+def _encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    _octets = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(_octets)]) + _octets
+
+
+def encode_tlv(tag, value: bytes):
+    return bytes([tag]) + _encode_length(len(value)) + value
+
+
+def encode_integer(value: int, tag=INTEGER):
+    _bits = (~value).bit_length() if value < 0 else value.bit_length()
+    return encode_tlv(tag, value.to_bytes(_bits // 8 + 1, 'big', signed=True))
+
+
+def encode_octets(value, tag=OCTET_STRING):
+    value = value.encode() if isinstance(value, str) else bytes(value)
+    return encode_tlv(tag, value)
+
+
+def encode_null(tag=NULL):
+    return bytes([tag, 0])
+
+
+def encode_oid(oid: str):
+    _arcs = [int(_arc) for _arc in oid.strip('.').split('.')]
+    if len(_arcs) < 2:
+        raise SnmpError(f'OID [{oid}] is too short')
+
+    _body = bytearray()
+    for _arc in [_arcs[0] * 40 + _arcs[1]] + _arcs[2:]:
+        _chunk = [_arc & 0x7f]
+        _arc >>= 7
+        while _arc:
+            _chunk.append(0x80 | (_arc & 0x7f))
+            _arc >>= 7
+        _body.extend(reversed(_chunk))
+    return encode_tlv(OBJECT_IDENTIFIER, bytes(_body))
+
+
+def encode_sequence(*items, tag=SEQUENCE):
+    return encode_tlv(tag, b''.join(items))
+
+
+"""
+BER decoding
+"""
+
+
+def decode_tlv(data, pos=0):
+    """
+    :return: (tag, start of value, end of value)
+    """
+    try:
+        _tag = data[pos]
+        _length = data[pos + 1]
+        pos += 2
+        if _length & 0x80:
+            _no_octets = _length & 0x7f
+            _length = int.from_bytes(data[pos:pos + _no_octets], 'big')
+            pos += _no_octets
+    except IndexError:
+        raise SnmpError('truncated BER data')
+
+    if pos + _length > len(data):
+        raise SnmpError('truncated BER data')
+    return _tag, pos, pos + _length
+
+
+def decode_sequence(data, start, end):
+    """
+    yield (tag, start, end) of every element between start and end
+    """
+    while start < end:
+        _tag, _start, _end = decode_tlv(data, start)
+        yield _tag, _start, _end
+        start = _end
+
+
+def decode_oid_arcs(data, start, end):
+    """
+    :return: tuple of arcs, decoded in place without slicing data
+    """
+    _arcs = []
+    _arc = 0
+    for _pos in range(start, end):
+        _byte = data[_pos]
+        _arc = (_arc << 7) | (_byte & 0x7f)
+        if not _byte & 0x80:
+            _arcs.append(_arc)
+            _arc = 0
+    if not _arcs:
+        return ()
+
+    _first = _arcs[0]
+    _head = min(_first // 40, 2)
+    return (_head, _first - _head * 40, *_arcs[1:])
+
+
+def decode_oid(data, start, end):
+    return '.'.join(map(str, decode_oid_arcs(data, start, end)))
+
+
+def _is_printable(value: bytes):
+    value = value[:-1] if value.endswith(b'\x00') else value
+    for _byte in value:
+        if not (32 <= _byte < 127 or _byte in (9, 10, 13)):
+            return False
+    return True
+
+
+def decode_value(tag, data, start, end):
+    """
+    :return: (type name, python value)
+    """
+    _raw = bytes(data[start:end])
+    if tag == INTEGER:
+        return 'INTEGER', int.from_bytes(_raw, 'big', signed=True) if _raw else 0
+    if tag == OCTET_STRING:
+        if _is_printable(_raw):
+            return 'STRING', _raw.rstrip(b'\x00').decode()
+        return 'Hex-STRING', _raw
+    if tag == OBJECT_IDENTIFIER:
+        return 'OID', decode_oid(data, start, end)
+    if tag == IP_ADDRESS:
+        return 'IpAddress', '.'.join(map(str, _raw))
+    if tag in (COUNTER32, GAUGE32, TIMETICKS, COUNTER64):
+        return _TYPE_NAMES_[tag], int.from_bytes(_raw, 'big', signed=False)
+    if tag == OPAQUE:
+        return 'Opaque', _raw
+    if tag in _TYPE_NAMES_:
+        return _TYPE_NAMES_[tag], None
+    return f'Tag{tag:#04x}', _raw
+
+
+def decode_varbinds(data, start=0, end=None):
+    """
+    decode a BER 'VarBindList' into a list of VarBind(oid, type, value)
+    """
+    end = len(data) if end is None else end
+    _varbinds = []
+    for _tag, _start, _end in decode_sequence(data, start, end):
+        _oid_tag, _oid_start, _oid_end = decode_tlv(data, _start)
+        _val_tag, _val_start, _val_end = decode_tlv(data, _oid_end)
+        _type, _value = decode_value(_val_tag, data, _val_start, _val_end)
+        _varbinds.append(VarBind(decode_oid(data, _oid_start, _oid_end), _type, _value))
+    return _varbinds
+
+
+def encode_pdu(pdu_type, request_id, oids, error_status=0, error_index=0):
+    _varbinds = b''.join(encode_sequence(encode_oid(_oid), encode_null()) for _oid in oids)
+    return encode_sequence(encode_integer(request_id),
+                           encode_integer(error_status),
+                           encode_integer(error_index),
+                           encode_sequence(_varbinds),
+                           tag=pdu_type)
+
+
+def encode_message(version, community, pdu: bytes):
+    """
+    v1 & v2c message of an encoded PDU
+    """
+    _version = str(version).lower().lstrip('v')
+    if _version not in ('1', '2c'):
+        raise SnmpError(f'community message of snmp version [{version}]')
+    return encode_sequence(encode_integer(_VERSIONS_[_version]), encode_octets(community), pdu)
+
+
+def decode_pdu(data, pos=0):
+    """
+    :return: (pdu type, request id, error status, error index, [VarBind])
+    """
+    return decode_pdu_body(data, *decode_tlv(data, pos))
+
+
+def decode_pdu_body(data, pdu_type, start, end):
+    _pdu_type = pdu_type
+    _fields = list(decode_sequence(data, start, end))
+    if len(_fields) != 4:
+        raise SnmpError('malformed PDU')
+
+    _request_id, _error_status, _error_index = [decode_value(INTEGER, data, _s, _e)[1] for _t, _s, _e in _fields[:3]]
+    _varbinds = decode_varbinds(data, _fields[3][1], _fields[3][2])
+    return _pdu_type, _request_id, _error_status, _error_index, _varbinds
+
+
+def is_numeric_oid(oid: str):
+    return oid.strip('.').replace('.', '').isdigit()
+
+
+def oid_startswith(oid: str, prefix: str):
+    prefix = prefix.strip('.')
+    return oid == prefix or oid.startswith(prefix + '.')
+
+
+def oid_tuple(oid: str):
+    return tuple(int(_arc) for _arc in oid.strip('.').split('.'))
+
+
+# net-snmp snmp.conf directives of the command line defaults, 'defPassphrase' sets both passphrases
+_SNMP_CONF_DIRECTIVES_ = {'defversion': 'version', 'defcommunity': 'community', 'defsecurityname': 'user',
+                          'defsecuritylevel': 'level', 'defauthtype': 'auth_protocol',
+                          'defauthpassphrase': 'auth_password', 'defprivtype': 'priv_protocol',
+                          'defprivpassphrase': 'priv_password', 'defcontext': 'context'}
+_SNMP_CONF_DIRS_ = ['/etc/snmp', '/usr/share/snmp', '/usr/local/etc/snmp', '/usr/local/share/snmp', '~/.snmp']
+_SNMP_CONF_ = None
+
+
+def snmp_conf_defaults():
+    """
+    defaults net-snmp commands took from 'snmp.conf' & 'snmp.local.conf' of SNMPCONFPATH or the usual
+    directories, later files override earlier ones. read once per process.
+    :return: SnmpSession keyword arguments
+    """
+    global _SNMP_CONF_
+    if _SNMP_CONF_ is not None:
+        return _SNMP_CONF_
+
+    _dirs = os.environ['SNMPCONFPATH'].split(':') if os.environ.get('SNMPCONFPATH') else _SNMP_CONF_DIRS_
+    _defaults = {}
+    for _dir in _dirs:
+        for _name in ['snmp.conf', 'snmp.local.conf']:
+            try:
+                with open(os.path.join(os.path.expanduser(_dir), _name), 'r') as f:
+                    _lines = f.readlines()
+            except OSError:
+                continue
+            for _line in _lines:
+                _words = _line.split(None, 1)
+                if len(_words) < 2 or _words[0].startswith('#'):
+                    continue
+                _directive, _value = _words[0].lower(), _words[1].strip()
+                if _directive == 'defpassphrase':
+                    _defaults.update({'auth_password': _value, 'priv_password': _value})
+                elif _directive in _SNMP_CONF_DIRECTIVES_:
+                    _defaults[_SNMP_CONF_DIRECTIVES_[_directive]] = _value
+    _SNMP_CONF_ = _defaults
+    return _SNMP_CONF_
+
+
+def parse_snmp_args(args: str):
+    """
+    Translate net-snmp command line options ('-v3 -u user -n VF:128', '-v2c -c XIV -m XIV-MIB')
+    into SnmpSession keyword arguments, options not related to the transport are ignored.
+
+    v3 security is set by '-l noAuthNoPriv|authNoPriv|authPriv -a MD5|SHA -A <passphrase> -x DES|AES -X <passphrase>',
+    options not given are taken from snmp.conf as net-snmp did ('defSecurityLevel', 'defAuthPassphrase'...).
+    """
+    _options = {'-v': 'version', '-c': 'community', '-u': 'user', '-l': 'level',
+                '-a': 'auth_protocol', '-A': 'auth_password', '-x': 'priv_protocol', '-X': 'priv_password',
+                '-n': 'context', '-r': 'retries', '-t': 'timeout', '-m': 'mibs'}
+    kwargs = {}
+    _words = shlex.split(args) if args else []
+    _i = 0
+    while _i < len(_words):
+        _word = _words[_i]
+        _flag, _value = _word[:2], _word[2:]
+        if _flag in _options or _flag == '-C':
+            if not _value and _i + 1 < len(_words):
+                _i += 1
+                _value = _words[_i]
+            if _flag != '-C':
+                kwargs[_options[_flag]] = _value
+            elif _value.startswith('r'):  # snmpbulkwalk '-Cr<NUM>'
+                kwargs['max_repetitions'] = _value[1:]
+        _i += 1
+
+    # as net-snmp, security defaults apply to v3 only, version & community to all
+    _defaults = snmp_conf_defaults()
+    for _key in ['version', 'community']:
+        kwargs.setdefault(_key, _defaults[_key]) if _key in _defaults else ''
+    if str(kwargs.get('version', '')).lower().lstrip('v') == '3':
+        for _key, _value in _defaults.items():
+            kwargs.setdefault(_key, _value)
+
+    for _key in ['retries', 'max_repetitions']:
+        if _key in kwargs:
+            kwargs[_key] = int(kwargs[_key])
+    if 'timeout' in kwargs:
+        kwargs['timeout'] = float(kwargs['timeout'])
+    return kwargs
+
+
+"""
+USM (RFC 3414 & RFC 3826)
+"""
+
+_HASHES_ = {'MD5': hashlib.md5, 'SHA': hashlib.sha1, 'SHA1': hashlib.sha1}
+_LOCALIZED_KEYS_ = {}
+
+
+def _password_to_key(protocol, password: str, engine_id: bytes):
+    _key = (protocol, password, engine_id)
+    if _key in _LOCALIZED_KEYS_:
+        return _LOCALIZED_KEYS_[_key]
+
+    _hash = _HASHES_[protocol]
+    _password = password.encode()
+    _repeat = (_password * (1048576 // len(_password) + 1))[:1048576]
+    _digest = _hash(_repeat).digest()
+    _localized = _hash(_digest + engine_id + _digest).digest()
+    _LOCALIZED_KEYS_[_key] = _localized
+    return _localized
+
+
+def _usm_params(engine_id, boots, engine_time, user, auth_params=b'', priv_params=b''):
+    return encode_sequence(encode_octets(engine_id),
+                           encode_integer(boots),
+                           encode_integer(engine_time),
+                           encode_octets(user),
+                           encode_octets(auth_params),
+                           encode_octets(priv_params))
+
+
+def encode_discovery(msg_id, request_id):
+    """
+    v3 engine discovery, an empty GET without user & authentication the agent answers with a REPORT
+    """
+    _header = encode_integer(3) + encode_sequence(encode_integer(msg_id),
+                                                  encode_integer(_MAX_MSG_SIZE),
+                                                  encode_octets(bytes([_MSG_FLAG_REPORTABLE])),
+                                                  encode_integer(3))
+    _scoped_pdu = encode_sequence(encode_octets(b''), encode_octets(b''), encode_pdu(GET_REQUEST, request_id, []))
+    return encode_sequence(_header, encode_octets(_usm_params(b'', 0, 0, b'')), _scoped_pdu)
+
+
+class _Engine(object):
+    """
+    authoritative engine state of an agent, discovered once and shared by all sessions
+    """
+    def __init__(self):
+        self.engine_id = b''
+        self.boots = 0
+        self.time = 0
+        self.synced_at = 0.0
+
+    def update(self, engine_id, boots, engine_time):
+        self.engine_id = engine_id
+        self.boots = boots
+        self.time = engine_time
+        self.synced_at = time.monotonic()
+
+    def now(self):
+        return self.time + int(time.monotonic() - self.synced_at)
+
+
+class _Transport(object):
+    """
+    one UDP socket per agent, requests are serialized by lock
+    """
+    def __init__(self, agent, port):
+        _family, _type, _proto, _name, _address = socket.getaddrinfo(agent, port, type=socket.SOCK_DGRAM)[0]
+        self.sock = socket.socket(_family, _type, _proto)
+        self.sock.connect(_address)
+        self.lock = threading.Lock()
+        self.engine = _Engine()
+        # set to False once the agent rejected a GETBULK request
+        self.bulk = True
+
+    def request(self, packet, is_reply, timeout, retries):
+        """
+        send packet and wait for the datagram which is_reply() accept, resend on timeout.
+        """
+        with self.lock:
+            for _attempt in range(retries + 1):
+                self.sock.send(packet)
+                _deadline = time.monotonic() + timeout
+                while True:
+                    _remain = _deadline - time.monotonic()
+                    if _remain <= 0:
+                        break
+                    self.sock.settimeout(_remain)
+                    try:
+                        _data = self.sock.recv(65535)
+                    except socket.timeout:
+                        break
+                    except ConnectionRefusedError:
+                        # ICMP port unreachable, keep waiting for the rest of the window
+                        continue
+                    _reply = is_reply(_data)
+                    if _reply is not None:
+                        return _reply
+        raise SnmpTimeout('No Response')
+
+    def close(self):
+        self.sock.close()
+
+
+_TRANSPORTS_ = {}
+_TRANSPORTS_LOCK_ = threading.Lock()
+
+
+def get_transport(agent, port=161):
+    with _TRANSPORTS_LOCK_:
+        _key = (agent, port)
+        if _key not in _TRANSPORTS_:
+            _TRANSPORTS_[_key] = _Transport(agent, port)
+        return _TRANSPORTS_[_key]
+
+
+class SnmpSession(object):
+    def __init__(self, agent, port=161, version='2c', community='public', user='', level=None,
+                 auth_protocol=None, auth_password=None, priv_protocol=None, priv_password=None,
+                 context='', retries=2, timeout=3, max_repetitions=10, mibs=None):
+        """
+        Args:
+            agent: hostname or address of agent
+            version: '1', '2c' or '3'
+            community: community string for v1 & v2c
+            user: USM user name for v3
+            level: noAuthNoPriv, authNoPriv or authPriv, as net-snmp '-l', noAuthNoPriv if not set
+            auth_protocol: MD5 or SHA
+            priv_protocol: DES or AES
+            context: v3 context name, for example Brocade 'VF:128'
+            retries: times of resending before timeout
+            timeout: seconds of waiting for every request
+            max_repetitions: rows asked by every GETBULK request, as net-snmp '-Cr'
+            mibs: accepted for compatibility with net-snmp '-m', not used by the engine
+        """
+        self.agent = agent
+        self.port = port
+        self.version = str(version).lower().lstrip('v')
+        if self.version not in _VERSIONS_:
+            raise SnmpError(f'unsupported snmp version [{version}]')
+
+        self.community = community
+        self.user = user or ''
+        _level = str(level).lower() if level is not None else 'noauthnopriv'
+        if _level not in _LEVELS_:
+            raise SnmpError(f'unsupported security level [{level}]')
+        self.level = _LEVELS_[_level]
+        self.auth_protocol = (auth_protocol or 'MD5').upper()
+        self.auth_password = auth_password
+        self.priv_protocol = (priv_protocol or 'DES').upper()
+        self.priv_password = priv_password
+        self.context = context or ''
+        self.retries = int(retries)
+        self.timeout = float(timeout)
+        self.max_repetitions = int(max_repetitions)
+        self.mibs = mibs
+
+        # security level & protocols mean nothing to v1 & v2c
+        self.auth = self.version == '3' and self.level in ('authNoPriv', 'authPriv')
+        self.priv = self.version == '3' and self.level == 'authPriv'
+        if self.version == '3':
+            if self.auth and self.auth_protocol not in _HASHES_:
+                raise SnmpError(f'unsupported auth protocol [{self.auth_protocol}]')
+            if self.priv and self.priv_protocol not in ('DES', 'AES', 'AES128'):
+                raise SnmpError(f'unsupported privacy protocol [{self.priv_protocol}]')
+            # net-snmp refused these too, an empty passphrase must not drop the request to a lower level
+            if self.auth and len(self.auth_password or '') < 8:
+                raise SnmpError(f'{self.level} requires auth passphrase of 8 characters at least, '
+                                f'set by \'-A\' or \'defAuthPassphrase\' in snmp.conf')
+            if self.priv and len(self.priv_password or '') < 8:
+                raise SnmpError(f'{self.level} requires privacy passphrase of 8 characters at least, '
+                                f'set by \'-X\' or \'defPrivPassphrase\' in snmp.conf')
+            if self.priv and Cipher is None:
+                raise SnmpError('privacy requires python package [cryptography]')
+
+        self.transport = get_transport(agent, port)
+        self._salt = random.getrandbits(64)
+
+    @staticmethod
+    def _request_id():
+        return random.getrandbits(31)
+
+    def run(self, operation):
+        """
+        drive an operation generator with the blocking transport,
+        every packet yielded is sent and the matched reply (or the SnmpError) is sent back.
+        """
+        _reply = _error = None
+        while True:
+            try:
+                _packet, _is_reply = operation.throw(_error) if _error is not None else operation.send(_reply)
+            except StopIteration as _stop:
+                return _stop.value
+            _reply = _error = None
+            try:
+                _reply = self.transport.request(_packet, _is_reply, self.timeout, self.retries)
+            except SnmpError as _e:
+                _error = _e
+
+    def get(self, oids):
+        return self.run(self.op_get(oids))
+
+    def getbulk(self, oids, non_repeaters=0, max_repetitions=None):
+        return self.run(self.op_getbulk(oids, non_repeaters, max_repetitions))
+
+    def getnext(self, oids):
+        return self.run(self.op_getnext(oids))
+
+    def walk(self, oid):
+        return self.run(self.op_walk(oid))
+
+    def bulkwalk(self, oid, max_repetitions=None):
+        return self.run(self.op_bulkwalk(oid, max_repetitions))
+
+    def bulkwalk_columns(self, oids, max_repetitions=None):
+        return self.run(self.op_bulkwalk_columns(oids, max_repetitions))
+
+    def request(self, pdu_type, oids, error_status=0, error_index=0):
+        return self.run(self.op_request(pdu_type, oids, error_status, error_index))
+
+    """
+    Operations, generators yield (packet, is_reply) and receive the reply,
+    so the same protocol logic runs on the blocking transport and on asyncio (snmppoller).
+    """
+
+    def op_get(self, oids):
+        return (yield from self.op_request(GET_REQUEST, oids))
+
+    def op_getbulk(self, oids, non_repeaters=0, max_repetitions=None):
+        if self.version == '1':
+            raise SnmpError('GETBULK is not supported by SNMPv1')
+        max_repetitions = self.max_repetitions if max_repetitions is None else max_repetitions
+        return (yield from self.op_request(GET_BULK_REQUEST, oids, non_repeaters, max_repetitions))
+
+    def op_getnext(self, oids):
+        return (yield from self.op_request(GET_NEXT_REQUEST, oids))
+
+    def op_walk(self, oid):
+        """
+        walk subtree with GETNEXT, as 'snmpwalk' does, a GET is sent when subtree is empty.
+        """
+        oid = oid.strip('.')
+        _varbinds = []
+        _current = oid
+        while True:
+            try:
+                _next = (yield from self.op_getnext([_current]))[0]
+            except SnmpError as _e:
+                if 'noSuchName' in str(_e):  # v1 end of mib view
+                    break
+                raise
+            if _next.type == 'endOfMibView' or not oid_startswith(_next.oid, oid):
+                break
+            if oid_tuple(_next.oid) <= oid_tuple(_current):
+                raise SnmpError(f'OID not increasing: {_current} >= {_next.oid}')
+            _varbinds.append(_next)
+            _current = _next.oid
+
+        return _varbinds if _varbinds else (yield from self._op_get_instance(oid))
+
+    def op_bulkwalk(self, oid, max_repetitions=None):
+        """
+        walk subtree with GETBULK, as 'snmpbulkwalk' does.
+        v1 sessions and agents which once rejected GETBULK are walked with GETNEXT.
+        """
+        max_repetitions = self.max_repetitions if max_repetitions is None else int(max_repetitions)
+        if self.version == '1' or not self.transport.bulk:
+            return (yield from self.op_walk(oid))
+
+        oid = oid.strip('.')
+        _varbinds = []
+        _current = oid
+        _done = False
+        while not _done:
+            try:
+                _response = yield from self.op_getbulk([_current], 0, max_repetitions)
+            except SnmpTimeout:
+                raise
+            except SnmpError as _e:
+                if 'tooBig' in str(_e) and max_repetitions > 1:
+                    max_repetitions //= 2
+                    continue
+                if _varbinds:
+                    raise
+                self.transport.bulk = False
+                return (yield from self.op_walk(oid))
+
+            if not _response:
+                break
+            for _next in _response:
+                if _next.type == 'endOfMibView' or not oid_startswith(_next.oid, oid):
+                    _done = True
+                    break
+                if oid_tuple(_next.oid) <= oid_tuple(_current):
+                    raise SnmpError(f'OID not increasing: {_current} >= {_next.oid}')
+                _varbinds.append(_next)
+                _current = _next.oid
+
+        return _varbinds if _varbinds else (yield from self._op_get_instance(oid))
+
+    def op_bulkwalk_columns(self, oids, max_repetitions=None):
+        """
+        walk several columns of one table together, every GETBULK carries one varbind per unfinished column
+        and the response is interleaved column by column.
+        :return: {column OID: [VarBind]}
+        """
+        max_repetitions = self.max_repetitions if max_repetitions is None else int(max_repetitions)
+        _columns = [_oid.strip('.') for _oid in oids]
+        _result = {_column: [] for _column in _columns}
+
+        if self.version == '1' or not self.transport.bulk:
+            for _column in _columns:
+                _result[_column] = [_vb for _vb in (yield from self.op_walk(_column))
+                                    if _vb.type not in EXCEPTION_TYPES]
+            return _result
+
+        _current = {_column: _column for _column in _columns}
+        _active = list(_columns)
+        while _active:
+            try:
+                _response = yield from self.op_getbulk([_current[_column] for _column in _active], 0, max_repetitions)
+            except SnmpTimeout:
+                raise
+            except SnmpError as _e:
+                if 'tooBig' in str(_e) and max_repetitions > 1:
+                    max_repetitions //= 2
+                    continue
+                if any(_result.values()):
+                    raise
+                self.transport.bulk = False
+                return (yield from self.op_bulkwalk_columns(oids, max_repetitions))
+
+            if not _response:
+                break
+            _finished = set()
+            for _i, _next in enumerate(_response):
+                _column = _active[_i % len(_active)]
+                if _column in _finished:
+                    continue
+                if _next.type == 'endOfMibView' or not oid_startswith(_next.oid, _column):
+                    _finished.add(_column)
+                    continue
+                if oid_tuple(_next.oid) <= oid_tuple(_current[_column]):
+                    raise SnmpError(f'OID not increasing: {_current[_column]} >= {_next.oid}')
+                _result[_column].append(_next)
+                _current[_column] = _next.oid
+            _active = [_column for _column in _active if _column not in _finished]
+        return _result
+
+    def _op_get_instance(self, oid):
+        """
+        subtree is empty, the OID itself may be an instance
+        """
+        try:
+            return (yield from self.op_get([oid]))
+        except SnmpError as _e:
+            if 'noSuchName' not in str(_e) or isinstance(_e, SnmpTimeout):
+                raise
+            return [VarBind(oid, 'noSuchObject', None)]
+
+    def op_request(self, pdu_type, oids, error_status=0, error_index=0):
+        if self.version == '3':
+            return (yield from self._op_request_v3(pdu_type, oids, error_status, error_index))
+
+        _request_id = self._request_id()
+        _packet = encode_message(self.version, self.community,
+                                 encode_pdu(pdu_type, _request_id, oids, error_status, error_index))
+
+        def _is_reply(_data):
+            try:
+                _tag, _start, _end = decode_tlv(_data)
+                _fields = list(decode_sequence(_data, _start, _end))
+                _reply = decode_pdu_body(_data, *_fields[2])
+            except (SnmpError, IndexError):
+                return None
+            return _reply if _reply[1] == _request_id else None
+
+        return self._check((yield _packet, _is_reply))
+
+    @staticmethod
+    def _check(reply):
+        _pdu_type, _request_id, _error_status, _error_index, _varbinds = reply
+        if _error_status:
+            _name = _ERROR_STATUS_.get(_error_status, str(_error_status))
+            _oid = _varbinds[_error_index - 1].oid if 0 < _error_index <= len(_varbinds) else ''
+            raise SnmpError(f'Error in packet. Reason: ({_name}) {_oid}'.strip())
+        return _varbinds
+
+    """
+    SNMPv3
+    """
+
+    def _op_discover(self):
+        _msg_id = self._request_id()
+        _packet = encode_discovery(_msg_id, self._request_id())
+        _reply = yield _packet, lambda _data: self._v3_reply(_data, _msg_id, verify=False)
+        _engine_id, _boots, _time = _reply[0]
+        if not _engine_id:
+            raise SnmpError('engine id discovery failed')
+        self.transport.engine.update(_engine_id, _boots, _time)
+
+    def _op_request_v3(self, pdu_type, oids, error_status=0, error_index=0, resync=True):
+        _engine = self.transport.engine
+        if not _engine.engine_id:
+            yield from self._op_discover()
+
+        _msg_id = self._request_id()
+        _packet = self._v3_packet(_msg_id, pdu_type, self._request_id(), oids, error_status, error_index)
+        _security, _pdu = yield _packet, lambda _data: self._v3_reply(_data, _msg_id)
+        if _pdu[0] == REPORT:
+            _report = _USM_REPORTS_.get(_pdu[4][0].oid, _pdu[4][0].oid) if _pdu[4] else 'unknown report'
+            if resync and _report in ('notInTimeWindows', 'unknownEngineIDs'):
+                _engine_id, _boots, _time = _security
+                _engine.update(_engine_id or _engine.engine_id, _boots, _time)
+                return (yield from self._op_request_v3(pdu_type, oids, error_status, error_index, resync=False))
+            raise SnmpError(f'Error in packet. Reason: ({_report})')
+        return self._check(_pdu)
+
+    def _v3_packet(self, msg_id, pdu_type, request_id, oids, error_status=0, error_index=0):
+        _engine = self.transport.engine
+        _auth = self.auth
+        _priv = self.priv
+
+        _flags = _MSG_FLAG_REPORTABLE | (_MSG_FLAG_AUTH if _auth else 0) | (_MSG_FLAG_PRIV if _priv else 0)
+        _header = encode_integer(3) + encode_sequence(encode_integer(msg_id),
+                                                      encode_integer(_MAX_MSG_SIZE),
+                                                      encode_octets(bytes([_flags])),
+                                                      encode_integer(3))
+
+        _engine_id = _engine.engine_id
+        _boots, _time = (_engine.boots, _engine.now()) if _auth else (0, 0)
+        _user = self.user
+
+        _scoped_pdu = encode_sequence(encode_octets(_engine_id),
+                                      encode_octets(self.context),
+                                      encode_pdu(pdu_type, request_id, oids, error_status, error_index))
+        _priv_params = b''
+        if _priv:
+            _scoped_pdu, _priv_params = self._encrypt(_scoped_pdu, _boots, _time)
+            _scoped_pdu = encode_octets(_scoped_pdu)
+
+        _placeholder = b'\x00' * 12 if _auth else b''
+        _security = encode_octets(_usm_params(_engine_id, _boots, _time, _user, _placeholder, _priv_params))
+        _packet = encode_sequence(_header, _security, _scoped_pdu)
+        if not _auth:
+            return _packet
+
+        # locate the auth parameters, they are the 12 bytes just before the encoded privacy parameters
+        _offset = len(_packet) - len(_scoped_pdu) - len(encode_octets(_priv_params)) - 12
+        _key = _password_to_key(self.auth_protocol, self.auth_password or '', _engine_id)
+        _digest = hmac.new(_key, _packet, _HASHES_[self.auth_protocol]).digest()[:12]
+        return _packet[:_offset] + _digest + _packet[_offset + 12:]
+
+    def _v3_reply(self, data, msg_id, verify=True):
+        """
+        :return: ((engine id, boots, time), decoded pdu) or None if datagram not matched
+        """
+        try:
+            _tag, _start, _end = decode_tlv(data)
+            _version, _global, _security, _scoped = list(decode_sequence(data, _start, _end))
+            _global_fields = list(decode_sequence(data, _global[1], _global[2]))
+            _reply_msg_id = decode_value(INTEGER, data, _global_fields[0][1], _global_fields[0][2])[1]
+            if _reply_msg_id != msg_id:
+                return None
+            _flags = data[_global_fields[2][1]] if _global_fields[2][2] > _global_fields[2][1] else 0
+
+            _usm_tag, _usm_start, _usm_end = decode_tlv(data, _security[1])
+            _usm = list(decode_sequence(data, _usm_start, _usm_end))
+            _engine_id = bytes(data[_usm[0][1]:_usm[0][2]])
+            _boots = decode_value(INTEGER, data, _usm[1][1], _usm[1][2])[1]
+            _time = decode_value(INTEGER, data, _usm[2][1], _usm[2][2])[1]
+            _auth_start, _auth_end = _usm[4][1], _usm[4][2]
+            _priv_params = bytes(data[_usm[5][1]:_usm[5][2]])
+        except (SnmpError, IndexError, ValueError):
+            return None
+
+        if verify and self.auth and _flags & _MSG_FLAG_AUTH:
+            _key = _password_to_key(self.auth_protocol, self.auth_password or '', _engine_id)
+            _zeroed = bytes(data[:_auth_start]) + b'\x00' * (_auth_end - _auth_start) + bytes(data[_auth_end:])
+            _digest = hmac.new(_key, _zeroed, _HASHES_[self.auth_protocol]).digest()[:12]
+            if not hmac.compare_digest(_digest, bytes(data[_auth_start:_auth_end])):
+                return None
+
+        if _scoped[0] == OCTET_STRING:
+            if not self.priv:
+                return None
+            # a garbled or truncated ciphertext (DES not padded to 8 bytes) is no reply
+            try:
+                _plain = self._decrypt(bytes(data[_scoped[1]:_scoped[2]]), _boots, _time, _priv_params, _engine_id)
+                _scoped_tag, _scoped_start, _scoped_end = decode_tlv(_plain)
+            except (SnmpError, IndexError, ValueError):
+                return None
+            _scoped_data = _plain
+        else:
+            _scoped_start, _scoped_end = _scoped[1], _scoped[2]
+            _scoped_data = data
+
+        try:
+            _fields = list(decode_sequence(_scoped_data, _scoped_start, _scoped_end))
+            _pdu = decode_pdu_body(_scoped_data, *_fields[2])
+        except (SnmpError, IndexError):
+            return None
+
+        # only REPORT may come back without authentication
+        if verify and self.auth and not _flags & _MSG_FLAG_AUTH and _pdu[0] != REPORT:
+            return None
+        return (_engine_id, _boots, _time), _pdu
+
+    def _priv_key(self, engine_id):
+        return _password_to_key(self.auth_protocol, self.priv_password or '', engine_id)
+
+    def _encrypt(self, scoped_pdu, boots, engine_time):
+        _key = self._priv_key(self.transport.engine.engine_id)
+        self._salt = (self._salt + 1) & 0xffffffffffffffff
+        if self.priv_protocol == 'DES':
+            _salt = struct.pack('>II', boots, self._salt & 0xffffffff)
+            _iv = bytes(_a ^ _b for _a, _b in zip(_key[8:16], _salt))
+            _padded = scoped_pdu + b'\x00' * (-len(scoped_pdu) % 8)
+            _encryptor = Cipher(TripleDES(_key[:8] * 3), modes.CBC(_iv)).encryptor()
+            return _encryptor.update(_padded) + _encryptor.finalize(), _salt
+
+        _salt = struct.pack('>Q', self._salt)
+        _iv = struct.pack('>II', boots, engine_time) + _salt
+        _encryptor = Cipher(algorithms.AES(_key[:16]), modes.CFB(_iv)).encryptor()
+        return _encryptor.update(scoped_pdu) + _encryptor.finalize(), _salt
+
+    def _decrypt(self, data, boots, engine_time, salt, engine_id):
+        _key = self._priv_key(engine_id)
+        if self.priv_protocol == 'DES':
+            _iv = bytes(_a ^ _b for _a, _b in zip(_key[8:16], salt))
+            _decryptor = Cipher(TripleDES(_key[:8] * 3), modes.CBC(_iv)).decryptor()
+        else:
+            _iv = struct.pack('>II', boots, engine_time) + salt
+            _decryptor = Cipher(algorithms.AES(_key[:16]), modes.CFB(_iv)).decryptor()
+        return _decryptor.update(data) + _decryptor.finalize()
+
+
+if __name__ == '__main__':
+    session = SnmpSession('192.168.1.1', version='2c', community='public')
+    for _vb in session.walk('1.3.6.1.2.1.1'):
+        print(_vb)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 16:05
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: snmppoller.py
+# Tools: PyCharm
+
+"""
+---Poll SNMP of many agents concurrently with asyncio---
+
+Every console lists the requests its checks need (snmp_plan), all of them are
+sent at once, limited per agent and in total, and the results are prefetched
+into the consoles so the checks afterwards never wait on the network.
+"""
+import os
+import asyncio
+try:
+    import busybox
+    import snmpengine
+except ModuleNotFoundError:
+    from . import busybox
+    from . import snmpengine
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_LOG_PATH_ = os.path.join(_ROOT_, 'log')
+_LOGFILE_ = os.path.join(_LOG_PATH_, 'console.log')
+os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
+
+
+class _AgentProtocol(asyncio.DatagramProtocol):
+    """
+    one datagram endpoint per agent, replies are matched to waiting requests by their is_reply()
+    """
+    def __init__(self):
+        self.transport = None
+        self.waiters = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        for _is_reply, _future in list(self.waiters):
+            if _future.done():
+                continue
+            _reply = _is_reply(data)
+            if _reply is not None:
+                _future.set_result(_reply)
+                return
+
+    def error_received(self, exc):
+        # ICMP port unreachable, keep waiting for the rest of the window as the blocking transport does
+        pass
+
+    async def request(self, packet, is_reply, timeout, retries):
+        _loop = asyncio.get_running_loop()
+        for _attempt in range(retries + 1):
+            _waiter = (is_reply, _loop.create_future())
+            self.waiters.append(_waiter)
+            try:
+                self.transport.sendto(packet)
+                return await asyncio.wait_for(_waiter[1], timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self.waiters.remove(_waiter)
+        raise snmpengine.SnmpTimeout('No Response')
+
+
+class SnmpPoller(object):
+    def __init__(self, max_in_flight=64, per_agent=4, logfile=None, display=False):
+        """
+        Args:
+            max_in_flight: requests waiting for reply over all agents
+            per_agent: requests waiting for reply from one agent
+        """
+        self.max_in_flight = max_in_flight
+        self.per_agent = per_agent
+        self._log_file = _LOGFILE_ if logfile is None else logfile
+        self.display = display
+
+        self._in_flight = None
+        self._agent_limits = {}
+        self._endpoints = {}
+        # agents which did not answer, the rest of their requests fail at once
+        self._dead = set()
+
+    def colorlog(self, msg=None, level=None, *args):
+        level = 'debug' if level is None else level
+        if not busybox.log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
+        name = f'{"SNMP":<4s} {"poller":<14s}'
+        colorlogger = busybox.get_logger(name, self._log_file, display=self.display, max_size=50)
+        colorlogger.colorlog(msg, level, *args)
+
+    def poll(self, consoles):
+        """
+        fetch snmp_plan() of all consoles concurrently and prefetch the results into them,
+        chassis-wide requests are sent once per agent and shared by all its consoles.
+        :return: number of requests failed
+        """
+        # {chassis key or (console id, method, args): [(console, (method, args))]}
+        _groups = {}
+        for _console in consoles:
+            _console.prefetched = {}
+            if _console.connect() is None:
+                continue
+            for _key in _console.snmp_plan():
+                if _key is None:
+                    continue
+                _shared = _console.chassis_key(_key)
+                if _shared is not None:
+                    _cached = _console.chassis_cache.get(_shared)
+                    if _cached is not None:
+                        _console.prefetched[_key] = _cached
+                        continue
+                _groups.setdefault(_shared or (id(_console),) + _key, []).append((_console, _key))
+
+        self.colorlog(f'poll {len(_groups)} requests for {len(consoles)} consoles, '
+                      f'in flight [{self.max_in_flight}] per agent [{self.per_agent}]', 'info')
+        return asyncio.run(self._poll(_groups))
+
+    async def _poll(self, groups):
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._agent_limits = {}
+        self._endpoints = {}
+        self._dead = set()
+        try:
+            _results = await asyncio.gather(*[self._fetch(_group_key, _jobs) for _group_key, _jobs in groups.items()])
+        finally:
+            for _endpoint in self._endpoints.values():
+                _endpoint.transport.close()
+        return _results.count(False)
+
+    async def _fetch(self, group_key, jobs):
+        _console, _key = jobs[0]
+        _method, _args = _key
+        _session = _console.session
+        _operation = getattr(_session, f'op_{_method}')(*[list(_a) if isinstance(_a, tuple) else _a for _a in _args])
+        try:
+            _result = await self._run(_session, _operation)
+            if _console.chassis_key(_key) is not None:
+                _console.chassis_cache.put(group_key, _result)
+        except (snmpengine.SnmpError, OSError) as _e:
+            # checks see the same error as they would have without prefetch
+            _result = _e
+            self.colorlog(f'{_method} {list(_args)} from {_session.agent} failed: {_e}', 'warn')
+
+        for _job_console, _job_key in jobs:
+            _job_console.prefetched[_job_key] = _result
+        return not isinstance(_result, Exception)
+
+    async def _endpoint(self, agent, port):
+        _key = (agent, port)
+        if _key not in self._endpoints:
+            _loop = asyncio.get_running_loop()
+            _transport, _protocol = await _loop.create_datagram_endpoint(_AgentProtocol, remote_addr=_key)
+            if _key in self._endpoints:  # created by another request meanwhile
+                _transport.close()
+            else:
+                self._endpoints[_key] = _protocol
+        return self._endpoints[_key]
+
+    async def _run(self, session, operation):
+        """
+        drive an operation generator of snmpengine.SnmpSession, as SnmpSession.run() does with blocking socket
+        """
+        _key = (session.agent, session.port)
+        _agent_limit = self._agent_limits.setdefault(_key, asyncio.Semaphore(self.per_agent))
+        _endpoint = await self._endpoint(*_key)
+
+        _reply = _error = None
+        while True:
+            try:
+                _packet, _is_reply = operation.throw(_error) if _error is not None else operation.send(_reply)
+            except StopIteration as _stop:
+                return _stop.value
+            _reply = _error = None
+
+            if _key in self._dead:
+                _error = snmpengine.SnmpTimeout('No Response')
+                continue
+            async with _agent_limit, self._in_flight:
+                try:
+                    _reply = await _endpoint.request(_packet, _is_reply, session.timeout, session.retries)
+                except snmpengine.SnmpTimeout as _e:
+                    self._dead.add(_key)
+                    _error = _e
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 17:10
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: snmprows.py
+# Tools: PyCharm
+
+"""
+---Turn walk results into typed rows (index, type, value)---
+
+Rows come from engine VarBinds, raw BER 'VarBindList' bytes or net-snmp text,
+index is the tuple of arcs under the walked OID. 'walk_rows', 'snmpwalk_format' and
+'walk_table' of SnmpConsole are built on them.
+"""
+import re
+import collections
+try:
+    import snmpengine
+except ModuleNotFoundError:
+    from . import snmpengine
+
+Row = collections.namedtuple('Row', ['index', 'type', 'value'])
+
+# net-snmp prints exceptions as text instead of 'TYPE: value'
+EXCEPTION_TEXT = {'noSuchObject': 'No Such Object available on this agent at this OID',
+                  'noSuchInstance': 'No Such Instance currently exists at this OID',
+                  'endOfMibView': 'No more variables left in this MIB View (It is past the end of the MIB tree)'}
+_TEXT_EXCEPTION_ = {_text: _type for _type, _text in EXCEPTION_TEXT.items()}
+
+_INTEGER_TYPES_ = ('INTEGER', 'Counter32', 'Gauge32', 'Counter64', 'Integer32', 'Unsigned32')
+# 'online(1)' of enumerations, '(1234) 0:00:12.34' of Timeticks, '25 C' with display hint
+_NUMBER_ = re.compile(r'-?\d+')
+
+
+def rows_from_varbinds(varbinds, base):
+    """
+    :param varbinds: [VarBind] from SnmpSession
+    :param base: numeric OID walked, rows outside it are skipped
+    """
+    base = base.strip('.')
+    _skip = len(base) + 1
+    _rows = []
+    for _oid, _type, _value in varbinds:
+        if _oid == base:
+            _rows.append(Row((), _type, _value))
+        elif _oid.startswith(base) and _oid[_skip - 1:_skip] == '.':
+            _rows.append(Row(tuple(map(int, _oid[_skip:].split('.'))), _type, _value))
+    return _rows
+
+
+def rows(source, base):
+    """
+    :param source: [VarBind] or bytes / memoryview of a BER 'VarBindList'
+    :param base: numeric OID walked, rows outside it are skipped
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return rows_from_ber(source, base)
+    return rows_from_varbinds(source, base)
+
+
+def index_text(index):
+    """
+    index tuple as net-snmp prints it after the OID, '1.4' of (1, 4)
+    """
+    return '.'.join(map(str, index))
+
+
+def rows_from_ber(data, base, start=0, end=None):
+    """
+    :param data: bytes or memoryview holding a BER 'VarBindList', decoded in place
+    :param base: numeric OID walked, rows outside it are skipped
+    """
+    _base = snmpengine.oid_tuple(base)
+    _skip = len(_base)
+    end = len(data) if end is None else end
+
+    _tag, _start, _end = snmpengine.decode_tlv(data, start)
+    _rows = []
+    for _vb_tag, _vb_start, _vb_end in snmpengine.decode_sequence(data, _start, min(_end, end)):
+        _oid_tag, _oid_start, _oid_end = snmpengine.decode_tlv(data, _vb_start)
+        _arcs = snmpengine.decode_oid_arcs(data, _oid_start, _oid_end)
+        if _arcs[:_skip] != _base:
+            continue
+        _val_tag, _val_start, _val_end = snmpengine.decode_tlv(data, _oid_end)
+        _rows.append(Row(_arcs[_skip:], *snmpengine.decode_value(_val_tag, data, _val_start, _val_end)))
+    return _rows
+
+
+def rows_from_text(text, base):
+    """
+    :param text: output of net-snmp 'snmpwalk', one varbind per line
+    :param base: OID walked as it is printed, like 'XIV-MIB::xivIfStatus' or '.1.3.6.1.4.1.1588.2.1.1.1.6.2.1'
+    """
+    _prefix = base.rstrip('.') + '.'
+    _rows = []
+    for _line in text.splitlines():
+        _oid, _sep, _rest = _line.partition(' = ')
+        if not _sep:
+            continue
+
+        if _oid.startswith(_prefix):
+            _index = _oid[len(_prefix):]
+        elif _oid == base:
+            _index = ''
+        else:
+            # label printed differently from base, the numeric tail after the last name is the index
+            _index = _oid.rpartition('::')[-1].partition('.')[-1]
+        try:
+            _index = tuple(map(int, _index.split('.'))) if _index else ()
+        except ValueError:
+            continue
+
+        if _rest in _TEXT_EXCEPTION_:
+            _rows.append(Row(_index, _TEXT_EXCEPTION_[_rest], None))
+            continue
+        _type, _sep, _value = _rest.partition(': ')
+        if not _sep:
+            _rows.append(Row(_index, _type or 'NULL', None))
+            continue
+        _rows.append(Row(_index, _type, _text_value(_type, _value)))
+    return _rows
+
+
+def _text_value(type_name, text):
+    if type_name == 'STRING':
+        return text[1:-1].replace('\\"', '"') if text.startswith('"') and text.endswith('"') else text
+    if type_name in ('Hex-STRING', 'Opaque'):
+        try:
+            return bytes.fromhex(text)
+        except ValueError:
+            return text
+    if type_name in _INTEGER_TYPES_ or type_name == 'Timeticks':
+        _match = _NUMBER_.search(text.rpartition('(')[-1] if type_name == 'INTEGER' and '(' in text else text)
+        return int(_match.group()) if _match else text
+    if type_name == 'OID':
+        return text.lstrip('.')
+    return text
@@ -22,6 +22,10 @@ import tarfile
 import random
 import socket
 import sys
+import time
+import uuid
+import codecs
+import selectors
 import paramiko
 import subprocess
 import platform
@@ -35,8 +39,10 @@ os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
 _OS_ = platform.system().lower()
 
 sys.path.insert(0, _ROOT_)
-from console import ColorLogger
-from console import log_cleaner
+from console import get_logger
+from console import log_enabled
+from console import prober
+from console.sshpool import ssh_pool
 
 
 class SshConsole(paramiko.SSHClient):
@@ -53,25 +59,21 @@ class SshConsole(paramiko.SSHClient):
         self.logfile = logfile if logfile is not None else _LOG_FILE_
         self.home = os.environ['HOME'] if _OS_ == 'linux' else None
 
-    def colorlog(self, msg=None, level=None):
-        msg = '' if msg is None else msg
+    def colorlog(self, msg=None, level=None, *args):
         level = 'debug' if level is None else level
+        if not log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
         # name = self.class_name + ' {:<15s}'.format(self.logger_suffix)
         name = f'{self.logger_prefix:<4s} {self.logger_suffix:<14s}'
-        colorlogger = ColorLogger(name, self.logfile, display=self.display)
-        log_cleaner(self.logfile, 100)
-        colorlogger.colorlog(msg, level)
+        colorlogger = get_logger(name, self.logfile, display=self.display, max_size=100)
+        colorlogger.colorlog(msg, level, *args)
 
     def is_port_open(self, hostname=None, port=None):
         hostname = hostname if hostname is not None else self.hostname
         port = port if port is not None else 22
 
-        _output = subprocess.getstatusoutput(f'nc -v -z -w1 {hostname} {port}')
-        _return = _output[0]
-        for _line in _output[1].split('\n'):
-            self.colorlog(_line, 'debug')
-        return True if _return == 0 else False
-        # return True if _output.endswith('(ssh) open') else False
+        return prober.is_port_open(hostname, port, logfile=self.logfile, display=self.display)
 
     def ssh_connect(self, hostname=None, port=22, username=None, password=None,
                     pkey=None, key_filename=None, timeout=10,
@@ -79,34 +81,40 @@ class SshConsole(paramiko.SSHClient):
                     gss_auth=False, gss_kex=False, gss_deleg_creds=True, gss_host=None,
                     banner_timeout=None, auth_timeout=5,
                     gss_trust_dns=True, passphrase=None, disabled_algorithms=None):
-        self.load_system_host_keys()
-        self.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.colorlog(f'Attempting connect to server {hostname} with port {port}.', 'debug')
 
         hostname = hostname if hostname is not None else self.hostname
         password = str(password) if password is not None else ''
 
+        # a console connecting again gives its transport back first, else its pool users never drop to 0.
+        # released just now, the pool hands out the same transport again if it is alive
+        if self._transport is not None:
+            ssh_pool.release(self._transport)
+            self._transport = None
+            self.connected = False
+
         try:
-            self.connect(hostname=hostname,
-                         port=port,
-                         username=username,
-                         password=password,
-                         pkey=pkey,
-                         key_filename=key_filename,
-                         timeout=timeout,
-                         allow_agent=allow_agent,
-                         look_for_keys=look_for_keys,
-                         compress=compress,
-                         sock=sock,
-                         gss_auth=gss_auth,
-                         gss_kex=gss_kex,
-                         gss_deleg_creds=gss_deleg_creds,
-                         gss_host=gss_host,
-                         banner_timeout=banner_timeout,
-                         auth_timeout=auth_timeout,
-                         gss_trust_dns=gss_trust_dns,
-                         passphrase=passphrase,
-                         disabled_algorithms=disabled_algorithms)
+            # transport is shared with other consoles logged in to the same host as the same user
+            self._transport = ssh_pool.acquire(hostname=hostname,
+                                               port=port,
+                                               username=username,
+                                               password=password,
+                                               pkey=pkey,
+                                               key_filename=key_filename,
+                                               timeout=timeout,
+                                               allow_agent=allow_agent,
+                                               look_for_keys=look_for_keys,
+                                               compress=compress,
+                                               sock=sock,
+                                               gss_auth=gss_auth,
+                                               gss_kex=gss_kex,
+                                               gss_deleg_creds=gss_deleg_creds,
+                                               gss_host=gss_host,
+                                               banner_timeout=banner_timeout,
+                                               auth_timeout=auth_timeout,
+                                               gss_trust_dns=gss_trust_dns,
+                                               passphrase=passphrase,
+                                               disabled_algorithms=disabled_algorithms)
             self.colorlog('Connection established!', 'debug')
             self.connected = True
             return True
@@ -123,50 +131,186 @@ class SshConsole(paramiko.SSHClient):
             self.colorlog(e, 'warn')
         return False
 
+    def close(self):
+        """
+        give the transport back to the pool instead of closing it
+        """
+        if self._transport is not None:
+            ssh_pool.release(self._transport)
+            self._transport = None
+        self.connected = False
+
     def getoutput(self, command, timeout=None) -> list:
         """
         return output list after executed.
         """
-        _output = []
-        self.colorlog(f'Send command [{command}] to remote host.', 'debug')
-
-        if not self.connected:
-            self.colorlog(f'[{self.hostname}] not connected.', 'critical')
-            return _output
-
-        if command.endswith('&') or command.startswith('setcontext'):  # todo setcontext always failed
+        if self.connected and (command.endswith('&') or command.startswith('setcontext')):  # todo setcontext always failed
             self.colorlog('Command ends with [&], this is a backend command, no output will be return.', 'info')
             self.colorlog(f'Execute command [{command}] via channel.', 'info')
             _channel = self.get_transport().open_session()
             _channel.exec_command(command)
-            return _output
+            return []
 
-        try:
-            stdin, stdout, stderr = self.exec_command(command, timeout=timeout)
+        return list(self.iter_output(command, timeout=timeout))
+
+    def iter_output(self, command, timeout=None):
+        """
+        yield output lines as they arrive from the channel, the same lines getoutput returns,
+        parsing goes along with the transfer and the whole output is never held.
+        """
+        self.colorlog(f'Send command [{command}] to remote host.', 'debug')
+        if not self.connected:
+            self.colorlog(f'[{self.hostname}] not connected.', 'critical')
+            return
 
-            _output, _error = stdout.readlines(), stderr.readlines()
-            _output = [_line.strip('\n') for _line in _output]
-            _error = [_line.strip('\n') for _line in _error]
+        _channel = None
+        try:
+            _channel = self.get_transport().open_session()
+            _channel.settimeout(timeout)
+            _channel.exec_command(command)
 
-            _error = ''.join(_error).strip('\n')
+            _decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            _rest = ''
+            while True:
+                _data = _channel.recv(32768)
+                if not _data:
+                    break
+                *_lines, _rest = (_rest + _decoder.decode(_data)).split('\n')
+                yield from _lines
+            _rest += _decoder.decode(b'', final=True)
+            if _rest:
+                yield _rest
+
+            # stderr is complete once stdout reached EOF
+            _error = bytearray()
+            while _channel.recv_stderr_ready():
+                _error += _channel.recv_stderr(32768)
+            _error = '\n'.join(self._split_output(_error)).strip('\n')
             if _error:
                 self.colorlog(_error, 'error')
 
-            return _output  # todo verify type of 'stdout'
-
         except AttributeError as _e:
             self.colorlog(_e, 'error')
         except paramiko.ssh_exception.SSHException as _e:
             self.colorlog(_e, 'critical')
         except EOFError as _e:
             self.colorlog(_e, 'critical')
-        except ValueError as _e:
-            self.colorlog(_e, 'error')
-        return _output
+        except socket.timeout as _e:
+            self.colorlog(f'Command [{command}] timed out: {_e}', 'critical')
+        finally:
+            if _channel is not None:
+                _channel.close()
+
+    @staticmethod
+    def _split_output(data):
+        """
+        same lines as 'readlines' of a channel file with newline stripped
+        """
+        _lines = data.decode('utf-8', errors='replace').split('\n')
+        if _lines[-1] == '':
+            _lines.pop()
+        return _lines
+
+    def run_many(self, commands, max_parallel=4, timeout=None) -> dict:
+        """
+        execute commands on concurrent exec channels of the one transport,
+        at most max_parallel channels are open at a time.
+        :param timeout: seconds for all commands, outputs unfinished by then stay empty
+        :return: {command: output list as getoutput returns}
+        """
+        _outputs = {_command: [] for _command in commands}
+        if not self.connected:
+            self.colorlog(f'[{self.hostname}] not connected.', 'critical')
+            return _outputs
+
+        _pending = list(_outputs)
+        # {channel: [command, stdout, stderr]}
+        _running = {}
+        _selector = selectors.DefaultSelector()
+        _deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            while _pending or _running:
+                while _pending and len(_running) < max(max_parallel, 1):
+                    _command = _pending.pop(0)
+                    self.colorlog(f'Send command [{_command}] to remote host.', 'debug')
+                    try:
+                        _channel = self.get_transport().open_session()
+                        _channel.exec_command(_command)
+                    except (AttributeError, EOFError, paramiko.ssh_exception.SSHException) as _e:
+                        self.colorlog(f'Execute command [{_command}] failed: {_e}', 'critical')
+                        continue
+                    _running[_channel] = [_command, bytearray(), bytearray()]
+                    # channel file descriptor is readable when stdout has data or channel reached EOF
+                    _selector.register(_channel, selectors.EVENT_READ)
+                if not _running:
+                    break
+
+                _remain = _deadline - time.monotonic() if _deadline is not None else None
+                if _remain is not None and _remain <= 0:
+                    self.colorlog(f'Commands {[_r[0] for _r in _running.values()]} timed out after {timeout}s.',
+                                  'error')
+                    break
+
+                for _selected, _mask in _selector.select(_remain):
+                    _channel = _selected.fileobj
+                    _command, _stdout, _stderr = _running[_channel]
+                    while _channel.recv_ready():
+                        _stdout += _channel.recv(32768)
+                    while _channel.recv_stderr_ready():
+                        _stderr += _channel.recv_stderr(32768)
+                    if not _channel.eof_received or _channel.recv_ready():
+                        continue
+
+                    _selector.unregister(_channel)
+                    _channel.close()
+                    del _running[_channel]
+                    _outputs[_command] = self._split_output(_stdout)
+                    _error = '\n'.join(self._split_output(_stderr)).strip('\n')
+                    if _error:
+                        self.colorlog(_error, 'error')
+        finally:
+            for _channel in _running:
+                _channel.close()
+            _selector.close()
+        return _outputs
+
+    @staticmethod
+    def split_batch_output(lines, sentinel, count):
+        """
+        split output of a batch script back to commands by the sentinel lines 'SENTINEL INDEX STATUS'
+        :return: [(exit code, output list)], exit code is None for commands the script did not finish
+        """
+        _results = [(None, []) for _i in range(count)]
+        _index = 0
+        _output = []
+        for _line in lines:
+            _pos = _line.find(sentinel)
+            try:
+                _done, _status = map(int, _line[_pos + len(sentinel):].split()) if _pos >= 0 else (None, None)
+                _results[_done] = (_status, _output + [_line[:_pos]] if _pos > 0 else _output)
+            except (ValueError, TypeError, IndexError):
+                _output.append(_line)
+                continue
+            # output without trailing newline shares the line with the sentinel
+            _index = _done + 1
+            _output = []
+        if _output and _index < count:
+            _results[_index] = (None, _output)
+        return _results
+
+    def run_batch(self, commands, timeout=None) -> list:
+        """
+        execute commands as one remote script on a single exec channel, every command
+        followed by a sentinel line carrying its exit code.
+        :return: [(exit code, output list)] in order of commands
+        """
+        commands = list(commands)
+        _sentinel = f'__PMC_{uuid.uuid4().hex}__'
+        _script = '\n'.join(f'{_command}\necho "{_sentinel} {_i} $?"' for _i, _command in enumerate(commands))
+        return self.split_batch_output(self.getoutput(_script, timeout=timeout), _sentinel, len(commands))
 
     def getstatusoutput(self, command, timeout=None):
-        _output = self.getoutput(command)
-        _return = self.getoutput('echo $?')[0]
+        _return, _output = self.run_batch([command], timeout=timeout)[0]
         _output.insert(0, _return)
         return _output
 
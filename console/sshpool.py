@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 19:20
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: sshpool.py
+# Tools: PyCharm
+
+"""
+---SSH transports shared by consoles talking to the same host with the same credentials---
+
+Key exchange and authentication are paid once, every command opens its own
+channel on the shared transport. Idle transports are closed after max_idle seconds.
+"""
+import time
+import atexit
+import hashlib
+import threading
+import paramiko
+
+
+class _PooledTransport(object):
+    def __init__(self, client):
+        # client is kept to close the transport with it
+        self.client = client
+        self.transport = client.get_transport()
+        self.users = 0
+        self.last_used = time.monotonic()
+
+    def is_alive(self):
+        return self.transport is not None and self.transport.is_active() and self.transport.is_authenticated()
+
+
+class SshPool(object):
+    def __init__(self, keepalive=30, max_idle=300):
+        """
+        Args:
+            keepalive: seconds between keepalive packets on every pooled transport
+            max_idle: seconds a transport without users stays open
+        """
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.pooled = {}
+        # one lock per key, so two consoles of the same host do not log in twice at once
+        self._connecting = {}
+
+    @staticmethod
+    def pool_key(hostname, port, username, password=None, key_filename=None, pkey=None):
+        _secret = hashlib.sha256(f'{password}|{key_filename}|{pkey.get_base64() if pkey else None}'.encode())
+        return hostname, int(port), username, _secret.hexdigest()
+
+    def acquire(self, hostname, port=22, username=None, password=None, **connect_kwargs):
+        """
+        :param connect_kwargs: keywords of paramiko.SSHClient.connect
+        :return: authenticated paramiko.Transport, raise paramiko or socket errors if login failed
+        """
+        self.evict_idle()
+        _key = self.pool_key(hostname, port, username, password,
+                             connect_kwargs.get('key_filename'), connect_kwargs.get('pkey'))
+
+        with self.lock:
+            _connecting = self._connecting.setdefault(_key, threading.Lock())
+
+        with _connecting:
+            with self.lock:
+                _pooled = self.pooled.get(_key)
+                if _pooled is not None and _pooled.is_alive():
+                    _pooled.users += 1
+                    _pooled.last_used = time.monotonic()
+                    return _pooled.transport
+
+            _client = paramiko.SSHClient()
+            _client.load_system_host_keys()
+            _client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            _client.connect(hostname=hostname, port=port, username=username, password=password, **connect_kwargs)
+            _client.get_transport().set_keepalive(self.keepalive)
+
+            _pooled = _PooledTransport(_client)
+            _pooled.users = 1
+            with self.lock:
+                _stale = self.pooled.get(_key)
+                self.pooled[_key] = _pooled
+            if _stale is not None:
+                _stale.client.close()
+            return _pooled.transport
+
+    def release(self, transport):
+        with self.lock:
+            for _pooled in self.pooled.values():
+                if _pooled.transport is transport:
+                    _pooled.users = max(_pooled.users - 1, 0)
+                    _pooled.last_used = time.monotonic()
+                    return
+
+    def evict_idle(self):
+        _now = time.monotonic()
+        with self.lock:
+            _evicted = [_key for _key, _pooled in self.pooled.items()
+                        if not _pooled.is_alive() or (_pooled.users == 0 and _now - _pooled.last_used > self.max_idle)]
+            _evicted = [self.pooled.pop(_key) for _key in _evicted]
+        for _pooled in _evicted:
+            _pooled.client.close()
+        return len(_evicted)
+
+    def close_all(self):
+        with self.lock:
+            _pooled_all, self.pooled = list(self.pooled.values()), {}
+        for _pooled in _pooled_all:
+            _pooled.client.close()
+
+
+# shared by every SshConsole of this process
+ssh_pool = SshPool()
+atexit.register(ssh_pool.close_all)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020-2022 by ZHANG ZHIJIE.
+# All rights reserved.
+
+# Created Time: 10/18/26 21:05
+# Author: ZHANG ZHIJIE
+# Email: norvyn@norvyn.com
+# Git: @n0rvyn
+# File Name: workerpool.py
+# Tools: PyCharm
+
+"""
+---Run per-device jobs in a bounded thread pool---
+
+At most 'workers' devices are worked on at once, and at most 'limits[group]' of
+one group (vendor). Jobs start by priority, a device running longer than its deadline
+or past the deadline of the whole run is given up, and results come back in the
+order the jobs were given. A device given up keeps its slot until its thread ends.
+"""
+import os
+import sys
+import time
+import queue
+import threading
+import collections
+try:
+    import busybox
+except ModuleNotFoundError:
+    from . import busybox
+
+_HOME_ = os.path.abspath(os.path.dirname(__file__))
+_ROOT_ = os.path.abspath(os.path.join(_HOME_, '..'))
+_LOG_PATH_ = os.path.join(_ROOT_, 'log')
+_LOGFILE_ = os.path.join(_LOG_PATH_, 'console.log')
+os.mkdir(_LOG_PATH_) if not os.path.exists(_LOG_PATH_) else ''
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def print_progress(done, total, key, error):
+    """
+    one line per finished device to stderr, the report on stdout stays clean
+    """
+    _state = 'done' if error is None else f'{type(error).__name__} {error}'.strip()
+    print(f'[{done:>{len(str(total))}d}/{total}] {key} {_state}', file=sys.stderr, flush=True)
+
+
+class WorkerPool(object):
+    def __init__(self, workers=8, deadline=None, progress=None, logfile=None, display=False,
+                 limits=None, total_deadline=None):
+        """
+        Args:
+            workers: devices worked on at once
+            deadline: seconds one device may run from its start, None for no limit
+            progress: callable(done, total, key, error) called as every device finishes
+            limits: {group: devices of the group worked on at once}, at least 1
+            total_deadline: seconds for the whole run, devices not finished by then are given up
+        """
+        self.workers = max(int(workers), 1)
+        self.deadline = deadline
+        self.progress = progress
+        self._log_file = _LOGFILE_ if logfile is None else logfile
+        self.display = display
+        # a limit of 0 never starts the jobs of its group
+        self.limits = {_group: max(int(_limit), 1) for _group, _limit in (limits or {}).items()}
+        self.total_deadline = total_deadline
+
+        self._lock = threading.Lock()
+        # {group: threads of devices given up and still running}, kept between runs
+        self._lingering = collections.Counter()
+
+    def colorlog(self, msg=None, level=None, *args):
+        level = 'debug' if level is None else level
+        if not busybox.log_enabled.get(level, True):
+            return
+        msg = '' if msg is None else msg
+        name = f'{"POOL":<4s} {"workers":<14s}'
+        colorlogger = busybox.get_logger(name, self._log_file, display=self.display, max_size=50)
+        colorlogger.colorlog(msg, level, *args)
+
+    def run(self, jobs):
+        """
+        :param jobs: [(key, function, args[, group[, priority]])], key names the device in progress and log,
+                     lower priority starts first
+        :return: [(value, error)] in order of jobs, error is the exception raised or JobTimeout
+        """
+        jobs = [tuple(_job) + (None, 0)[len(_job) - 3:] for _job in jobs]
+        _results = [(None, None)] * len(jobs)
+        _waiting = sorted(range(len(jobs)), key=lambda _i: (jobs[_i][4], _i))
+        # {job index: start time}, a job given up leaves it so its slot goes to the next device
+        _running = {}
+        _group_running = collections.Counter()
+        # {job index: {'given_up': bool, 'ended': bool}} shared with the thread of the job
+        _tickets = {}
+        _finished = queue.Queue()
+        _done_count = 0
+        _end = time.monotonic() + self.total_deadline if self.total_deadline is not None else None
+
+        def _run(_i, _function, _args, _ticket):
+            try:
+                _value, _error = _function(*_args), None
+            except Exception as _e:
+                _value, _error = None, _e
+            # the slot of a device given up is free only now
+            with self._lock:
+                _ticket['ended'] = True
+                if _ticket['given_up']:
+                    self._lingering[jobs[_i][3]] -= 1
+            _finished.put((_i, _value, _error))
+
+        def _record(_i, _value, _error):
+            nonlocal _done_count
+            _key = jobs[_i][0]
+            _results[_i] = (_value, _error)
+            _done_count += 1
+            if _error is not None:
+                self.colorlog(f'[{_key}] {type(_error).__name__}: {_error}', 'error')
+            if self.progress is not None:
+                self.progress(_done_count, len(jobs), _key, _error)
+
+        def _leave(_i):
+            del _running[_i]
+            _group_running[jobs[_i][3]] -= 1
+
+        def _give_up(_i, _error):
+            with self._lock:
+                _ticket = _tickets[_i]
+                if not _ticket['ended']:
+                    _ticket['given_up'] = True
+                    self._lingering[jobs[_i][3]] += 1
+            _leave(_i)
+            _record(_i, None, _error)
+
+        self.colorlog(f'{len(jobs)} jobs, workers [{self.workers}] limits {self.limits} '
+                      f'deadline [{self.deadline}] total deadline [{self.total_deadline}]', 'info')
+        while _waiting or _running:
+            with self._lock:
+                _lingering = collections.Counter(self._lingering)
+            for _i in list(_waiting):
+                if len(_running) + sum(_lingering.values()) >= self.workers:
+                    break
+                _key, _function, _args, _group, _priority = jobs[_i]
+                if _group_running[_group] + _lingering[_group] >= self.limits.get(_group, self.workers):
+                    continue
+                _waiting.remove(_i)
+                _running[_i] = time.monotonic()
+                _group_running[_group] += 1
+                _tickets[_i] = {'given_up': False, 'ended': False}
+                # threads of devices given up are not joined, they end with their own socket timeouts
+                threading.Thread(target=_run, args=(_i, _function, _args, _tickets[_i]),
+                                 name=f'pool-{_key}', daemon=True).start()
+
+            _ends = [_start + self.deadline for _start in _running.values()] if self.deadline is not None else []
+            _ends += [_end] if _end is not None else []
+            _timeout = max(min(_ends) - time.monotonic(), 0) if _ends else None
+            # only threads given up in an earlier run hold the slots, they report to no queue of this run
+            if _waiting and not _running:
+                _timeout = 1 if _timeout is None else min(_timeout, 1)
+            try:
+                _i, _value, _error = _finished.get(timeout=_timeout)
+                # late result of a device given up already is dropped
+                if _i in _running:
+                    _leave(_i)
+                    _record(_i, _value, _error)
+            except queue.Empty:
+                pass
+
+            _now = time.monotonic()
+            for _i in [_i for _i, _start in _running.items()
+                       if self.deadline is not None and _now - _start >= self.deadline]:
+                _give_up(_i, JobTimeout(f'not finished in {self.deadline}s'))
+
+            if _end is not None and _now >= _end:
+                for _i in list(_running):
+                    _give_up(_i, JobTimeout(f'run not finished in {self.total_deadline}s'))
+                for _i in _waiting:
+                    _record(_i, None, JobTimeout(f'not started in {self.total_deadline}s'))
+                _waiting = []
+        return _results
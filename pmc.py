@@ -14,46 +14,105 @@
 ---Preventive Maintenance Console---
 """
 from console import ConfigReader
+from console import SnmpPoller
+from console import WorkerPool
+from console import ResultStore
+from console import Snapshot
+from console.workerpool import print_progress
+from console.snapshot import DAEMON_SNAPSHOT_FILE
 from agent import huaweistorage
 from agent import xiv
 from agent import switch
+from agent import daemon
 import sys
 
-reader = ConfigReader(production=False)   # set to True for reading configuration from './config/production'
+reader = ConfigReader(production=False,    # set to True for reading configuration from './config/production'
+                      fast=True)           # set to False for probing every configured address of devices
+# states & metrics of every run, 'data/pm_results.db'
+store = ResultStore()
 
+# vendor: (priority, devices of vendor collected at once), slow ssh collection of storages starts first
+schedule = {'hw': (0, 8),
+            'sw': (1, 16),
+            'xiv': (2, 8)}
 
-def hw_str_pm():
+
+def hw_str_pm(snapshot=None):
     storages = reader.read_hw_str()
-    huaweistorage.pm_all_hw_storage(storages)
+    huaweistorage.pm_all_hw_storage(storages, store=store, snapshot=snapshot)
 
 
-def xiv_pm():
+def xiv_pm(snapshot=None):
     xiv_list = reader.read_xiv()
-    xiv.pm_xiv_all(xiv_list)
+    xiv.pm_xiv_all(xiv_list, store=store, snapshot=snapshot)
 
 
-def switch_pm():
+def switch_pm(snapshot=None):
     switch_list = reader.read_switch()
-    switch.pm_all_switch(switch_list)
+    switch.pm_all_switch(switch_list, store=store, snapshot=snapshot)
+
+
+def all_pm(workers=32, deadline=600, total_deadline=1800, max_in_flight=64, snapshot=None):
+    """
+    devices of all vendors in one job queue, a vendor does not wait for the others to finish
+    Args:
+        workers: devices of all vendors collected at once
+        deadline: seconds one device may take
+        total_deadline: seconds for the whole run, devices not finished by then are reported as unfinished
+        snapshot: console.Snapshot, only checks changed since the previous run are printed
+    """
+    # reports stay grouped by vendor, in the order 'all' always printed them
+    plans = {'hw': huaweistorage.plan_hw_storage(reader.read_hw_str(), store=store, snapshot=snapshot),
+             'xiv': xiv.plan_xiv(reader.read_xiv(), store=store, snapshot=snapshot),
+             'sw': switch.plan_switch(reader.read_switch(), store=store, snapshot=snapshot)}
+
+    SnmpPoller(max_in_flight=max_in_flight).poll(
+        [_consl for _snmp_consoles, _jobs, _render in plans.values() for _consl in _snmp_consoles])
+
+    jobs = [(f'{_vendor} {_key}', _function, _args, _vendor, schedule[_vendor][0])
+            for _vendor, (_snmp_consoles, _jobs, _render) in plans.items() for _key, _function, _args in _jobs]
+    pool = WorkerPool(workers=workers, deadline=deadline, progress=print_progress, total_deadline=total_deadline,
+                      limits={_vendor: _workers for _vendor, (_priority, _workers) in schedule.items()})
+    results = pool.run(jobs)
+
+    _start = 0
+    for _snmp_consoles, _jobs, _render in plans.values():
+        _render(results[_start:_start + len(_jobs)])
+        _start += len(_jobs)
+    store.commit()
+    snapshot.save() if snapshot else ''
+
+
+def daemon_pm(snapshot=None):
+    """
+    keep running, every check on its own interval of 'daemon.CHECK_INTERVALS'
+    """
+    devices = daemon.hw_storage_devices(reader.read_hw_str()) \
+        + daemon.xiv_devices(reader.read_xiv()) \
+        + daemon.switch_devices(reader.read_switch())
+    daemon.PmDaemon(devices, store=store, snapshot=snapshot).serve_forever()
 
 
 if __name__ == '__main__':
     try:
         dev = sys.argv[1]
+        # 'delta' prints only checks changed since the previous run, 'data/pm_snapshot.json',
+        # the daemon keeps its own 'data/pm_daemon_snapshot.json'
+        delta = Snapshot(DAEMON_SNAPSHOT_FILE if dev == 'daemon' else None) if 'delta' in sys.argv[2:] else None
 
         if dev == 'xiv':
-            xiv_pm()
+            xiv_pm(delta)
         if dev == 'sw':
-            switch_pm()
+            switch_pm(delta)
         if dev == 'hw':
-            hw_str_pm()
+            hw_str_pm(delta)
         if dev == 'all':
-            hw_str_pm()
-            xiv_pm()
-            switch_pm()
+            all_pm(snapshot=delta)
+        if dev == 'daemon':
+            daemon_pm(delta)
 
     except IndexError:
-        print('Supported args: xiv | sw | hw | all')
+        print('Supported args: xiv | sw | hw | all | daemon [delta]')
 
 
 